@@ -44,6 +44,870 @@ def vermodCheck(filePath, versions, testNum):
 
 
 
+## ============================ F U N C T I O N ============================ #
+## void expect(boolean, integer, string)
+##
+## TITLE:       Expectation Checker
+## DESCRIPTION: Passes or fails a test on the strength of a single condition.
+##
+## PARAMETER: Whether the test passed.
+## PARAMETER: The number of the test.
+## PARAMETER: What was expected, for the failure message.
+def expect(condition, testNum, what):
+    import colour
+    if not condition:
+        raise Exception(colour.red('FAILURE') + ', Test #' + str(testNum) +
+            ': ' + what)
+    print(colour.green('SUCCESS') + ', Test #' + str(testNum))
+
+
+
+## ============================ F U N C T I O N ============================ #
+## void jobsCheck(string)
+##
+## TITLE:       Job Pool Checker
+## DESCRIPTION: Checks that a JobPool runs jobs after what they depend on,
+##              launches nothing after a failure, reports in the order jobs
+##              were given, and refuses circular dependencies; that
+##              projects are put after the siblings they depend on; that a
+##              command's exit status, output and peak memory use are told;
+##              that a trace of the jobs is saved in the Chrome trace event
+##              format; and that a plan of the jobs is saved along with a
+##              compilation database listing every real source.
+##
+## PARAMETER: A scratch directory to work in.
+def jobsCheck(dir):
+    import buildtool, buildtrace, jobs, json, os, sys, threading, time
+    log = []
+    lock = threading.Lock()
+    def step(name, delay=0.0, status=0):
+        def func():
+            with lock:
+                log.append(name + ' start')
+            time.sleep(delay)
+            with lock:
+                log.append(name + ' end')
+            return (status, name + '\n')
+        return func
+    pool = jobs.JobPool(4)
+    first = jobs.Job('first', 'c', step('first', 0.05))
+    second = jobs.Job('second', 'c', step('second'), deps=[first])
+    third = jobs.Job('third', 'c', step('third'), deps=[second])
+    pool.run([third, second, first])
+    pool.close()
+    expect(log == ['first start', 'first end', 'second start', 'second end',
+        'third start', 'third end'], 8, 'Jobs ran before what they depend ' +
+        'on: ' + str(log))
+    log.clear()
+    pool = jobs.JobPool(1)
+    failing = jobs.Job('failing', 'c', step('failing', status=1))
+    later = [jobs.Job('later' + str(i), 'c', step('later' + str(i)))
+        for i in range(3)]
+    failures = pool.run([failing] + later)
+    pool.close()
+    expect(failures == [failing] and log == ['failing start', 'failing end']
+        and all([job.skipped for job in later]), 9, 'Jobs were launched ' +
+        'after a failure: ' + str(log))
+    reported = []
+    pool = jobs.JobPool(4)
+    given = [jobs.Job('job' + str(i), 'c', step('job' + str(i),
+        0.02 * (4 - i))) for i in range(4)]
+    pool.run(given, lambda job: reported.append(job.output))
+    pool.close()
+    expect(reported == ['job0\n', 'job1\n', 'job2\n', 'job3\n'], 10,
+        'Output was not reported in the order given: ' + str(reported))
+    pool = jobs.JobPool(2)
+    left = jobs.Job('left', 'c', step('left'))
+    right = jobs.Job('right', 'c', step('right'), deps=[left])
+    left.deps = [right]
+    try:
+        pool.run([left, right])
+        circular = None
+    except Exception as ex:
+        circular = str(ex)
+    pool.close()
+    expect(circular != None and 'Circular dependency' in circular, 11,
+        'A circular dependency was not reported')
+    projects = {}
+    for key, depends in [('app', 'Lib, tool'), ('lib', ''),
+    ('tool', 'LIB')]:
+        projects[key] = {'projIni': {'': {'name': key.title(),
+            'depends': depends}}}
+    deps = buildtool.getProjectDeps(projects)
+    order = buildtool.sortProjects(['app', 'lib', 'tool'], deps)
+    projects['lib']['projIni']['']['depends'] = 'app'
+    try:
+        buildtool.sortProjects(['app', 'lib', 'tool'],
+            buildtool.getProjectDeps(projects))
+        circular = None
+    except Exception as ex:
+        circular = str(ex)
+    expect(deps['app'] == ['lib', 'tool'] and order == ['lib', 'tool', 'app']
+        and circular != None and 'Circular project' in circular, 48,
+        'Projects were not put after the siblings they depend on')
+    jobs.resetPeakRss()
+    status, output = jobs.spawnCommand([sys.executable, '-c', 'import ' +
+        'sys; data = bytearray(64 << 20); print(len(data)); sys.exit(3)'])
+    peak = jobs.getPeakRss()
+    expect(status == 3 and output.strip() == str(64 << 20).encode()
+        and peak != None and peak >= 64 << 20, 51, 'A command\u2019s exit ' +
+        'status, output or peak memory use was misreported')
+    trace = buildtrace.BuildTrace()
+    pool = jobs.JobPool(2, trace)
+    traced = jobs.Job('traced', 'c', step('traced'))
+    traced.project = 'proj'
+    pool.run([traced])
+    pool.close()
+    path = os.path.join(dir, 'trace.json')
+    trace.save(path)
+    f = open(path, 'r')
+    data = json.load(f)
+    f.close()
+    events = data['traceEvents']
+    expect(data['displayTimeUnit'] == 'ms' and len(events) == 2
+        and events[0]['name'] == 'traced' and events[0]['cat'] == 'c'
+        and events[0]['ph'] == 'X' and events[0]['dur'] >= 0
+        and events[0]['args'] == {'status': 0, 'project': 'proj'}
+        and events[1]['ph'] == 'M' and events[1]['tid'] == events[0]['tid']
+        and events[1]['args'] == {'name': 'worker 1'}, 54, 'A trace was ' +
+        'not saved in the Chrome trace event format: ' + str(events))
+    alone = os.path.join(dir, 'alone.c')
+    batched = os.path.join(dir, 'batched.c')
+    unit = os.path.join(dir, 'unity-c-0.c')
+    commands = buildtool.getSourceCommands({'sources': {'c': [alone,
+        batched]}}, 'c', ['gcc', '-c'], [alone, unit], dir)
+    compiled = jobs.Job(alone, 'c', None, ['gcc', '-c', alone])
+    compiled.target = os.path.join(dir, 'alone.c.o')
+    linked = jobs.Job('app', 'link', None, ['g++'], [compiled])
+    planDir = os.path.join(dir, 'plan')
+    buildtool.savePlan([compiled, linked], commands, planDir, 'debug64')
+    saved = []
+    for name in [buildtool.COMPILE_DB_FILE, buildtool.PLAN_FILE]:
+        f = open(os.path.join(planDir, name), 'r')
+        saved += [json.load(f)]
+        f.close()
+    database, plan = saved
+    expect([entry['file'] for entry in database] == [alone, batched]
+        and database[0]['output'] == compiled.target
+        and database[0]['arguments'][-3:] == ['-o', compiled.target, alone]
+        and 'output' not in database[1] and plan['version'] == 1
+        and plan['buildType'] == 'debug64'
+        and [job['deps'] for job in plan['jobs']] == [[], [0]]
+        and plan['jobs'][0]['output'] == compiled.target, 57, 'A plan or ' +
+        'its compilation database was saved wrongly')
+
+
+
+## ============================ F U N C T I O N ============================ #
+## void incrementalCheck(string)
+##
+## TITLE:       Incremental Build Checker
+## DESCRIPTION: Checks the parsing of dependency files, and that an object is
+##              only out of date when its inputs or command line change.
+##              Checks that a link is skipped until an object or sibling
+##              library changes, that what was found out about a tool is
+##              forgotten once PATH or the tool itself changes, that a source
+##              index lists a directory again only once its modification time
+##              changes, that adding a source changes only its own unity
+##              batch, while a source named by UnityExclude= is left out, and
+##              that a unit is rebuilt when its precompiled header is newer
+##              or about to be rebuilt.
+##
+## PARAMETER: A scratch directory to work in.
+def incrementalCheck(dir):
+    import buildtool, glob, incremental, jobs, os, srcindex, sys, time, \
+        toolchain
+    depPath = os.path.join(dir, 'unit.d')
+    f = open(depPath, 'w')
+    f.write('unit.o: src/unit.c inc/with\\ space.h \\\n' +
+        '  inc/next.h\ninc/with\\ space.h:\n\ninc/next.h:\n')
+    f.close()
+    expect(incremental.parseMakeDeps(depPath) == ['src/unit.c',
+        'inc/with space.h', 'inc/next.h'], 12, 'Escaped spaces or ' +
+        'continued lines were misread')
+    dmdPath = os.path.join(dir, 'unit.deps')
+    f = open(dmdPath, 'w')
+    f.write('app (src/app.d) : private : object (/usr/include/object.d)\n' +
+        'app (src/app.d) : public : util (src/util.d):b (src/b.d)\n')
+    f.close()
+    expect(incremental.parseDmdDeps(dmdPath) == ['src/app.d',
+        '/usr/include/object.d', 'src/util.d', 'src/b.d'], 13, 'DMD ' +
+        'dependencies were misread')
+    source = os.path.join(dir, 'unit.c')
+    obj = os.path.join(dir, 'unit.o')
+    f = open(source, 'w')
+    f.write('int main(void) { return 0; }\n')
+    f.close()
+    f = open(depPath, 'w')
+    f.write(obj + ': ' + source + '\n')
+    f.close()
+    f = open(obj, 'w')
+    f.close()
+    old = time.time() - 10
+    os.utime(source, (old, old))
+    state = incremental.BuildState(dir, incremental.MtimeCache())
+    com = ['cc', '-c', source, '-o', obj]
+    state.record(obj, com)
+    state.save()
+    state = incremental.BuildState(dir, incremental.MtimeCache())
+    expect(state.upToDate(obj, source, depPath, com), 14, 'An object ' +
+        'built by the same command was not skipped')
+    expect(not state.upToDate(obj, source, depPath, com + ['-O2']), 15,
+        'An object was skipped though its command changed')
+    os.utime(source, None)
+    os.utime(obj, (old, old))
+    state = incremental.BuildState(dir, incremental.MtimeCache())
+    expect(not state.upToDate(obj, source, depPath, com), 16, 'An object ' +
+        'was skipped though its source is newer')
+    lib = os.path.join(dir, 'libsibling.so')
+    out = os.path.join(dir, 'linked')
+    for path in [lib, out]:
+        f = open(path, 'w')
+        f.close()
+    link = buildtool.LINK
+    buildtool.LINK = [sys.executable, '-c', 'pass']
+    try:
+        job = buildtool.linkJob('linked', ['-o', out], os.path.join(dir,
+            '*.o'), [], out, dir, [lib])
+        linked = [job.func() != None, job.func() != None]
+        f = open(lib, 'w')
+        f.write('rebuilt')
+        f.close()
+        linked += [job.func() != None]
+    finally:
+        buildtool.LINK = link
+    expect(linked == [True, False, True], 49, 'A link was not skipped ' +
+        'while its inputs were unchanged, or not rerun once a sibling ' +
+        'library changed')
+    binDir = os.path.join(dir, 'bin')
+    os.makedirs(binDir)
+    tool = os.path.join(binDir, 'fakecc')
+    f = open(tool, 'w')
+    f.write('#!/bin/sh\n')
+    f.close()
+    os.chmod(tool, 0o755)
+    probes = []
+    def ask():
+        chain = toolchain.Toolchain(os.path.join(dir, 'toolchain.json'))
+        return chain.probe('fakecc-version', lambda: probes.append(None)
+            or len(probes), binary='fakecc')
+    path = os.environ.get('PATH', '')
+    os.environ['PATH'] = binDir + os.pathsep + path
+    try:
+        answers = [ask(), ask()]
+        os.utime(tool, (old, old))
+        answers += [ask()]
+        os.environ['PATH'] = binDir + os.pathsep + dir + os.pathsep + path
+        answers += [ask()]
+    finally:
+        os.environ['PATH'] = path
+    expect(answers == [1, 1, 2, 3], 50, 'A tool was probed again though ' +
+        'nothing changed, or not once it or PATH did: ' + str(answers))
+    srcDir = os.path.join(dir, 'indexed')
+    os.makedirs(srcDir)
+    def scan():
+        index = srcindex.SourceIndex(srcDir, os.path.join(dir, 'index.json'),
+            lambda name: 'c' if name.endswith('.c') else None)
+        ret = [os.path.basename(path) for path in index.scan()['c']]
+        index.save()
+        return ret
+    scanned = []
+    for name in ['a.c', 'b.c']:
+        f = open(os.path.join(srcDir, name), 'w')
+        f.close()
+        os.utime(srcDir, (old, old))
+        scanned += [scan()]
+    os.utime(srcDir, None)
+    scanned += [scan()]
+    expect(scanned == [['a.c'], ['a.c'], ['a.c', 'b.c']], 52, 'A source ' +
+        'index listed an unchanged directory again, or not a changed one: ' +
+        str(scanned))
+    unityDir = os.path.join(dir, 'unity')
+    objDir = os.path.join(dir, 'unityobj')
+    os.makedirs(objDir)
+    project = {'srcPath': unityDir, 'sources': {'c': []}, 'projIni':
+        {'source': {'unity': '4', 'unityexclude': 'skip.c'}}}
+    def batch(names):
+        project['sources']['c'] = sorted([os.path.join(unityDir, name)
+            for name in names])
+        return buildtool.getUnitySources(project, 'c', objDir)
+    names = ['f' + str(i).zfill(2) + '.c' for i in range(24)]
+    before = batch(names + ['skip.c'])
+    after = batch(names + ['f10a.c', 'skip.c'])
+    units = glob.glob(os.path.join(objDir, 'unity-c-*.c'))
+    text = ''
+    for unit in units:
+        f = open(unit, 'r')
+        text += f.read()
+        f.close()
+    expect(len(units) > 1 and sorted(units) == sorted([path
+        for path in after if path.startswith(objDir)])
+        and len(set(before) - set(after)) <= 1
+        and len(set(after) - set(before)) <= 2
+        and os.path.join(unityDir, 'skip.c') in after and 'f10a.c' in text
+        and 'skip.c' not in text, 55, 'Adding a source changed more than ' +
+        'its own unity batch, or an excluded source was batched')
+    source = os.path.join(dir, 'pch.cc')
+    obj = os.path.join(dir, 'pch.o')
+    depPath = os.path.join(dir, 'pch.d')
+    gch = os.path.join(dir, 'common.hh.gch')
+    for path, text in [(source, ''), (depPath, obj + ': ' + source + '\n'),
+    (gch, ''), (obj, '')]:
+        f = open(path, 'w')
+        f.write(text)
+        f.close()
+        os.utime(path, (old, old))
+    os.utime(obj, (old + 5, old + 5))
+    com = ['g++', '-c', source, '-o', obj]
+    state = incremental.BuildState(dir, incremental.MtimeCache())
+    state.record(obj, com)
+    state.save()
+    def plan(after=None):
+        state = incremental.BuildState(dir, incremental.MtimeCache())
+        return len(buildtool.compileJob(source, 'c++', com, obj, depPath,
+            state, after=after, extra=[gch]))
+    planned = [plan(), plan([jobs.Job('common.hh', 'pch', None)])]
+    os.utime(gch, None)
+    planned += [plan()]
+    expect(planned == [0, 1, 1], 56, 'A unit was not rebuilt along with ' +
+        'its precompiled header, or was rebuilt without it: ' + str(planned))
+
+
+
+## ============================ F U N C T I O N ============================ #
+## void objcacheCheck(string)
+##
+## TITLE:       Object Cache Checker
+## DESCRIPTION: Checks that a cache hit marks its entry as recently used even
+##              when the object can't be hard linked out of the cache, and
+##              that a D unit gets the same key with or without a deps file.
+##
+## PARAMETER: A scratch directory to work in.
+def objcacheCheck(dir):
+    import errno, objcache, os, time
+    cache = objcache.ObjectCache(os.path.join(dir, 'objcache'))
+    obj = os.path.join(dir, 'cached.o')
+    f = open(obj, 'wb')
+    f.write(b'object')
+    f.close()
+    key = cache.key(['cc', '-c'], text=b'source')
+    cache.store(key, obj)
+    entry = cache.entryPath(key) + '.o'
+    old = time.time() - 1000
+    os.utime(entry, (old, old))
+    link = objcache.os.link
+    def crossDevice(src, dst):
+        raise OSError(errno.EXDEV, 'Invalid cross-device link')
+    objcache.os.link = crossDevice
+    try:
+        hit = cache.fetch(key, os.path.join(dir, 'restored.o'))
+    finally:
+        objcache.os.link = link
+    expect(hit and os.stat(entry).st_mtime > old + 500, 17, 'A cache ' +
+        'entry copied out on a hit was not marked as recently used')
+    # A D unit is keyed on what it imported, which a clean checkout has
+    # no deps file to say
+    import buildtool
+    source = os.path.join(dir, 'unit.d')
+    module = os.path.join(dir, 'imported.d')
+    depFile = os.path.join(dir, 'unit.deps')
+    for path, text in [(source, 'import imported;\n'),
+    (module, 'module imported;\n'), (depFile, 'unit (' + source +
+    ') : private : imported (' + module + ')\n')]:
+        f = open(path, 'w')
+        f.write(text)
+        f.close()
+    com = ['dmd', source, '-c', '-deps=' + depFile]
+    built = buildtool.cacheKey(cache, 'd', com, obj, depFile, source)
+    cache.storeDeps(buildtool.sourceKey(cache, 'd', com, obj, depFile,
+        source), depFile)
+    os.remove(depFile)
+    expect(built != None and buildtool.cacheKey(cache, 'd', com, obj,
+        depFile, source) == built, 45, 'A D unit without a deps file of ' +
+        'its own was keyed differently')
+
+
+
+## ============================ F U N C T I O N ============================ #
+## void iniCheck(string)
+##
+## TITLE:       INI Parser Checker
+## DESCRIPTION: Checks that comments are skipped, pairs before the first
+##              section land in the section named '', values are kept as
+##              written, a section given again starts afresh, and a repeated
+##              key is refused; and that the streaming readers give the line
+##              number of every token, and of the first bad line, and refuse
+##              a repeated section.
+##
+## PARAMETER: A scratch directory to work in.
+def iniCheck(dir):
+    import ini, os
+    parsed = ini.parseText(['Top=1', '# comment=no', '  ; also=no', '',
+        '[One]', 'Key=a', '[Two]', 'Key=a=b', 'Other= spaced ', '[one]',
+        'Key=c'])
+    expect(parsed[''] == {'top': '1'}, 18, 'Pairs before the first ' +
+        'section were misplaced, or comments were read')
+    expect(parsed['two'] == {'key': 'a=b', 'other': ' spaced '}, 19,
+        'Values were not kept as written')
+    expect(parsed['one'] == {'key': 'c'}, 20, 'A repeated section did ' +
+        'not replace the first')
+    try:
+        ini.parseText(['[One]', 'Key=a', 'key=b'])
+        failed = False
+    except Exception:
+        failed = True
+    expect(failed, 21, 'A repeated key was accepted')
+    path = os.path.join(dir, 'tokens.ini')
+    f = open(path, 'w')
+    f.write('Top=1\n# comment\n\n[One]\nKey=a\n[Two]\nKey=b\n')
+    f.close()
+    expect(list(ini.iterTokens(path)) == [('', 'top', '1', 1),
+        ('one', None, None, 4), ('one', 'key', 'a', 5),
+        ('two', None, None, 6), ('two', 'key', 'b', 7)], 22, 'Tokens or ' +
+        'their line numbers were wrong')
+    for testNum, text in [(23, '[One]\nKey=a\n\nno pair\n'),
+    (24, '[One]\nKey=a\n; comment\nkey=b\n')]:
+        f = open(path, 'w')
+        f.write(text)
+        f.close()
+        try:
+            list(ini.iterTokens(path))
+            error = ''
+        except Exception as ex:
+            error = str(ex)
+        expect(error.startswith(path + ':4: '), testNum, 'A bad line was ' +
+            'not reported with its line number')
+    f = open(path, 'w')
+    f.write('[One]\nKey=a\n[Two]\n[one]\nKey=b\n')
+    f.close()
+    try:
+        list(ini.iter_sections(path))
+        error = None
+    except ValueError as ex:
+        error = str(ex)
+    expect(error != None and error.startswith(path + ':4: '), 44, 'A ' +
+        'repeated section was streamed twice')
+
+
+
+## ============================ F U N C T I O N ============================ #
+## void copydepsCheck(string)
+##
+## TITLE:       CopyDeps Checker
+## DESCRIPTION: Checks that a file unchanged since it was deployed isn't even
+##              hashed, that a changed one is copied again whatever its
+##              modification time, that a failed copy leaves the manifest
+##              entry for its destination alone, and that a mode that doesn't
+##              work here falls back to the next while other errors don't.
+##              Then checks that mirroring removes what is no longer
+##              deployed, but not files it never deployed or that have
+##              changed since, and that several architectures deployed at
+##              once each get their own libraries and the shared assets.
+##
+## PARAMETER: A scratch directory to work in.
+def copydepsCheck(dir):
+    import copydeps, errno, os
+    srcDir = os.path.join(dir, 'copysrc')
+    dstDir = os.path.join(dir, 'copydst')
+    os.makedirs(srcDir)
+    os.makedirs(dstDir)
+    src = os.path.join(srcDir, 'asset.txt')
+    dst = os.path.join(dstDir, 'asset.txt')
+    f = open(src, 'w')
+    f.write('first')
+    f.close()
+    entry = copydeps.copyFile(src, dst)[2]
+    result = copydeps.copyFile(src, dst, 'copy', entry)
+    expect(result[0] == None and result[3] == 0, 25, 'A file unchanged ' +
+        'since it was deployed was copied or hashed')
+    old = os.stat(dst).st_mtime - 100
+    f = open(src, 'w')
+    f.write('other')
+    f.close()
+    os.utime(src, (old, old))
+    result = copydeps.copyFile(src, dst, 'copy', result[2])
+    f = open(dst, 'r')
+    text = f.read()
+    f.close()
+    expect(result[0] != None and text == 'other', 26, 'A changed file ' +
+        'with an older modification time was not copied again')
+    manifest = copydeps.DeployManifest(dstDir)
+    manifest.record(dst, result[2])
+    os.remove(src)
+    os.makedirs(src)
+    ret = copydeps.copyFiles([(src, dst, 'copy', os.stat(src))], 1,
+        manifest)
+    expect(len(ret['errors']) == 1 and manifest.get(dst) == result[2], 27,
+        'A failed copy changed the manifest')
+    src = os.path.join(srcDir, 'linked.txt')
+    f = open(src, 'w')
+    f.write('linked')
+    f.close()
+    def failLink(code):
+        def func(src, dst):
+            raise OSError(code, os.strerror(code))
+        return func
+    link = copydeps.os.link
+    copydeps.os.link = failLink(errno.EXDEV)
+    try:
+        mode = copydeps.copyFile(src, os.path.join(dstDir, 'linked.txt'),
+            'hardlink')[1]
+        copydeps.os.link = failLink(errno.EIO)
+        try:
+            copydeps.copyFile(src, os.path.join(dstDir, 'failed.txt'),
+                'hardlink')
+            failed = None
+        except OSError as ex:
+            failed = ex.errno
+    finally:
+        copydeps.os.link = link
+    f = open(os.path.join(dstDir, 'linked.txt'), 'r')
+    text = f.read()
+    f.close()
+    expect(mode in copydeps.COPY_MODES[1:] and text == 'linked'
+        and failed == errno.EIO
+        and not os.path.exists(os.path.join(dstDir, 'failed.txt')), 58,
+        'A hard link across filesystems did not fall back to another ' +
+        'mode, or another error was not raised')
+    # Deploy three assets, then mirror a deployment of only one of them
+    srcDir = os.path.join(dir, 'mirrorsrc')
+    dstDir = os.path.join(dir, 'mirrordst')
+    assetDir = os.path.join(srcDir, 'assets', 'release')
+    os.makedirs(assetDir)
+    os.makedirs(os.path.join(srcDir, 'lib64', 'release'))
+    for name in ['kept.txt', 'dropped.txt', 'edited.txt']:
+        f = open(os.path.join(assetDir, name), 'w')
+        f.write(name)
+        f.close()
+    f = open(os.path.join(srcDir, 'assets', 'release.ini'), 'w')
+    f.write('[kept.txt]\nCopy=1\n[dropped.txt]\nCopy=1\n' +
+        '[edited.txt]\nCopy=1\n')
+    f.close()
+    args = ['copydeps.py', '--mirror', srcDir, dstDir, '64', 'release']
+    expect(copydeps.main(args) == 0, 28, 'Assets to mirror could not be ' +
+        'deployed')
+    user = os.path.join(dstDir, 'user.txt')
+    f = open(user, 'w')
+    f.write('mine')
+    f.close()
+    edited = os.path.join(dstDir, 'edited.txt')
+    f = open(edited, 'w')
+    f.write('changed by hand')
+    f.close()
+    f = open(os.path.join(srcDir, 'assets', 'release.ini'), 'w')
+    f.write('[kept.txt]\nCopy=1\n')
+    f.close()
+    copydeps.main(args)
+    expect(not os.path.exists(os.path.join(dstDir, 'dropped.txt'))
+        and os.path.exists(os.path.join(dstDir, 'kept.txt')), 29,
+        'Mirroring did not remove an asset no longer deployed')
+    expect(os.path.exists(user), 30, 'Mirroring removed a file it had ' +
+        'never deployed')
+    f = open(edited, 'r')
+    text = f.read()
+    f.close()
+    expect(text == 'changed by hand', 31, 'Mirroring removed a file ' +
+        'changed since it was deployed')
+    srcDir = os.path.join(dir, 'multisrc')
+    assetDir = os.path.join(srcDir, 'assets', 'release')
+    os.makedirs(assetDir)
+    files = [(os.path.join(assetDir, 'shared.txt'), 'shared'),
+        (os.path.join(srcDir, 'assets', 'release.ini'),
+        '[shared.txt]\nCopy=1\n')]
+    for arch in ['32', '64']:
+        os.makedirs(os.path.join(srcDir, 'lib' + arch, 'release'))
+        files += [(os.path.join(srcDir, 'lib' + arch, 'release',
+            'lib' + arch + '.so'), arch)]
+    for path, text in files:
+        f = open(path, 'w')
+        f.write(text)
+        f.close()
+    dsts = [os.path.join(dir, 'multi32'), os.path.join(dir, 'multi64')]
+    status = copydeps.main(['copydeps.py', srcDir, dsts[0], '32', 'release',
+        dsts[1], '64', 'release'])
+    expect(status == 0 and [sorted([name for name in os.listdir(dst)
+        if not name.startswith('.')]) for dst in dsts] == [['lib32.so',
+        'shared.txt'], ['lib64.so', 'shared.txt']], 59, 'Deploying ' +
+        'several architectures at once mixed up their files')
+
+
+
+## ============================ F U N C T I O N ============================ #
+## void packCheck(string)
+##
+## TITLE:       Pack Checker
+## DESCRIPTION: Checks that entries come back out of a pack as they went in,
+##              that large ones start on a page boundary, that an update only
+##              writes what changed, that compacting, keep() and remove()
+##              leave the right entries behind, and that a pack that could
+##              not be written leaves its manifest alone.
+##
+## PARAMETER: A scratch directory to work in.
+def packCheck(dir):
+    from concurrent.futures import ThreadPoolExecutor
+    import copydeps, os, pack
+    path = os.path.join(dir, 'test.pack')
+    files = {}
+    def write(name, data):
+        files[name] = os.path.join(dir, name)
+        f = open(files[name], 'wb')
+        f.write(data)
+        f.close()
+    big = os.urandom(pack.PAGE_SIZE * 2 + 1)
+    write('small', b'small entry')
+    write('big', big)
+    writer = pack.PackWriter(path)
+    writer.add('small', files['small'], 'hash1')
+    writer.add('big', files['big'], 'hash2')
+    writer.close()
+    with pack.PackReader(path) as reader:
+        view = reader.get('big')
+        same = view == big
+        view.release()
+        expect(same and reader.read('small') == b'small entry'
+            and reader.hash('big') == 'hash2' and reader.codec('big') == None,
+            32, 'Entries did not come back out of a pack as they went in')
+        bigOffset = reader.entries['big'][0]
+        smallOffset = reader.entries['small'][0]
+    expect(bigOffset % pack.PAGE_SIZE == 0, 33, 'A large entry was not ' +
+        'aligned to a page')
+    write('small', b'changed entry')
+    writer = pack.PackWriter(path)
+    if not writer.has('big', 'hash2'):
+        writer.add('big', files['big'], 'hash2')
+    if not writer.has('small', 'hash3'):
+        writer.add('small', files['small'], 'hash3')
+    writer.close()
+    with pack.PackReader(path) as reader:
+        expect(reader.entries['big'][0] == bigOffset
+            and reader.entries['small'][0] > smallOffset
+            and reader.read('small') == b'changed entry', 34, 'An update ' +
+            'rewrote an unchanged entry, or not a changed one')
+    slack = pack.COMPACT_SLACK
+    pack.COMPACT_SLACK = 0
+    try:
+        writer = pack.PackWriter(path)
+        writer.remove('big')
+        writer.close()
+    finally:
+        pack.COMPACT_SLACK = slack
+    with pack.PackReader(path) as reader:
+        expect(os.path.getsize(path) < pack.PAGE_SIZE
+            and reader.names() == ['small']
+            and reader.read('small') == b'changed entry', 35, 'Compacting ' +
+            'lost an entry, or left the space behind')
+    writer = pack.PackWriter(path)
+    writer.add('big', files['big'], 'hash2')
+    writer.add('other', files['small'], 'hash4')
+    writer.keep(['small', 'other'])
+    writer.remove('other')
+    writer.close()
+    with pack.PackReader(path) as reader:
+        expect(reader.names() == ['small'], 36, 'keep() or remove() left ' +
+            'the wrong entries')
+    manifest = copydeps.DeployManifest(os.path.join(dir, 'packdst'))
+    before = dict(manifest.packed)
+    def failIndex(writer):
+        raise OSError('Index could not be written')
+    writeIndex = pack.PackWriter.writeIndex
+    pack.PackWriter.writeIndex = failIndex
+    try:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            result = copydeps.packFiles([(files['big'], 'big',
+                os.stat(files['big']), None)], path, manifest, executor)
+    finally:
+        pack.PackWriter.writeIndex = writeIndex
+    expect(len(result['errors']) == 1 and manifest.packed == before, 47,
+        'A pack that could not be written was recorded in its manifest')
+
+
+
+## ============================ F U N C T I O N ============================ #
+## void compressCheck(string)
+##
+## TITLE:       Asset Compression Checker
+## DESCRIPTION: Checks that a compressed asset deployed on its own is named
+##              for its codec, while one packed keeps its name and has its
+##              codec noted in the pack, and that the cache keeps apart what
+##              was compressed with other settings and can be trimmed.
+##
+## PARAMETER: A scratch directory to work in.
+def compressCheck(dir):
+    import assetcodec, copydeps, os, pack, zlib
+    srcDir = os.path.join(dir, 'compresssrc')
+    dstDir = os.path.join(dir, 'compressdst')
+    assetDir = os.path.join(srcDir, 'assets', 'release')
+    os.makedirs(assetDir)
+    os.makedirs(os.path.join(srcDir, 'lib64', 'release'))
+    for name in ['loose.txt', 'packed.txt']:
+        f = open(os.path.join(assetDir, name), 'w')
+        f.write(name * 100)
+        f.close()
+    f = open(os.path.join(srcDir, 'assets', 'release.ini'), 'w')
+    f.write('[loose.txt]\nCopy=1\nCompress=zlib\n[packed.txt]\nCopy=1\n' +
+        'Compress=zlib\nPack=1\n')
+    f.close()
+    expect(copydeps.main(['copydeps.py', '--cache-dir',
+        os.path.join(dir, 'compresscache'), srcDir, dstDir, '64',
+        'release']) == 0, 37, 'Compressed assets could not be deployed')
+    loose = os.path.join(dstDir, 'loose.txt.zlib')
+    data = b''
+    if os.path.isfile(loose):
+        f = open(loose, 'rb')
+        data = zlib.decompress(f.read())
+        f.close()
+    expect(data == b'loose.txt' * 100
+        and not os.path.exists(os.path.join(dstDir, 'loose.txt')), 38,
+        'A compressed asset deployed on its own was not named for its codec')
+    with pack.PackReader(os.path.join(dstDir, copydeps.PACK_FILE)) as reader:
+        expect(reader.names() == ['packed.txt']
+            and reader.codec('packed.txt') == 'zlib'
+            and reader.read('packed.txt') == b'packed.txt' * 100, 39,
+            'A compressed asset was packed under the wrong name or codec')
+    cacheDir = os.path.join(dir, 'compresscache')
+    cache = copydeps.CompressCache(cacheDir, 0)
+    digest = copydeps.hashFile(os.path.join(assetDir, 'loose.txt'))
+    old = cache.output(digest, 'zlib')
+    compress, decompress, params = assetcodec.CODECS['zlib']
+    assetcodec.registerCodec('zlib', lambda data: zlib.compress(data, 1),
+        decompress, 'level=1')
+    new = cache.output(digest, 'zlib')
+    assetcodec.registerCodec('zlib', compress, decompress, params)
+    expect(old != new and os.path.isfile(old) and cache.trim() == 2
+        and not os.path.exists(old) and os.path.isfile(os.path.join(
+        cacheDir, copydeps.HASHES_FILE)), 46, 'The compression cache ' +
+        'mixed up codec settings, or could not be trimmed')
+
+
+
+## ============================ F U N C T I O N ============================ #
+## void remoteCheck(string)
+##
+## TITLE:       Remote Worker Checker
+## DESCRIPTION: Starts two workers on this machine, checks that units are
+##              compiled on each of them, that a worker that stops answering
+##              is dropped, with its unit compiled elsewhere, and that a
+##              response file is refused. Then checks that a build server
+##              gets a client's request and sends back its output and exit
+##              status.
+##
+## PARAMETER: A scratch directory to work in.
+def remoteCheck(dir):
+    import buildserver, contextlib, io, os, remote, threading
+    servers = []
+    for i in range(2):
+        server = remote.WorkerServer(('127.0.0.1', 0), 1)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers += [server]
+    def counter(server, compile):
+        def func(header, payload):
+            server.units += 1
+            return compile(header, payload)
+        server.units = 0
+        server.compile = func
+    for server in servers:
+        counter(server, server.compile)
+    workers = remote.RemoteWorkers(['127.0.0.1:' +
+        str(server.server_address[1]) for server in servers], 1)
+    source = os.path.join(dir, 'remote.c')
+    f = open(source, 'w')
+    f.write('int remote(void) { return 1; }\n')
+    f.close()
+    def compile(name):
+        obj = os.path.join(dir, name + '.o')
+        depFile = os.path.join(dir, name + '.d')
+        com = ['gcc', '-c', '-x', 'c', '-std=c11', '-O2', '-o', obj, '-MMD',
+            '-MF', depFile, source]
+        status = workers.run(com, 'c', source, obj, depFile)[0]
+        return status == 0 and os.path.isfile(obj)
+    try:
+        # The first unit goes to the first worker; keeping that one busy
+        # sends the second to the other
+        ok = compile('first')
+        held = workers.acquire()
+        ok = ok and compile('second')
+        workers.release(held)
+        expect(ok and [server.units for server in servers] == [1, 1], 40,
+            'Units were not compiled on both workers')
+        dead = workers.workers[0]
+        servers[0].shutdown()
+        servers[0].server_close()
+        dead.close()
+        expect(compile('fallback') and not dead.alive
+            and servers[1].units == 2 and workers.remoteUnits == 3, 41,
+            'A dead worker was not dropped in favour of another')
+        reply, data = workers.workers[1].compile({'type': 'compile',
+            'compiler': 'gcc', 'lang': 'c', 'flags': ['@' + source]},
+            b'int x;\n')
+        expect('error' in reply and 'output' not in reply, 42, 'A worker ' +
+            'accepted a response file')
+    finally:
+        workers.close()
+        for server in servers[1:]:
+            server.shutdown()
+            server.server_close()
+    path = buildserver.getSocketPath(os.path.join(dir, 'main.ini'))
+    server = buildserver.BuildServer(path)
+    requests = []
+    def serve():
+        conn = server.accept()
+        requests.append(conn.readRequest())
+        conn.write('built\npartial')
+        conn.finish(7)
+        conn.close()
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    out = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(out):
+            status = buildserver.sendRequest(path, ['debug64'],
+                {'jobs': '2'})
+    finally:
+        thread.join()
+        server.close()
+    expect(status == 7 and requests == [(['debug64'], {'jobs': '2'})]
+        and out.getvalue() == 'built\npartial\n'
+        and not os.path.exists(path), 53, 'A request or its reply did not ' +
+        'make it through the build server')
+
+
+
+## ============================ F U N C T I O N ============================ #
+## void listingCheck(string)
+##
+## TITLE:       Directory Listing Checker
+## DESCRIPTION: Checks that a destination directory that can't be listed is
+##              reported as an error, without stopping other files being
+##              copied.
+##
+## PARAMETER: A scratch directory to work in.
+def listingCheck(dir):
+    import copydeps, errno, os
+    src = os.path.join(dir, 'listed.txt')
+    f = open(src, 'w')
+    f.write('listed')
+    f.close()
+    denied = os.path.join(dir, 'denied')
+    allowed = os.path.join(dir, 'allowed')
+    os.makedirs(denied)
+    scandir = copydeps.os.scandir
+    def deny(path):
+        if path == denied:
+            raise PermissionError(errno.EACCES, 'Permission denied', path)
+        return scandir(path)
+    copydeps.os.scandir = deny
+    try:
+        ret = copydeps.copyFiles([(src, os.path.join(denied, 'listed.txt'),
+            'copy', os.stat(src)), (src, os.path.join(allowed, 'listed.txt'),
+            'copy', os.stat(src))], 1)
+    finally:
+        copydeps.os.scandir = scandir
+    expect(len(ret['errors']) == 1 and ret['copied'] == 1
+        and os.path.isfile(os.path.join(allowed, 'listed.txt')), 43,
+        'A directory that could not be listed stopped the copy')
+
+
+
 ## ============================ F U N C T I O N ============================ #
 ## void main(string[])
 ##
@@ -102,23 +966,51 @@ def main(args):
     if(copydeps.main(['copydeps.py', srcDir, dstDir, '64', 'release'])
     != 0):
         raise Exception(exprefix + 'CopyDeps program failed testing.')
-    assets = listdir(path.join(srcDir, 'assets', 'release'))
-    for asset in assets:
-        if path.isfile(asset) == False:
+    import ini
+    for key, settings, lineno in ini.iter_sections(path.join(srcDir,
+    'assets', 'release.ini')):
+        if settings.get('copy') != '1':
             continue
-        bname = path.basename(asset)
+        bname = settings.get('outputpath', key).lstrip('/')
         if path.isfile(path.join(dstDir, bname)) == False:
             raise Exception(exprefix + 'Asset file "' + bname + '" was ' +
                 'not copied into the destination directory.')
     libs = listdir(path.join(srcDir, 'lib64', 'release'))
     for lib in libs:
-        if path.isfile(lib) == False:
+        if path.isfile(path.join(srcDir, 'lib64', 'release', lib)) == False:
             continue
         bname = path.basename(lib)
         if path.isfile(path.join(dstDir, bname)) == False:
             raise Exception(exprefix + 'Library file "' + bname + '" was' +
                 ' not copied into the destination directory.')
     print(colour.green('copydeps.py has passed testing.') + '\n...')
+    # Suite C: Job pool
+    jobsCheck(testDirPath)
+    print(colour.green('jobs.py has passed testing.') + '\n...')
+    # Suite D: Incremental builds
+    incrementalCheck(testDirPath)
+    print(colour.green('incremental.py has passed testing.'))
+    # Suite E: Object cache
+    objcacheCheck(testDirPath)
+    print(colour.green('objcache.py has passed testing.'))
+    # Suite F: INI parsing
+    iniCheck(testDirPath)
+    print(colour.green('ini.py has passed testing.'))
+    # Suite G: Deploying with CopyDeps
+    copydepsCheck(testDirPath)
+    print(colour.green('copydeps.py has passed deployment testing.'))
+    # Suite H: Asset packs
+    packCheck(testDirPath)
+    print(colour.green('pack.py has passed testing.'))
+    # Suite I: Asset compression
+    compressCheck(testDirPath)
+    print(colour.green('assetcodec.py has passed testing.'))
+    # Suite J: Remote workers
+    remoteCheck(testDirPath)
+    print(colour.green('remote.py has passed testing.'))
+    # Suite K: Unreadable destinations
+    listingCheck(testDirPath)
+    print(colour.green('copydeps.py has passed listing testing.') + '\n...')
     print(colour.green('All tests have passed.') + ' Exiting...')
 
 
@@ -126,13 +1018,15 @@ def main(args):
 ## =========================== B O O T S T R A P =========================== #
 ## Application bootstrapper, guarding against code execution upon import.
 if __name__ == '__main__':
-    try:
-        from sys import argv, exit
-        exit(main(argv))
-    except Exception as ex:
-        raise ex
-        return -2
-    except:
-        print('Rogue exception:', sys.exc_info()[0])
-        return -1
-    return 0
+    from sys import argv, exit
+    def _boot():
+        try:
+            return main(argv)
+        except Exception as ex:
+            raise ex
+            return -2
+        except:
+            from sys import exc_info
+            print('Rogue exception:', exc_info()[0])
+            return -1
+    exit(_boot())
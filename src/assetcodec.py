@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8; mode: Python; indent-tabs-mode: nil; indent-width: 4; -*-
+#
+# OCO WORKING SET TOOLCHAIN
+# Copyright (C) 2017 Arqadium. All rights reserved.
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# version 2.0.  If a copy of the MPL was not distributed with this file, then
+# you can obtain one at <http://mozilla.org/MPL/2.0/>.
+#
+
+import importlib, os, time, zlib
+
+# Codecs by name, each a tuple of its compress and decompress functions and
+# a description of the settings it compresses with
+CODECS = {}
+# How hard zlib tries; assets are compressed once and loaded many times
+ZLIB_LEVEL = 9
+
+
+
+## ============================ F U N C T I O N ============================ #
+## void registerCodec(string, function, function, string)
+##
+## TITLE:       Register Codec
+## DESCRIPTION: Makes a codec available to asset INIs and packs. Compression
+##              happens in worker processes, which may not have inherited
+##              what was registered at run time; a codec is only sure to be
+##              seen by them if its module is named in the OCO_CODECS
+##              environment variable, a comma-separated list of modules
+##              imported along with this one, and registers it on import.
+##
+## PARAMETER: The codec's name, as given in an asset INI.
+## PARAMETER: A function turning bytes into compressed bytes.
+## PARAMETER: A function turning compressed bytes back into bytes.
+## PARAMETER: The settings it compresses with, such as its level, as text;
+##            anything compressed with other settings is compressed again.
+def registerCodec(name, compress, decompress, params=''):
+    CODECS[name.lower()] = (compress, decompress, params)
+
+
+
+## ============================ F U N C T I O N ============================ #
+## string getCodec(string)
+##
+## TITLE:       Get Codec
+## DESCRIPTION: Checks the name of a codec.
+##
+## PARAMETER: The name, in any case.
+##
+## RETURNS: The name as registered.
+def getCodec(value):
+    ret = value.strip().lower()
+    if ret not in CODECS:
+        raise Exception('Codec \u2018' + value + '\u2019 is not one of ' +
+            ', '.join(sorted(CODECS)))
+    return ret
+
+
+
+## ============================ F U N C T I O N ============================ #
+## string getCodecParams(string)
+##
+## TITLE:       Codec Parameters
+## DESCRIPTION: Tells what settings a codec compresses with.
+##
+## PARAMETER: The name of the codec, as registered.
+##
+## RETURNS: The settings as given to registerCodec().
+def getCodecParams(codec):
+    return CODECS[codec][2]
+
+
+
+## ============================ F U N C T I O N ============================ #
+## tuple compressFile(string, string, string)
+##
+## TITLE:       Compress File
+## DESCRIPTION: Compresses a file into another, which only appears once it is
+##              complete. Made to be run in a worker process.
+##
+## PARAMETER: The codec to compress with.
+## PARAMETER: The file to compress.
+## PARAMETER: Where to put the result.
+##
+## RETURNS: A tuple of the bytes read, the bytes written, and the seconds
+##          spent compressing.
+def compressFile(codec, src, dst):
+    f = open(src, 'rb')
+    data = f.read()
+    f.close()
+    start = time.perf_counter()
+    out = CODECS[codec][0](data)
+    seconds = time.perf_counter() - start
+    tmp = dst + '.' + str(os.getpid())
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    f = open(tmp, 'wb')
+    f.write(out)
+    f.close()
+    os.replace(tmp, dst)
+    return (len(data), len(out), seconds)
+
+
+
+## ============================ F U N C T I O N ============================ #
+## bytes decompress(string, bytes)
+##
+## TITLE:       Decompress
+## DESCRIPTION: Undoes what a codec did.
+##
+## PARAMETER: The codec the data was compressed with.
+## PARAMETER: The compressed data.
+##
+## RETURNS: The data as it was.
+def decompress(codec, data):
+    return CODECS[getCodec(codec)][1](data)
+
+
+
+registerCodec('zlib', lambda data: zlib.compress(data, ZLIB_LEVEL),
+    zlib.decompress, 'level=' + str(ZLIB_LEVEL))
+try:
+    import lz4.frame
+    registerCodec('lz4', lz4.frame.compress, lz4.frame.decompress)
+except ImportError:
+    # lz4 is optional; without it, only zlib is on offer
+    pass
+for module in os.getenv('OCO_CODECS', '').split(','):
+    if module.strip() != '':
+        importlib.import_module(module.strip())
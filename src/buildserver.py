@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8; mode: Python; indent-tabs-mode: nil; indent-width: 4; -*-
+#
+# OCO WORKING SET TOOLCHAIN
+# Copyright (C) 2017 Arqadium. All rights reserved.
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# version 2.0.  If a copy of the MPL was not distributed with this file, then
+# you can obtain one at <http://mozilla.org/MPL/2.0/>.
+#
+
+import errno, json, os, socket, sys
+
+# Requests and replies are single lines of JSON; no sane request is bigger
+MAX_REQUEST = 1024 * 1024
+
+
+
+## ============================ F U N C T I O N ============================ #
+## string getSocketPath(string)
+##
+## TITLE:       Socket Path
+## DESCRIPTION: Works out where the build server for a solution listens by
+##              default, which is beside the solution's INI file.
+##
+## PARAMETER: Path to the solution's INI file.
+##
+## RETURNS: Path to a Unix domain socket, which may not exist.
+def getSocketPath(iniPath):
+    dir, name = os.path.split(os.path.abspath(iniPath))
+    return os.path.join(dir, '.' + name + '.sock')
+
+
+
+## =============================== C L A S S =============================== #
+## Connection
+##
+## TITLE:       Server Connection
+## DESCRIPTION: One client of the build server. A client sends one request,
+##              holding its positional arguments and options, and is sent
+##              the console output of the build a line at a time, followed by
+##              its exit status. This can stand in for sys.stdout, so a build
+##              can report to the client the same way it would to a terminal.
+##              If the client goes away the build carries on regardless.
+class Connection:
+    def __init__(self, sock):
+        self.sock = sock
+        self.file = sock.makefile('rwb')
+        self.buffer = ''
+        self.closed = False
+
+    def readRequest(self):
+        line = self.file.readline(MAX_REQUEST)
+        try:
+            ret = json.loads(line.decode())
+        except ValueError:
+            raise Exception('Malformed request from client')
+        if (not isinstance(ret.get('args'), list)
+        or not isinstance(ret.get('options', {}), dict)):
+            raise Exception('Malformed request from client')
+        return (ret['args'], ret.get('options', {}))
+
+    def send(self, message):
+        if self.closed:
+            return
+        try:
+            self.file.write(json.dumps(message).encode() + b'\n')
+            self.file.flush()
+        except OSError:
+            # Nobody is listening any more
+            self.closed = True
+
+    def write(self, text):
+        self.buffer += text
+        while '\n' in self.buffer:
+            line, self.buffer = self.buffer.split('\n', 1)
+            self.send({'out': line})
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def finish(self, status):
+        if self.buffer != '':
+            self.send({'out': self.buffer})
+            self.buffer = ''
+        self.send({'status': status})
+
+    def close(self):
+        try:
+            self.file.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+
+## =============================== C L A S S =============================== #
+## BuildServer
+##
+## TITLE:       Build Server
+## DESCRIPTION: Listens on a Unix domain socket for build requests. A socket
+##              left behind by a server that has since died is replaced, but
+##              one with a live server behind it is left alone.
+class BuildServer:
+    def __init__(self, path):
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.bind(path)
+        except OSError as ex:
+            if ex.errno != errno.EADDRINUSE:
+                raise
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+                probe.close()
+                raise Exception('A build server is already listening on ' +
+                    '\u2018' + path + '\u2019')
+            except ConnectionRefusedError:
+                probe.close()
+            os.remove(path)
+            self.sock.bind(path)
+        self.sock.listen(8)
+
+    def accept(self):
+        sock, _ = self.sock.accept()
+        return Connection(sock)
+
+    def close(self):
+        self.sock.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+
+## ============================ F U N C T I O N ============================ #
+## integer sendRequest(string, string[], dict<string, object>)
+##
+## TITLE:       Send Request
+## DESCRIPTION: Asks a running build server to do something, and passes what
+##              it prints on to standard output as it arrives.
+##
+## PARAMETER: Path to the server's socket.
+## PARAMETER: Positional arguments, such as the build type.
+## PARAMETER: Options, as parsed from the command line.
+##
+## RETURNS: The exit status the server replied with.
+def sendRequest(path, args, options):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        raise Exception('No build server is listening on \u2018' +
+            path + '\u2019')
+    file = sock.makefile('rwb')
+    try:
+        file.write(json.dumps({'args': args, 'options': options}).encode() +
+            b'\n')
+        file.flush()
+        for line in file:
+            message = json.loads(line.decode())
+            if 'out' in message:
+                sys.stdout.write(message['out'] + '\n')
+                sys.stdout.flush()
+            elif 'status' in message:
+                return message['status']
+    finally:
+        file.close()
+        sock.close()
+    raise Exception('The build server hung up before finishing')
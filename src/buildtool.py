@@ -9,70 +9,34 @@
 # you can obtain one at <http://mozilla.org/MPL/2.0/>.
 #
 
+from buildserver import BuildServer, getSocketPath, sendRequest
+from buildtrace import BuildTrace
 from colour import color
-from subprocess import CalledProcessError, run, PIPE
-import glob, ini, os, platform, re, shutil, sys
-
-VSPATH = ''
-LDLIBPATH = ''
-if os.name == 'nt':
-    VSPATH = os.path.join(os.getenv('PROGRAMFILES(X86)',
-        os.environ['PROGRAMFILES']), 'Microsoft Visual Studio', '2017')
-else:
-    _LDLIBPATH = os.getenv('LD_LIBRARY_PATH', [])
-    if _LDLIBPATH != []:
-        LDLIBPATH = _LDLIBPATH[:-1].split(':')
-
-def getMSVCPath():
-    if os.name != 'nt':
-        return ''
-    ret = VSPATH
-    ver = None
-    for version in ['Enterprise', 'Professional', 'Community']:
-        tmp = os.path.join(ret, version)
-        if os.path.exists(tmp):
-            ret = tmp
-            break
-    ret = os.path.join(ret, 'VC\\Tools\\MSVC')
-    if os.path.isdir(ret):
-        ret = os.path.join(ret, os.listdir(ret)[0])
-    return ret
-
-D_INSTALL_DIRS = [
-    'C:\\Program Files\\DMD\\dmd2',
-    'C:\\Program Files (x86)\\DMD\\dmd2',
-    'C:\\DMD\\dmd2'
-]
-
-def getDPath():
-    if os.name == 'nt':
-        for dir in D_INSTALL_DIRS:
-            if os.path.isdir(dir):
-                return dir
-        # No common installation directories exist
-        return None
-    # else: not Windows
-    return '/usr/bin'
+from common import getOptions
+from contextlib import redirect_stdout
+from functools import partial
+from incremental import BuildState, LinkManifest, MtimeCache, \
+    getFileStats, parseDmdDeps
+from jobs import Job, JobPool, captureCommand, getJobCount, getPeakRss, \
+    resetPeakRss, runCommand, setLocalJobs
+from objcache import ObjectCache, getCacheDir, getCacheSize
+from remote import DEFAULT_PORT, RemoteWorkers, WorkerServer, parseAddress
+from subprocess import run, PIPE
+from srcindex import INDEX_FILE, Inotify, SourceIndex
+from toolchain import Toolchain
+import fnmatch, glob, hashlib, ini, json, os, platform, re, select, shutil, \
+    sys, time
 
 def pfspec(unix, nt):
     if os.name == 'nt':
         return nt
     return unix
 
+# Tools are only looked for once something needs them
+TOOLCHAIN = Toolchain()
+
 def which(program):
-    def is_exe(fpath):
-        return os.path.isfile(fpath) and os.access(fpath, os.X_OK)
-    fpath, fname = os.path.split(program)
-    if fpath:
-        if is_exe(program):
-            return program
-    else:
-        for path in os.environ["PATH"].split(os.pathsep):
-            path = path.strip('"')
-            exe_file = os.path.join(path, program)
-            if is_exe(exe_file):
-                return exe_file
-    return None
+    return TOOLCHAIN.which(program)
 
 PREFIX = color('[\u00D4\u00C7\u00F4]', fg='white', style='bold')
 ACTIONS = {
@@ -82,6 +46,7 @@ ACTIONS = {
     'd':     color(fg='magenta',              s='Compiling') + '       ',
     'gfx':   color(fg='yellow',               s='Transmogrifying') + ' ',
     'conv':  color(fg='yellow', style='bold', s='Converting') + '      ',
+    'pch':   color(fg='blue', style='bold',   s='Precompiling') + '    ',
     'link':  color(fg='red',                  s='Linking') + '         ',
     'lint':  color(fg='black', style='bold',  s='Linting') + '         '
 }
@@ -101,203 +66,230 @@ STARTUP = [
     'Copyright \u00A9 2017 Arqadium. All rights reserved.',
     ''
 ]
-DEBUG = sys.argv[2].startswith('debug')
 IS64BIT = platform.machine().endswith('64')
-TARGET = 'x64' if IS64BIT else 'x86' # x86, x64, arm, arm64
-if sys.argv[2].endswith('64'):
-    TARGET = 'x64'
-elif sys.argv[2].endswith('32'):
-    TARGET = 'x86'
-WINARCH = 'X64' if IS64BIT else 'X86'
-D_PATH = getDPath()
-MSVCPATH = getMSVCPath()
-MSVCBIN = MSVCPATH + '\\bin\\Host' + WINARCH + '\\' + TARGET
 KITSPATH = 'C:\\Program Files (x86)\\Windows Kits\\10'
 OBJEXT = pfspec('.o', '.obj')
+COUTFLAG = pfspec('-o', '/Fo')
+CINCFLAG = pfspec('-iquote', '/I')
+DOUTFLAG = '-od='
+DINCFLAG = '-I='
+# Dependency tracking for incremental builds; not available for MSVC
+CDEPFLAGS = ['-MMD', '-MF']
+DDEPFLAG = '-deps='
+LINKOUTFLAG = pfspec('-o', '/OUT:')
+LINKDIRFLAG = pfspec('-L', '/LIBPATH:')
+LINKWINFLAG = pfspec('', '/IMPLIB:')
+LINKLIBFLAG = pfspec('-l', '/DEFAULTLIB:')
+APPEXT = pfspec('', '.exe')
+SHAREDEXT = pfspec('.so', '.dll')
+STATICEXT = pfspec('.a', '.lib')
+RE_ISCPP = re.compile(r'\.((c|h)(pp|xx|\+\+)|cc|hh)$')
+RE_ISSRC = re.compile(r'[\w_\-\.]+\.((c|h)(pp|xx|\+\+)?|cc|hh|di?)')
+# The rest depends on the build type, and is filled in by configure()
+DEBUG = False
+TARGET = 'x64' if IS64BIT else 'x86' # x86, x64, arm, arm64
+WINARCH = 'X64' if IS64BIT else 'X86'
+D_PATH = None
+MSVCPATH = ''
+MSVCBIN = ''
 CC = 'gcc'
 CXX = CC
 DC = 'dmd'
-LINK = 'g++ -fuse-ld=gold'
+LINK = ['g++', '-fuse-ld=gold']
 AR = 'ar'
 RES = 'test' # Dummy UNIX commands
 RC = 'test'
 GCC_VER = '0.0.0'
-if os.name != 'nt':
-    compl = run('gcc -dumpversion', shell=True, check=True, stdout=PIPE)
-    GCC_VER = compl.stdout.decode().replace('\n', '')
-LIBDIRS = pfspec([
-    '/usr/lib/gcc/x86_64-pc-linux-gnu/' + GCC_VER
-] + LDLIBPATH, [
-    KITSPATH + '\\lib\\10.0.10586.0',
-    MSVCPATH + '\\lib\\' + WINARCH,
-    KITSPATH + '\\lib\\10.0.10586.0\\ucrt\\' + TARGET,
-    KITSPATH + '\\lib\\10.0.10586.0\\um\\' + TARGET,
-])
-LIBS = pfspec([
-    'gcc_s',
-    'c',
-    'gcc_s',
-    'stdc++',
-    'm',
-    'gcc_s',
-    'c',
-    'gcc_s'
-], [
-    'kernel32',
-    'user32',
-    'gdi32',
-    'winspool',
-    'comdlg32',
-    'advapi32',
-    'shell32',
-    'ole32',
-    'oleaut32',
-    'uuid',
-    'odbc32',
-    'odbccp32',
-    'legacy_stdio_definitions'
-])
-INCDIRS = pfspec([], [
-    MSVCPATH + '\\include',
-    KITSPATH + '\\include\\10.0.10586.0\\shared',
-    KITSPATH + '\\include\\10.0.10586.0\\ucrt',
-    KITSPATH + '\\include\\10.0.10586.0\\um',
-    '.\\deps\\include'
-])
-CFLAGS = [
-    '-c',
-    '-fPIC',
-    '-mtune=generic',
-    '-mfpmath=sse',
-    '-x',
-    'c',
-    '-std=c11',
-    '-pipe'
-]
-CPPFLAGS = [
-    '-c',
-    '-fPIC',
-    '-mtune=generic',
-    '-mfpmath=sse',
-    '-x',
-    'c++',
-    '-std=c++14',
-    '-pipe'
-]
-COUTFLAG = '-o'
-CINCFLAG = '-iquote'
-DFLAGS = [
-    '-color',
-    '-c'
-]
-DOUTFLAG = '-od='
-DINCFLAG = '-I='
+LIBDIRS = []
+LIBS = []
+INCDIRS = []
+CFLAGS = []
+CPPFLAGS = []
+DFLAGS = []
 LINKFLAGS = []
-LINKOUTFLAG = '-o'
-LINKDIRFLAG = '-L'
-LINKWINFLAG = pfspec('', '/IMPLIB:')
-LINKLIBFLAG = '-l'
-APPEXT = ''
-SHAREDEXT = '.so'
-STATICEXT = '.a'
 BOOST_SUF = ''
-RE_ISCPP = re.compile(r'\.((c|h)(pp|xx|\+\+)|cc|hh)$')
-RE_ISSRC = re.compile(r'[\w_\-\.]+\.((c|h)(pp|xx|\+\+)?|cc|hh)|di?')
-if os.name == 'nt':
-    CC = MSVCBIN + '\\cl.exe'
+
+def configure(buildType):
+    global DEBUG, TARGET, WINARCH, D_PATH, MSVCPATH, MSVCBIN, CC, CXX, DC, \
+        LINK, AR, RES, RC, GCC_VER, LIBDIRS, LIBS, INCDIRS, CFLAGS, \
+        CPPFLAGS, DFLAGS, LINKFLAGS, BOOST_SUF
+    DEBUG = buildType.startswith('debug')
+    COMPILER_IDS.clear()
+    TARGET = 'x64' if IS64BIT else 'x86'
+    if buildType.endswith('64'):
+        TARGET = 'x64'
+    elif buildType.endswith('32'):
+        TARGET = 'x86'
+    WINARCH = 'X64' if IS64BIT else 'X86'
+    D_PATH = TOOLCHAIN.dPath
+    MSVCPATH = TOOLCHAIN.msvcPath
+    MSVCBIN = MSVCPATH + '\\bin\\Host' + WINARCH + '\\' + TARGET
+    CC = 'gcc'
     CXX = CC
-    DC += '.exe'
-    LINK = MSVCBIN + '\\link.exe'
-    AR = MSVCBIN + '\\lib.exe'
-    RES = MSVCBIN + '\\windres.exe'
-    RC = KITSPATH + '\\bin\\' + TARGET + '\\rc.exe'
-    APPEXT = '.exe'
-    SHAREDEXT = '.dll'
-    STATICEXT = '.lib'
-    if D_PATH != None:
-        # Append lib dirs
-        tmp = [
-            D_PATH + '\\windows\\lib'
-        ]
-        if IS64BIT:
-            tmp += [
-                D_PATH + '\\windows\\lib64'
-            ]
-        LIBDIRS += tmp
-        # Append libs
-        tmp = [
-            'comctl32',
-            'gdi32',
-            'glu32',
-            'opengl32',
-            'rpcrt4',
-            'version',
-            'wininet',
-            'winmm',
-            'ws2_32',
-            'wsock32'
-        ]
-        if IS64BIT:
-            tmp += [
-                'phobos64' if TARGET == 'x64' else 'phobos'
-            ]
-        LIBS += tmp
+    DC = 'dmd'
+    LINK = ['g++', '-fuse-ld=gold']
+    AR = 'ar'
+    RES = 'test' # Dummy UNIX commands
+    RC = 'test'
+    GCC_VER = '0.0.0'
+    LDLIBPATH = []
+    if os.name != 'nt':
+        GCC_VER = TOOLCHAIN.gccVersion
+        for path in os.getenv('LD_LIBRARY_PATH', '').split(':'):
+            if path != '':
+                LDLIBPATH += [path]
+    LIBDIRS = pfspec([
+        '/usr/lib/gcc/x86_64-pc-linux-gnu/' + GCC_VER
+    ] + LDLIBPATH, [
+        KITSPATH + '\\lib\\10.0.10586.0',
+        MSVCPATH + '\\lib\\' + WINARCH,
+        KITSPATH + '\\lib\\10.0.10586.0\\ucrt\\' + TARGET,
+        KITSPATH + '\\lib\\10.0.10586.0\\um\\' + TARGET,
+    ])
+    LIBS = pfspec([
+        'gcc_s',
+        'c',
+        'gcc_s',
+        'stdc++',
+        'm',
+        'gcc_s',
+        'c',
+        'gcc_s'
+    ], [
+        'kernel32',
+        'user32',
+        'gdi32',
+        'winspool',
+        'comdlg32',
+        'advapi32',
+        'shell32',
+        'ole32',
+        'oleaut32',
+        'uuid',
+        'odbc32',
+        'odbccp32',
+        'legacy_stdio_definitions'
+    ])
+    INCDIRS = pfspec([], [
+        MSVCPATH + '\\include',
+        KITSPATH + '\\include\\10.0.10586.0\\shared',
+        KITSPATH + '\\include\\10.0.10586.0\\ucrt',
+        KITSPATH + '\\include\\10.0.10586.0\\um',
+        '.\\deps\\include'
+    ])
     CFLAGS = [
-        '/bigobj',
-        '/c',
-        '/GF',
-        '/nologo',
-        '/Za',
-        '/std:c++14',
-        '/EHsc'
+        '-c',
+        '-fPIC',
+        '-mtune=generic',
+        '-mfpmath=sse',
+        '-x',
+        'c',
+        '-std=c11',
+        '-pipe'
     ]
-    COUTFLAG = '/Fo'
-    CINCFLAG = '/I'
-    LINKOUTFLAG = '/OUT:'
-    LINKDIRFLAG = '/LIBPATH:'
-    LINKLIBFLAG = '/DEFAULTLIB:'
-    LINKFLAGS = ['/CGTHREADS:8', '/DYNAMICBASE', '/LARGEADDRESSAWARE',
-        '/NOLOGO', '/NODEFAULTLIB:libcmt']
-    if TARGET == 'x86':
-        CFLAGS += ['/arch:SSE2', '/DARCH=32']
-        LINKFLAGS += ['/MACHINE:X86']
-    elif TARGET == 'x64':
-        CFLAGS += ['/arch:AVX', '/DARCH=64']
-        LINKFLAGS += ['/MACHINE:X64']
-    if DEBUG:
-        BOOST_SUF = '-vc141-mt-gd-1_64'
-        CFLAGS += ['/Od', '/W3', '/UNDEBUG']
-        LINKFLAGS += ['/DEBUG', '/OPT:NOREF', '/SUBSYSTEM:CONSOLE']
+    CPPFLAGS = [
+        '-c',
+        '-fPIC',
+        '-mtune=generic',
+        '-mfpmath=sse',
+        '-x',
+        'c++',
+        '-std=c++14',
+        '-pipe'
+    ]
+    DFLAGS = [
+        '-color',
+        '-c'
+    ]
+    LINKFLAGS = []
+    BOOST_SUF = ''
+    if os.name == 'nt':
+        CC = MSVCBIN + '\\cl.exe'
+        CXX = CC
+        DC += '.exe'
+        LINK = [MSVCBIN + '\\link.exe']
+        AR = MSVCBIN + '\\lib.exe'
+        RES = MSVCBIN + '\\windres.exe'
+        RC = KITSPATH + '\\bin\\' + TARGET + '\\rc.exe'
+        if D_PATH != None:
+            # Append lib dirs
+            tmp = [
+                D_PATH + '\\windows\\lib'
+            ]
+            if IS64BIT:
+                tmp += [
+                    D_PATH + '\\windows\\lib64'
+                ]
+            LIBDIRS += tmp
+            # Append libs
+            tmp = [
+                'comctl32',
+                'gdi32',
+                'glu32',
+                'opengl32',
+                'rpcrt4',
+                'version',
+                'wininet',
+                'winmm',
+                'ws2_32',
+                'wsock32'
+            ]
+            if IS64BIT:
+                tmp += [
+                    'phobos64' if TARGET == 'x64' else 'phobos'
+                ]
+            LIBS += tmp
+        CFLAGS = [
+            '/bigobj',
+            '/c',
+            '/GF',
+            '/nologo',
+            '/Za',
+            '/std:c++14',
+            '/EHsc'
+        ]
+        LINKFLAGS = ['/CGTHREADS:8', '/DYNAMICBASE', '/LARGEADDRESSAWARE',
+            '/NOLOGO', '/NODEFAULTLIB:libcmt']
+        if TARGET == 'x86':
+            CFLAGS += ['/arch:SSE2', '/DARCH=32']
+            LINKFLAGS += ['/MACHINE:X86']
+        elif TARGET == 'x64':
+            CFLAGS += ['/arch:AVX', '/DARCH=64']
+            LINKFLAGS += ['/MACHINE:X64']
+        if DEBUG:
+            BOOST_SUF = '-vc141-mt-gd-1_64'
+            CFLAGS += ['/Od', '/W3', '/UNDEBUG']
+            LINKFLAGS += ['/DEBUG', '/OPT:NOREF', '/SUBSYSTEM:CONSOLE']
         
-    else:
-        BOOST_SUF = '-vc141-mt-1_64'
-        CFLAGS += ['/GLdwy', '/O2t', '/w', '/DNDEBUG=1']
-        LINKFLAGS += ['/RELEASE', '/OPT:REF', '/SUBSYSTEM:WINDOWS']
-    CPPFLAGS = CFLAGS[:]
-else: # UNIX
-    if TARGET == 'x64':
-        CFLAGS += ['-m64', '-march=sandybridge', '-mavx', '-DARCH=64']
-        CPPFLAGS += ['-m64', '-march=sandybridge', '-mavx', '-DARCH=64']
-    elif TARGET == 'x86':
-        CFLAGS += ['-m32', '-march=pentium4', '-DARCH=32']
-        CPPFLAGS += ['-m32', '-march=pentium4', '-DARCH=32']
+        else:
+            BOOST_SUF = '-vc141-mt-1_64'
+            CFLAGS += ['/GLdwy', '/O2t', '/w', '/DNDEBUG=1']
+            LINKFLAGS += ['/RELEASE', '/OPT:REF', '/SUBSYSTEM:WINDOWS']
+        CPPFLAGS = CFLAGS[:]
+    else: # UNIX
+        if TARGET == 'x64':
+            CFLAGS += ['-m64', '-march=sandybridge', '-mavx', '-DARCH=64']
+            CPPFLAGS += ['-m64', '-march=sandybridge', '-mavx', '-DARCH=64']
+        elif TARGET == 'x86':
+            CFLAGS += ['-m32', '-march=pentium4', '-DARCH=32']
+            CPPFLAGS += ['-m32', '-march=pentium4', '-DARCH=32']
+        if DEBUG:
+            CFLAGS += ['-UNDEBUG']
+            CPPFLAGS += ['-UNDEBUG']
+        else:
+            CFLAGS += ['-DNDEBUG=1']
+            CPPFLAGS += ['-DNDEBUG=1']
+        if which(DC) != None:
+            LIBS += ['phobos2']
+    # Both NT and UNIX
     if DEBUG:
-        CFLAGS += ['-UNDEBUG']
-        CPPFLAGS += ['-UNDEBUG']
+        DFLAGS += ['-debug', '-g', '-gs', '-boundscheck=on', '-w']
     else:
-        CFLAGS += ['-DNDEBUG=1']
-        CPPFLAGS += ['-DNDEBUG=1']
-    if which(DC) != None:
-        LIBS += ['phobos2']
-# Both NT and UNIX
-if DEBUG:
-    DFLAGS += ['-debug', '-g', '-gs', '-boundscheck=on', '-w']
-else:
-    DFLAGS += ['-boundscheck=off', '-O', '-release', '-wi']
-if TARGET == 'x86':
-    DFLAGS += ['-m32', '-mcpu=baseline']
-elif TARGET == 'x64':
-    DFLAGS += ['-m64', '-mcpu=avx']
+        DFLAGS += ['-boundscheck=off', '-O', '-release', '-wi']
+    if TARGET == 'x86':
+        DFLAGS += ['-m32', '-mcpu=baseline']
+    elif TARGET == 'x64':
+        DFLAGS += ['-m64', '-mcpu=avx']
 
 def pprint(s=None, action=None, head=None):
     if head != None and head in HEADS:
@@ -310,6 +302,176 @@ def pprint(s=None, action=None, head=None):
     else:
         print(PREFIX + ' ' + s)
 
+def reportJob(job):
+    pprint(job.name, action=job.action)
+    lines = job.output.splitlines()
+    if job.status != 0:
+        for line in lines:
+            print('ERROR: ' + line)
+    else:
+        # Warnings and the like
+        for line in lines:
+            print(line)
+
+def runJobs(pool, jobs):
+    failures = pool.run(jobs, report=reportJob)
+    if len(failures) > 0:
+        raise Exception('Compilation unit failed with command ' +
+            color('', fg='white') + color(' '.join(failures[0].com),
+            fg='white'))
+
+COMPILER_IDS = {}
+
+def getCompilerId(action):
+    # Something that changes whenever the compiler does
+    if action not in COMPILER_IDS:
+        if action == 'd':
+            path = which(DC)
+            ret = DC
+            if path != None:
+                st = os.stat(path)
+                ret += ' ' + path + ' ' + str(st.st_size) + ' ' + str(
+                    st.st_mtime_ns)
+        else:
+            ret = CC + ' ' + GCC_VER
+        COMPILER_IDS[action] = ret
+    return COMPILER_IDS[action]
+
+def cacheParts(action, com, obj, depFile):
+    # Where the outputs go doesn't change what's in them
+    parts = [getCompilerId(action)]
+    for arg in com:
+        if arg == obj or arg.endswith(depFile):
+            parts += ['']
+        else:
+            parts += [arg]
+    return parts
+
+def sourceKey(cache, action, com, obj, depFile, source):
+    # Covers the command and the source alone, not what it imports
+    return cache.key(cacheParts(action, com, obj, depFile), files=[source])
+
+def cacheKey(cache, action, com, obj, depFile, source):
+    parts = cacheParts(action, com, obj, depFile)
+    if action == 'd':
+        # Cover every module the last build of this unit imported. With no
+        # deps file of its own, as after a clean, use the one kept from the
+        # last build of the same source by the same command
+        deps = parseDmdDeps(depFile)
+        if deps == None:
+            key = sourceKey(cache, action, com, obj, depFile, source)
+            kept = cache.fetchDeps(key) if key != None else None
+            if kept != None:
+                deps = parseDmdDeps(kept)
+        if deps == None:
+            return None
+        return cache.key(parts, files=[source] + deps)
+    # Preprocess the unit so the key covers every header it pulls in
+    ppCom = []
+    skip = False
+    for arg in com:
+        if skip:
+            skip = False
+        elif arg == COUTFLAG or arg == CDEPFLAGS[-1]:
+            skip = True
+        elif arg not in CDEPFLAGS:
+            ppCom += [arg]
+    status, text = captureCommand(ppCom + ['-E'])
+    if status != 0:
+        # Let the compiler report the problem
+        return None
+    return cache.key(parts, text=text)
+
+def removeFile(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def compileJob(source, action, com, obj, depFile, state, cache=None,
+after=None, extra=None, remote=None):
+    # Jobs given as after (e.g. a precompiled header) must run first, and
+    # anything they rebuild makes this unit out of date too
+    after = after if after != None else []
+    if state == None:
+        job = Job(source, action, partial(runCommand, com), com, after)
+        job.target = obj
+        return [job]
+    # Nothing to do if the object is already up to date
+    if len(after) == 0 and state.upToDate(obj, source, depFile, com,
+    dmd=action == 'd', extra=extra):
+        return []
+    state.invalidate(obj)
+    def func():
+        # The old object may be hardlinked into the cache, so it must never
+        # be written over in place
+        removeFile(obj)
+        key = None
+        if cache != None:
+            key = cacheKey(cache, action, com, obj, depFile, source)
+            if key == None:
+                cache.miss()
+            elif cache.fetch(key, obj, depFile):
+                state.record(obj, com)
+                return (0, '')
+        if remote != None and action in ['c', 'c++']:
+            ret = remote.run(com, action, source, obj, depFile)
+        else:
+            ret = runCommand(com)
+        if ret[0] == 0:
+            state.record(obj, com)
+            if cache != None:
+                if action == 'd':
+                    # The imports may have changed; key on the new ones,
+                    # and keep them for a build without this deps file
+                    key = cacheKey(cache, action, com, obj, depFile, source)
+                    deps = sourceKey(cache, action, com, obj, depFile,
+                        source)
+                    if deps != None:
+                        cache.storeDeps(deps, depFile)
+                if key != None:
+                    cache.store(key, obj, depFile)
+        return ret
+    job = Job(source, action, func, com, after)
+    job.target = obj
+    return [job]
+
+def linkJob(name, com, objGlob, deps, outPath, objDir, libPaths):
+    job = Job(name, 'link', None, com, deps)
+    job.target = outPath
+    def func():
+        # The objects only exist once the compile jobs have run
+        objs = sorted(glob.glob(objGlob, recursive=True))
+        job.com = LINK + objs + com
+        # Relink only if an object, sibling library or flag has changed
+        manifest = LinkManifest(objDir)
+        inputs = getFileStats(objs + libPaths)
+        if manifest.matches(job.com, inputs, outPath):
+            return None
+        ret = runCommand(job.com)
+        if ret[0] == 0:
+            manifest.save(job.com, inputs)
+        return ret
+    job.func = func
+    return job
+
+# Command-line switches that take a value, and the option each one sets
+VALUE_OPTS = {
+    '-j':        'jobs',
+    '--jobs':    'jobs',
+    '--socket':  'socket',
+    '--trace':   'trace',
+    '-o':        'output',
+    '--output':  'output',
+    '--workers': 'workers'
+}
+# Command-line switches that stand on their own
+FLAG_OPTS = {
+    '-B':        'rebuild',
+    '--rebuild': 'rebuild',
+    '--cache':   'cache'
+}
+
 def usingUTF8():
     if os.name == 'nt':
         if sys.stdout.encoding != 'cp65001':
@@ -317,31 +479,36 @@ def usingUTF8():
             return False
     return True
 
-def getSources(srcDir, langs, headers=False):
-    # Gather all applicable file extensions
-    exts = []
+def classifySource(name):
+    # Work out the language of a source or header from its name
+    match = RE_ISSRC.fullmatch(name)
+    if match == None:
+        return None
+    ext = match.group(1)
+    if RE_ISCPP.search(name) != None:
+        return 'h++' if ext[0] == 'h' else 'c++'
+    return ext
+
+def pickSources(sources, langs, headers=False):
+    # Gather all applicable files from a SourceIndex scan
+    files = []
     if 'c' in langs:
-        exts += ['c']
+        files += sources['c']
         if headers:
-            exts += ['h']
+            files += sources['h']
     if 'c++' in langs:
-        exts += ['cc', 'cpp', 'cxx', 'c++']
+        files += sources['c++']
         if headers:
             if 'c' not in langs:
-                exts += ['h']
-            exts += ['hh', 'hpp', 'hxx', 'h++']
+                files += sources['h']
+            files += sources['h++']
     if 'd' in langs:
-        exts += ['d']
+        files += sources['d']
         if headers:
-            exts += ['di']
-    globBegin = os.path.join('.', srcDir, '**', '*.')
-    # Do the globbing
-    files = []
-    for ext in exts:
-        files += glob.glob(globBegin + ext, recursive=True)
+            files += sources['di']
     return files
 
-def projectInit(projDir):
+def projectInit(projDir, iniCache=None):
     # Ensure INIs all exist
     projectIniPath = os.path.join(projDir, 'project.ini')
     if os.path.isfile(projectIniPath) == False:
@@ -351,9 +518,9 @@ def projectInit(projDir):
         raise Exception('\u2018' + assetsIniPath + '\u2019 is inaccessible.')
     # Parse all of the INIs
     #print('Project INI...')
-    projectIni = ini.parse(projectIniPath)
+    projectIni = ini.parse(projectIniPath, iniCache)
     #print('Assets INI...')
-    assetsIni = ini.parse(assetsIniPath)
+    assetsIni = ini.parse(assetsIniPath, iniCache)
     #print('Done.')
     # Ensure schema is supported
     if(int(projectIni['']['version']) > 0
@@ -371,343 +538,930 @@ def projectInit(projDir):
         langs = [_langs]
     return (projectIni, assetsIni, srcDir, incDir, langs)
 
-def lint(projectIni, srcDir):
+def writeIfChanged(path, text):
+    # Leave the file alone if it already says this, to keep its mtime
+    try:
+        f = open(path, 'r')
+        same = f.read() == text
+        f.close()
+        if same:
+            return
+    except OSError:
+        pass
+    f = open(path, 'w')
+    f.write(text)
+    f.close()
+
+def getUnitySources(project, lang, objDir, write=True):
+    # Batch C or C++ sources into unity units of around Unity= files each;
+    # unless told not to write, the units are brought up to date on disk
+    sources = pickSources(project['sources'], [lang])
+    size = project['projIni']['source'].get('unity', '0')
+    try:
+        size = int(size)
+    except ValueError:
+        raise Exception('Unity batch size \u2018' + size + '\u2019 is ' +
+            'not an integer')
+    if size < 2:
+        return sources
+    # Excluded sources are still compiled, just on their own
+    exclude = []
+    for pattern in project['projIni']['source'].get('unityexclude',
+    '').split(','):
+        if pattern.strip() != '':
+            exclude += [pattern.strip().replace('/', os.sep)]
+    ret = []
+    batched = []
+    for source in sources:
+        relPath = os.path.relpath(source, project['srcPath'])
+        for pattern in exclude:
+            if (fnmatch.fnmatch(relPath, pattern)
+            or fnmatch.fnmatch(os.path.basename(source), pattern)):
+                ret += [source]
+                break
+        else:
+            batched += [source]
+    if len(batched) < 2:
+        return ret + batched
+    # Cut the sorted list after any file whose path hashes to a boundary,
+    # about one in every Unity= files, so where a batch ends depends on
+    # that file alone: adding or removing a file only changes its own batch
+    # (or splits or joins two). Batches are named after their last file,
+    # so the others keep their names, and so their objects, as they are
+    ext = 'c' if lang == 'c' else 'cpp'
+    batches = [[]]
+    for source in batched:
+        relPath = os.path.relpath(source, project['srcPath']).replace('\\',
+            '/')
+        digest = hashlib.blake2b(relPath.encode(), digest_size=8)
+        batches[-1] += [(source, digest.hexdigest())]
+        if (int(digest.hexdigest(), 16) % size == 0
+        or len(batches[-1]) >= size * 2):
+            batches += [[]]
+    paths = set()
+    for batch in batches:
+        if len(batch) < 2:
+            ret += [source for source, digest in batch]
+            continue
+        text = ''
+        for source, digest in batch:
+            text += '#include "' + os.path.abspath(source).replace('\\',
+                '/') + '"\n'
+        path = os.path.join(objDir, 'unity-' + ext + '-' + batch[-1][1] +
+            '.' + ext)
+        if write:
+            writeIfChanged(path, text)
+        paths.add(path)
+        ret += [path]
+    if not write:
+        return ret
+    # Drop units left over from batches that no longer exist
+    for path in glob.glob(os.path.join(objDir, 'unity-' + ext + '-*.' + ext)):
+        if path not in paths:
+            removeFile(path)
+    return ret
+
+def getPrecompiledHeader(project, incPaths):
+    # Find the header named by PrecompiledHeader=, if there is one
+    name = project['projIni']['source'].get('precompiledheader', '')
+    if name == '':
+        return None
+    name = name.replace('/', os.sep)
+    for dir in [project['srcPath']] + incPaths:
+        path = os.path.join(dir, name)
+        if os.path.isfile(path):
+            return path
+    raise Exception('Precompiled header \u2018' + name + '\u2019 could ' +
+        'not be found')
+
+def precompileCommand(header, flags, objDir, write=True):
+    # GCC uses foo.hh.gch in place of foo.hh when it can. The .gch is
+    # built from a stub that includes the real header, so if it can't be
+    # used (e.g. it's stale) the stub is read instead and nothing breaks
+    config = ('debug' if DEBUG else 'release') + '-' + TARGET
+    pchDir = os.path.join(objDir, 'pch-' + config)
+    stub = os.path.join(pchDir, os.path.basename(header))
+    if write:
+        os.makedirs(pchDir, exist_ok=True)
+        writeIfChanged(stub, '#include "' + os.path.abspath(
+            header).replace('\\', '/') + '"\n')
+    gch = stub + '.gch'
+    com = [CXX] + flags + ['-x', 'c++-header', COUTFLAG, gch] + \
+        CDEPFLAGS + [stub + '.d', stub]
+    return (stub, gch, com)
+
+def pruneObjects(objDir, objs):
+    # Objects nothing is built into any more (such as from before Unity=
+    # was changed) would otherwise still be linked
+    keep = set(objs)
+    for path in glob.glob(os.path.join(objDir, '**', '*' + OBJEXT),
+    recursive=True):
+        if path not in keep:
+            removeFile(path)
+
+def getProjectDeps(projects):
+    # Map each project to the sibling projects named in its Depends= entry
+    names = {}
+    for key in projects:
+        names[key] = key
+        names[projects[key]['projIni']['']['name'].lower()] = key
+    ret = {}
+    for key in projects:
+        ret[key] = []
+        projIni = projects[key]['projIni']
+        if 'depends' not in projIni['']:
+            continue
+        for dep in projIni['']['depends'].lower().split(','):
+            dep = names.get(dep.strip())
+            if dep != None and dep != key and dep not in ret[key]:
+                ret[key] += [dep]
+    return ret
+
+def sortProjects(projectNames, projectDeps):
+    # Order the projects so each one follows the siblings it depends on
+    ret = []
+    visiting = []
+    def visit(name):
+        if name in ret:
+            return
+        if name in visiting:
+            raise Exception('Circular project dependency: ' +
+                ' -> '.join(visiting[visiting.index(name):] + [name]))
+        visiting.append(name)
+        for dep in projectDeps[name]:
+            visit(dep)
+        visiting.pop()
+        ret.append(name)
+    for name in projectNames:
+        visit(name)
+    return ret
+
+def lintCommand(com, source, trace=None):
+    start = time.perf_counter()
+    resetPeakRss()
+    status, output = runCommand(com)
+    if trace != None:
+        trace.add(source, 'lint', start, time.perf_counter(), status,
+            getPeakRss())
+    if status != 0:
+        for line in output.splitlines():
+            print('ERROR: ' + line)
+        raise Exception('Linting failed with command ' +
+            color(' '.join(com), fg='white'))
+
+def lint(sources, index=None, trace=None):
+    # Files left alone since they were last linted are skipped
     binSuffix = ''
     if os.name == 'nt':
         binSuffix = '.exe'
-    _srcDir = os.path.join(srcDir, projectIni['']['name'],
-        projectIni['source']['sourcedir'])
     if which('clang-format' + binSuffix) != None:
-        sources = getSources(_srcDir, ['c', 'c++'], True)
-        for source in sources:
+        for source in pickSources(sources, ['c', 'c++'], True):
+            if index != None and index.isLinted(source):
+                continue
             pprint(source, action='lint')
-            run('clang-format' + binSuffix + ' -i -style=file ' + source,
-                shell=True, check=True, stdout=PIPE)
+            lintCommand(['clang-format' + binSuffix, '-i', '-style=file',
+                source], source, trace)
+            if index != None:
+                index.markLinted(source)
     if which('dfmt' + binSuffix) != None:
-        sources = getSources(srcDir, ['d'], True)
-        for source in sources:
+        for source in pickSources(sources, ['d'], True):
+            if index != None and index.isLinted(source):
+                continue
             pprint(source, action='lint')
-            run('dfmt' + binSuffix + ' ' + source, shell=True, check=True,
-                stdout=PIPE)
+            lintCommand(['dfmt' + binSuffix, source], source, trace)
+            if index != None:
+                index.markLinted(source)
 
-def main(args):
-    # UTF-8 is off on Windows by default
-    if not usingUTF8(): # This fixes it if it's off, though
-        print('Changed the codepage to UTF-8. Please rerun this script.')
-        return 0
-    for line in STARTUP:
-        pprint(line)
-    argc = len(args) # Save CPU
-    if argc < 3:
+def checkBuildType(buildType):
+    # Either debug/release (w/ optional architecture), or we're linting
+    if re.fullmatch(r'((debug|release)(32|64)?)|lint', buildType) == None:
+        raise Exception('Provided build type is invalid')
+
+def checkArgs(args):
+    if len(args) < 3:
         raise Exception('Insufficient arguments provided')
     if not os.path.isfile(args[1]):
         raise Exception('Provided INI file is inaccessible')
-    # The solution config file
-    mainIni = ini.parse(args[1])
+    checkBuildType(args[2])
+
+def loadWorkspace(iniPath, write=True):
+    # The solution config file. Unless told not to write, the source
+    # indexes and any INI cache are saved as well
+    iniCache = None if write else ''
+    mainIni = ini.parse(iniPath, iniCache)
     if int(mainIni['']['version']) > 0:
         # v0 is the latest, as far as we know
         raise Exception('Future INI schema version found; not supported')
-    # Either debug/release (w/ optional architecture), or we're linting
-    if re.fullmatch(r'((debug|release)(32|64)?)|lint', args[2]) == None:
-        raise Exception('Provided build type is invalid')
-    pprint(head='prep')
-    # Get the project list, ordered for dependency satisfaction
-    projectNames = mainIni['']['order'].lower().split(',')
-    i = 0
-    projectCt = len(projectNames) # Save CPU
-    taskName = 'build'
+    # Get the project list; dependencies between them are worked out from
+    # each project's Depends= entry, so any order will do
+    if 'order' in mainIni['']:
+        projectNames = mainIni['']['order'].lower().split(',')
+    else:
+        projectNames = list(mainIni['projects'])
     projects = {}
+    iniFiles = [iniPath]
     # Get settings for all the projects
-    while i < projectCt:
-        project = projectInit(mainIni['projects'][projectNames[i]])
-        data = {
-            projectNames[i]: {
-                'projIni': project[0],
-                'assetIni': project[1],
-                'srcDir': project[2],
-                'incDir': project[3],
-                'langs': project[4]
-            }
+    for name in projectNames:
+        projDir = mainIni['projects'][name]
+        project = projectInit(projDir, iniCache)
+        iniFiles += [os.path.join(projDir, 'project.ini'),
+            os.path.join(projDir, 'assets.ini')]
+        # Direct path to source code
+        srcPath = os.path.join(projDir.replace('/', os.sep),
+            project[2].replace('/', os.sep))
+        # Only directories that changed since last time get listed again
+        index = SourceIndex(srcPath, os.path.join(project[0]['output'][
+            'path'], 'code', name, INDEX_FILE), classifySource)
+        projects[name] = {
+            'projIni': project[0],
+            'assetIni': project[1],
+            'srcDir': project[2],
+            'incDir': project[3],
+            'langs': project[4],
+            'srcPath': srcPath,
+            'index': index,
+            # Shared by everything that needs to know about the sources
+            'sources': index.scan()
         }
-        projects = {**projects, **data}
+        if write:
+            index.save()
+    # Headers shared by every project are only looked at to notice changes
+    indexes = [project['index'] for project in projects.values()]
+    if 'includedir' in mainIni['']:
+        incPath = mainIni['']['includedir'].replace('/', os.sep)
+        indexes += [SourceIndex(incPath, None, classifySource)]
+        indexes[-1].scan()
+    return {
+        'iniPath': iniPath,
+        'mainIni': mainIni,
+        # Make sure each project comes after the siblings it links against
+        'projectNames': sortProjects(projectNames,
+            getProjectDeps(projects)),
+        'projects': projects,
+        'indexes': indexes,
+        'iniFiles': iniFiles,
+        'iniStats': getFileStats(iniFiles)
+    }
+
+def watchWorkspace(workspace):
+    # Have inotify keep every index exact, where it's available
+    for index in workspace['indexes']:
+        try:
+            index.attach(Inotify())
+        except (AttributeError, OSError):
+            return False
+    return True
+
+def closeWorkspace(workspace):
+    for index in workspace['indexes']:
+        index.detach()
+
+def refreshWorkspace(workspace):
+    # Pick up whatever changed on disk since the last build
+    if getFileStats(workspace['iniFiles']) != workspace['iniStats']:
+        fresh = loadWorkspace(workspace['iniPath'])
+        watched = workspace['indexes'][0].watcher != None
+        closeWorkspace(workspace)
+        workspace.update(fresh)
+        if watched:
+            watchWorkspace(workspace)
+        return
+    for project in workspace['projects'].values():
+        project['sources'] = project['index'].scan()
+        project['index'].save()
+    # The rest are never built from, and only there to notice changes
+    for index in workspace['indexes'][len(workspace['projects']):]:
+        index.scan()
+
+def getSnapshot(workspace):
+    # Enough to notice any change, for when inotify can't tell us
+    ret = [getFileStats(workspace['iniFiles'])]
+    for index in workspace['indexes']:
+        ret += [getFileStats(pickSources(index.scan(), ['c', 'c++', 'd'],
+            True))]
+    return ret
+
+# How often to look for changes when not told about them, in seconds
+POLL_INTERVAL = 1.0
+# How long to let a burst of changes (e.g. saving every file) settle
+SETTLE_TIME = 0.1
+
+def waitForChanges(workspace):
+    watchers = []
+    for index in workspace['indexes']:
+        if index.watcher != None:
+            watchers += [index.watcher]
+    snapshot = None
+    if len(watchers) == 0:
+        snapshot = getSnapshot(workspace)
+    while True:
+        if len(watchers) > 0:
+            ready, _, _ = select.select(watchers, [], [], POLL_INTERVAL)
+            if len(ready) > 0:
+                time.sleep(SETTLE_TIME)
+                return
+            if getFileStats(workspace['iniFiles']) != workspace['iniStats']:
+                return
+        else:
+            time.sleep(POLL_INTERVAL)
+            if getSnapshot(workspace) != snapshot:
+                return
+
+def lintProjects(workspace, trace=None):
+    for name in workspace['projectNames']:
+        project = workspace['projects'][name]
+        pprint(project['projIni']['']['name'], action='lint')
+        try:
+            lint(project['sources'], project['index'], trace)
+        finally:
+            project['index'].save()
+
+def getSourceCommands(project, lang, com, units, objDir):
+    # Compilation database entries for each real source, whether it is
+    # compiled on its own or only through one of the unity units
+    ret = []
+    for source in pickSources(project['sources'], [lang]):
+        entry = {'directory': os.getcwd(), 'arguments': com + [source],
+            'file': source}
+        if source in units:
+            # Only sources compiled on their own have an object to name
+            obj = os.path.join(objDir, os.path.basename(source) + OBJEXT)
+            if os.name != 'nt':
+                entry['arguments'] = com + [COUTFLAG, obj, source]
+            entry['output'] = obj
+        ret += [entry]
+    return ret
+
+def planJobs(workspace, options, incremental=True, remote=None,
+compileDb=None, write=True):
+    # Work out every compile and link job. A plan that isn't incremental
+    # holds every unit; one told not to write leaves the disk alone, not
+    # even making directories or generated sources. Given a list, also
+    # fills it with compilation database entries
+    mainIni = workspace['mainIni']
+    projectNames = workspace['projectNames']
+    projects = workspace['projects']
+    projectCt = len(projectNames) # Save CPU
+    i = 0
+    # Get project source directories for internal dependency inclusion
+    localIncPaths = []
+    while i < projectCt:
+        project = projects[projectNames[i]]
+        localIncPaths += [os.path.join(project['srcDir'],
+            project['projIni']['']['name'],
+            project['projIni']['source']['sourcedir'])]
         i += 1
     i = 0
-    pprint(head='start')
-    try:
-        if args[2] == 'lint':
-            taskName = 'lint' # Used if things go wrong
-            while i < projectCt:
-                project = projects[projectNames[i]]
-                pprint(project['projIni']['']['name'], action='lint')
-                # 0 = project INI, 2 = source directory
-                lint(project['projIni'], project['srcDir'])
-                i += 1
-        else: # compiling instead
-            # Get project source directories for internal dependency inclusion
-            localIncPaths = []
-            while i < projectCt:
-                project = projects[projectNames[i]]
-                localIncPaths += [os.path.join(project['srcDir'],
-                    project['projIni']['']['name'],
-                    project['projIni']['source']['sourcedir'])]
-                i += 1
-            i = 0
-            while i < projectCt:
-                # Set up all project variables:-
-                project = projects[projectNames[i]]
-                # Applicable code languages in project
-                pLangs = project['langs']
-                # 'executable', 'shared', or 'static'
-                pFormat = project['projIni']['output']['type']
-                # list of libraries to link
-                pLibs = LIBS[:] # Duplicate array
-                if 'depends' in project['projIni']['']:
-                    # Include all dependencies in library list
-                    _libs = []
-                    if ',' in project['projIni']['']['depends']:
-                        _libs += project['projIni']['']['depends'].split(',')
-                    else:
-                        _libs += [project['projIni']['']['depends']]
-                    if os.name == 'nt':
-                        j = 0
-                        _libsCt = len(_libs)
-                        while j < _libsCt:
-                            _libs[j] = _libs[j].replace('sfml-', 'sfml')
-                            j += 1
-                    pLibs += _libs
-                # Full path for output binary, including name
-                _name = project['projIni']['output']['name']
-                if os.name != 'nt' and pFormat != 'executable':
-                    _name = 'lib' + _name
-                pOutPath = os.path.join(project['projIni']['output']['path'],
-                    _name)
-                # Language-agnostic location for object code
-                pObjPath = os.path.join(project['projIni']['output']['path'],
-                    'code', projectNames[i])
-                if not os.path.exists(pObjPath):
+    projectDeps = getProjectDeps(projects)
+    allJobs = []
+    linkJobs = {}
+    outPaths = {}
+    states = []
+    mtimes = MtimeCache()
+    # Share objects between builds, if asked to
+    cache = None
+    if incremental and os.name != 'nt' and ('cache' in options
+    or os.getenv('OCO_CACHE_DIR')):
+        cache = ObjectCache(getCacheDir(), getCacheSize())
+    while i < projectCt:
+        # Set up all project variables:-
+        project = projects[projectNames[i]]
+        if project['index'].live():
+            # A watched index already knows the time of every source
+            mtimes.seed(project['index'].mtimes())
+        # Applicable code languages in project
+        pLangs = project['langs']
+        # 'executable', 'shared', or 'static'
+        pFormat = project['projIni']['output']['type']
+        # list of libraries to link
+        pLibs = LIBS[:] # Duplicate array
+        if 'depends' in project['projIni']['']:
+            # Include all dependencies in library list
+            _libs = []
+            if ',' in project['projIni']['']['depends']:
+                _libs += project['projIni']['']['depends'].split(',')
+            else:
+                _libs += [project['projIni']['']['depends']]
+            if os.name == 'nt':
+                j = 0
+                _libsCt = len(_libs)
+                while j < _libsCt:
+                    _libs[j] = _libs[j].replace('sfml-', 'sfml')
+                    j += 1
+            pLibs += _libs
+        # Full path for output binary, including name
+        _name = project['projIni']['output']['name']
+        if os.name != 'nt' and pFormat != 'executable':
+            _name = 'lib' + _name
+        pOutPath = os.path.join(project['projIni']['output']['path'],
+            _name)
+        # Language-agnostic location for object code
+        pObjPath = os.path.join(project['projIni']['output']['path'],
+            'code', projectNames[i])
+        if write and not os.path.exists(pObjPath):
+            if os.name == 'nt':
+                # Ya gotta keep 'em separated
+                if 'c' in pLangs or 'c++' in pLangs:
+                    os.makedirs(os.path.join(pObjPath, 'c'))
+                if 'd' in pLangs:
+                    os.makedirs(os.path.join(pObjPath, 'd'))
+            else:
+                os.makedirs(pObjPath)
+        # Paths for C(++) #includes and D imports
+        pIncPaths = [os.path.join(mainIni['']['includedir'
+            ].replace('/', os.sep), project['incDir'].replace('/',
+            os.sep)), mainIni['']['includedir'].replace('/',
+            os.sep)] + INCDIRS + localIncPaths
+        pObjGlob = os.path.join(pObjPath, '**', '*' + OBJEXT)
+        libDepsPath = ''
+        if os.name == 'nt':
+            # Manually include external dependencies, since Windows
+            # leaves us on our own with that
+            libDepsPath = '.\\deps\\lib'
+            if IS64BIT:
+                libDepsPath += '64'
+            else:
+                libDepsPath += '32'
+            if DEBUG:
+                libDepsPath += '\\debug'
+            else:
+                libDepsPath += '\\release'
+            if write and os.path.isdir(libDepsPath):
+                allDeps = os.listdir(libDepsPath)
+                for dep in allDeps:
+                    if dep.lower().endswith('.dll'):
+                        shutil.copy2(libDepsPath + '\\' + dep,
+                            project['projIni']['output']['path'])
+        # Compile units for this project, run through the job pool
+        jobs = []
+        # Every object the project is made of, whether rebuilt or not
+        objs = []
+        # Only units that are out of date get rebuilt
+        state = None
+        if incremental and os.name != 'nt':
+            state = BuildState(pObjPath, mtimes,
+                'rebuild' in options)
+            states += [state]
+        for lang in pLangs:
+            # Compile all C code
+            if lang == 'c':
+                flags = CFLAGS[:] # dup() array
+                if os.name == 'nt':
+                    # Path must end with a backslash for CL.EXE
+                    # Separate C(++) code from D code because of .obj
+                    flags += [COUTFLAG + pObjPath + '\\c\\']
+                for incDir in pIncPaths:
                     if os.name == 'nt':
-                        # Ya gotta keep 'em separated
-                        if 'c' in pLangs or 'c++' in pLangs:
-                            os.makedirs(os.path.join(pObjPath, 'c'))
-                        if 'd' in pLangs:
-                            os.makedirs(os.path.join(pObjPath, 'd'))
+                        flags += [CINCFLAG + incDir]
                     else:
-                        os.makedirs(pObjPath)
-                # Direct path to source code
-                pSrcPath = os.path.join(mainIni['projects'][projectNames[i
-                    ]].replace('/', os.sep), project['srcDir'].replace('/',
-                    os.sep))
-                # Paths for C(++) #includes and D imports
-                pIncPaths = [os.path.join(mainIni['']['includedir'
-                    ].replace('/', os.sep), project['incDir'].replace('/',
-                    os.sep)), mainIni['']['includedir'].replace('/',
-                    os.sep)] + INCDIRS + localIncPaths
-                pObjGlob = os.path.join(pObjPath, '**', '*' + OBJEXT)
-                libDepsPath = ''
+                        flags += [CINCFLAG, incDir]
                 if os.name == 'nt':
-                    # Manually include external dependencies, since Windows
-                    # leaves us on our own with that
-                    libDepsPath = '.\\deps\\lib'
-                    if IS64BIT:
-                        libDepsPath += '64'
-                    else:
-                        libDepsPath += '32'
+                    # MT = multithreaded app
+                    # MD = multithreaded library
+                    # d suffix = debugging
                     if DEBUG:
-                        libDepsPath += '\\debug'
+                        if pFormat == 'executable':
+                            flags += ['/MTd']
+                        elif pFormat == 'shared':
+                            flags += ['/MDd']
                     else:
-                        libDepsPath += '\\release'
-                    if os.path.isdir(libDepsPath):
-                        allDeps = os.listdir(libDepsPath)
-                        for dep in allDeps:
-                            if dep.lower().endswith('.dll'):
-                                shutil.copy2(libDepsPath + '\\' + dep,
-                                    project['projIni']['output']['path'])
-                for lang in pLangs:
-                    # Compile all C code
-                    if lang == 'c':
-                        flags = CFLAGS[:] # dup() array
-                        if os.name == 'nt':
-                            # Path must end with a backslash for CL.EXE
-                            # Separate C(++) code from D code because of .obj
-                            flags += [COUTFLAG + pObjPath + '\\c\\']
-                        else:
-                            flags += [COUTFLAG, pObjPath]
-                        for incDir in pIncPaths:
-                            if os.name == 'nt':
-                                flags += [CINCFLAG + incDir]
-                            else:
-                                flags += [CINCFLAG, incDir]
-                        if os.name == 'nt':
-                            # MT = multithreaded app
-                            # MD = multithreaded library
-                            # d suffix = debugging
-                            if DEBUG:
-                                if pFormat == 'executable':
-                                    flags += ['/MTd']
-                                elif pFormat == 'shared':
-                                    flags += ['/MDd']
-                            else:
-                                if pFormat == 'executable':
-                                    flags += ['/MT']
-                                elif pFormat == 'shared':
-                                    flags += ['/MD']
-                        sources = getSources(pSrcPath, ['c'])
-                        for source in sources:
-                            source = source.replace('.' + os.sep, '')
-                            com = [CC] + flags
-                            if os.name != 'nt':
-                                com += [COUTFLAG, os.path.join(pObjPath,
-                                    os.path.basename(source) + OBJEXT)]
-                            com += [source]
-                            pprint(source, action='c')
-                            try:
-                                run(' '.join(com), shell=True, check=True,
-                                    stdout=PIPE)
-                            except CalledProcessError as ex:
-                                lines = ex.stdout.decode().splitlines()
-                                for line in lines:
-                                    print('ERROR: ' + line)
-                                raise Exception('Compilation unit failed ' +
-                                    'with command ' + color('', fg='white') +
-                                    color(' '.join(com), fg='white'))
-                    # Compile all project C++ code
-                    elif lang == 'c++':
-                        flags = CPPFLAGS[:] # Duplicate array
-                        if os.name == 'nt':
-                            # Path must end with a backslash for CL.EXE
-                            # Separate C(++) code from D code because of .obj
-                            flags += [COUTFLAG + pObjPath + '\\c\\']
-                        for incDir in pIncPaths:
-                            if os.name == 'nt':
-                                flags += [CINCFLAG + incDir]
-                            else:
-                                flags += [CINCFLAG, incDir]
-                        if os.name == 'nt':
-                            # See notes above for flag meanings
-                            if DEBUG:
-                                if pFormat == 'executable':
-                                    flags += ['/MTd']
-                                elif pFormat == 'shared':
-                                    flags += ['/MDd']
-                            else:
-                                if pFormat == 'executable':
-                                    flags += ['/MT']
-                                elif pFormat == 'shared':
-                                    flags += ['/MD']
-                        sources = getSources(pSrcPath, ['c++'])
-                        for source in sources:
-                            source = source.replace('.' + os.sep, '')
-                            com = [CXX] + flags
-                            if os.name != 'nt':
-                                com += [COUTFLAG, os.path.join(pObjPath,
-                                    os.path.basename(source) + OBJEXT)]
-                            com += [source]
-                            pprint(source, action='c++')
-                            try:
-                                run(' '.join(com), shell=True, check=True,
-                                    stdout=PIPE)
-                            except CalledProcessError as ex:
-                                lines = ex.stdout.decode().splitlines()
-                                for line in lines:
-                                    print('ERROR: ' + line)
-                                raise Exception('Compilation unit failed ' +
-                                    'with command ' + color('', fg='white') +
-                                    color(' '.join(com), fg='white'))
-                    # Compile all project D code
-                    elif lang == 'd':
-                        # Separate D code from C(++) because of .obj
-                        flags = DFLAGS
-                        if os.name == 'nt':
-                            flags += [DOUTFLAG + pObjPath + '\\d\\']
-                        else:
-                            flags += [DOUTFLAG + pObjPath]
-                        if pFormat == 'shared':
-                            flags += ['-shared']
-                        for incDir in pIncPaths:
-                            flags += [DINCFLAG + incDir]
-                        sources = getSources(pSrcPath, ['d'])
-                        for source in sources:
-                            source = source.replace('.' + os.sep, '')
-                            # Ignore these, only DMD cares about them
-                            # They overwrite each other anyway
-                            if source.endswith('package.d'):
-                                continue
-                            com = [DC, source] + flags
-                            pprint(source, action='d')
-                            try:
-                                run(' '.join(com), shell=True, check=True,
-                                    stdout=PIPE)
-                            except CalledProcessError as ex:
-                                lines = ex.stdout.decode().splitlines()
-                                for line in lines:
-                                    print('ERROR: ' + line)
-                                raise Exception('Compilation unit failed ' +
-                                    'with command ' + color('', fg='white') +
-                                    color(' '.join(com), fg='white'))
-                # Link the project
-                com = [LINK] + glob.glob(pObjGlob, recursive=True)
-                # Append a file extension if needed
+                        if pFormat == 'executable':
+                            flags += ['/MT']
+                        elif pFormat == 'shared':
+                            flags += ['/MD']
+                sources = getUnitySources(project, 'c', pObjPath, write)
+                for source in sources:
+                    com = [CC] + flags
+                    obj = os.path.join(pObjPath,
+                        os.path.basename(source) + OBJEXT)
+                    depFile = os.path.splitext(obj)[0] + '.d'
+                    if os.name != 'nt':
+                        com += [COUTFLAG, obj] + CDEPFLAGS + [depFile]
+                    com += [source]
+                    jobs += compileJob(source, 'c', com, obj,
+                        depFile, state, cache, remote=remote)
+                    objs += [obj]
+                if compileDb != None:
+                    compileDb += getSourceCommands(project, 'c', [CC] + flags,
+                        sources, pObjPath)
+            # Compile all project C++ code
+            elif lang == 'c++':
+                flags = CPPFLAGS[:] # Duplicate array
                 if os.name == 'nt':
-                    if pFormat == 'executable':
-                        pOutPath += '.exe'
-                    elif pFormat == 'shared':
-                        pOutPath += '.dll'
-                        # Windows needs this
-                        com += ['/DLL']
-                    elif pFormat == 'static':
-                        pOutPath += '.lib'
-                    # Give the output path to the linker
-                    com += [LINKOUTFLAG + pOutPath]
-                else:
-                    if pFormat == 'shared':
-                        pOutPath += '.so'
-                        com += ['-shared']
-                    elif pFormat == 'static':
-                        pOutPath += '.a'
-                    com += [LINKOUTFLAG, pOutPath]
-                # Add common linker flags
-                com += LINKFLAGS
-                if libDepsPath != '':
-                    # This is for external dependency linkage
-                    com += [LINKDIRFLAG + libDepsPath]
-                # Add build directory to lib search paths
-                com += [LINKDIRFLAG + project['projIni']['output']['path']]
-                for libPath in LIBDIRS:
-                    # Add common lib search paths
-                    com += [LINKDIRFLAG + libPath]
-                # Add external dependency libs
-                for lib in pLibs:
+                    # Path must end with a backslash for CL.EXE
+                    # Separate C(++) code from D code because of .obj
+                    flags += [COUTFLAG + pObjPath + '\\c\\']
+                for incDir in pIncPaths:
                     if os.name == 'nt':
-                        # On Windows, boost is compiled funny. Check that
-                        if lib.startswith('boost'):
-                            com += [LINKLIBFLAG + lib + BOOST_SUF +
-                                '.lib']
-                        else:
-                            com += [LINKLIBFLAG + lib + '.lib']
+                        flags += [CINCFLAG + incDir]
                     else:
-                        com += [LINKLIBFLAG + lib]
-                pprint(project['projIni']['output']['name'], action='link')
-                # Link!
-                try:
-                    run(' '.join(com), shell=True, check=True,
-                        stdout=PIPE)
-                except CalledProcessError as ex:
-                    lines = ex.stdout.decode().splitlines()
-                    for line in lines:
-                        print('ERROR: ' + line)
-                    raise Exception('Compilation unit failed ' +
-                        'with command ' + color('', fg='white') +
-                        color(' '.join(com), fg='white'))
-                i += 1
+                        flags += [CINCFLAG, incDir]
+                if os.name == 'nt':
+                    # See notes above for flag meanings
+                    if DEBUG:
+                        if pFormat == 'executable':
+                            flags += ['/MTd']
+                        elif pFormat == 'shared':
+                            flags += ['/MDd']
+                    else:
+                        if pFormat == 'executable':
+                            flags += ['/MT']
+                        elif pFormat == 'shared':
+                            flags += ['/MD']
+                # Parse the project's common header once, up front
+                pch = []
+                pchFiles = None
+                dbFlags = flags
+                header = getPrecompiledHeader(project, pIncPaths)
+                if header != None and os.name != 'nt':
+                    stub, gch, com = precompileCommand(header, flags,
+                        pObjPath, write)
+                    pch = compileJob(stub, 'pch', com, gch, stub + '.d',
+                        state, cache)
+                    jobs += pch
+                    pchFiles = [gch]
+                    flags = flags + ['-Winvalid-pch', '-include', stub]
+                    # Tools reading the database can't use GCC's .gch
+                    dbFlags = dbFlags + ['-include', header]
+                sources = getUnitySources(project, 'c++', pObjPath,
+                    write)
+                for source in sources:
+                    com = [CXX] + flags
+                    obj = os.path.join(pObjPath,
+                        os.path.basename(source) + OBJEXT)
+                    depFile = os.path.splitext(obj)[0] + '.d'
+                    if os.name != 'nt':
+                        com += [COUTFLAG, obj] + CDEPFLAGS + [depFile]
+                    com += [source]
+                    jobs += compileJob(source, 'c++', com, obj,
+                        depFile, state, cache, pch, pchFiles, remote)
+                    objs += [obj]
+                if compileDb != None:
+                    compileDb += getSourceCommands(project, 'c++',
+                        [CXX] + dbFlags, sources, pObjPath)
+            # Compile all project D code
+            elif lang == 'd':
+                # Separate D code from C(++) because of .obj
+                flags = DFLAGS[:] # Duplicate array
+                if os.name == 'nt':
+                    flags += [DOUTFLAG + pObjPath + '\\d\\']
+                else:
+                    flags += [DOUTFLAG + pObjPath]
+                if pFormat == 'shared':
+                    flags += ['-shared']
+                for incDir in pIncPaths:
+                    flags += [DINCFLAG + incDir]
+                sources = pickSources(project['sources'], ['d'])
+                for source in sources:
+                    # Ignore these, only DMD cares about them
+                    # They overwrite each other anyway
+                    if source.endswith('package.d'):
+                        continue
+                    obj = os.path.join(pObjPath, os.path.splitext(
+                        os.path.basename(source))[0] + OBJEXT)
+                    depFile = os.path.splitext(obj)[0] + '.deps'
+                    com = [DC, source] + flags
+                    if os.name != 'nt':
+                        com += [DDEPFLAG + depFile]
+                    jobs += compileJob(source, 'd', com, obj, depFile,
+                        state, cache)
+                    objs += [obj]
+                    if compileDb != None:
+                        compileDb += [{'directory': os.getcwd(),
+                            'arguments': com, 'file': source,
+                            'output': obj}]
+        if incremental and os.name != 'nt':
+            pruneObjects(pObjPath, objs)
+        # Link the project; the linker and objects are filled in at
+        # link time
+        com = []
+        # Append a file extension if needed
+        if os.name == 'nt':
+            if pFormat == 'executable':
+                pOutPath += '.exe'
+            elif pFormat == 'shared':
+                pOutPath += '.dll'
+                # Windows needs this
+                com += ['/DLL']
+            elif pFormat == 'static':
+                pOutPath += '.lib'
+            # Give the output path to the linker
+            com += [LINKOUTFLAG + pOutPath]
+        else:
+            if pFormat == 'shared':
+                pOutPath += '.so'
+                com += ['-shared']
+            elif pFormat == 'static':
+                pOutPath += '.a'
+            com += [LINKOUTFLAG, pOutPath]
+        # Add common linker flags
+        com += LINKFLAGS
+        if libDepsPath != '':
+            # This is for external dependency linkage
+            com += [LINKDIRFLAG + libDepsPath]
+        # Add build directory to lib search paths
+        com += [LINKDIRFLAG + project['projIni']['output']['path']]
+        for libPath in LIBDIRS:
+            # Add common lib search paths
+            com += [LINKDIRFLAG + libPath]
+        # Add external dependency libs
+        for lib in pLibs:
+            if os.name == 'nt':
+                # On Windows, boost is compiled funny. Check that
+                if lib.startswith('boost'):
+                    com += [LINKLIBFLAG + lib + BOOST_SUF +
+                        '.lib']
+                else:
+                    com += [LINKLIBFLAG + lib + '.lib']
+            else:
+                com += [LINKLIBFLAG + lib]
+        # Link once our own objects and any sibling projects we
+        # link against are done; nothing else has to wait
+        linkDeps = jobs[:]
+        linkLibs = []
+        for dep in projectDeps[projectNames[i]]:
+            linkDeps += [linkJobs[dep]]
+            linkLibs += [outPaths[dep]]
+        outPaths[projectNames[i]] = pOutPath
+        linkJobs[projectNames[i]] = linkJob(
+            project['projIni']['output']['name'], com, pObjGlob,
+            linkDeps, pOutPath, pObjPath, linkLibs)
+        # What it would be, for anyone looking before the objects exist
+        linkJobs[projectNames[i]].com = LINK + sorted(objs) + com
+        for job in jobs + [linkJobs[projectNames[i]]]:
+            job.project = projectNames[i]
+        allJobs += jobs + [linkJobs[projectNames[i]]]
+        i += 1
+    return (allJobs, states, cache)
+
+def compileProjects(workspace, options, pool, remote=None):
+    allJobs, states, cache = planJobs(workspace, options, True, remote)
+    # Compile everything at once, holding back only the link steps
+    try:
+        runJobs(pool, allJobs)
+    finally:
+        # Remember what was built, even if the build failed
+        for state in states:
+            state.save()
+        if cache != None:
+            pprint('Object cache: ' + str(cache.hits) + ' hit(s), ' +
+                str(cache.misses) + ' miss(es), ' +
+                str(cache.trim()) + ' evicted')
+        if remote != None:
+            pprint('Remote workers: ' + str(remote.remoteUnits) +
+                ' unit(s) remote, ' + str(remote.localUnits) + ' local')
+
+def saveTrace(trace, path):
+    # Written even if the build failed; that's when it's most wanted
+    for line in trace.summary():
+        pprint(line)
+    try:
+        trace.save(path)
+        pprint('Trace written to ' + path)
+    except OSError as ex:
+        pprint('Could not write trace to ' + path + ': {0}'.format(ex))
+
+def connectWorkers(options, jobCt):
+    # Farm C and C++ units out to the workers in --workers= or OCO_WORKERS
+    addresses = options.get('workers', os.getenv('OCO_WORKERS', ''))
+    addresses = [address for address in addresses.split(',')
+        if address.strip() != '']
+    if os.name == 'nt' or len(addresses) == 0:
+        return None
+    ret = RemoteWorkers(addresses, jobCt)
+    pprint('Using ' + str(len(ret.workers)) + ' of ' + str(len(addresses)) +
+        ' remote worker(s), with ' + str(ret.cores) + ' core(s) between them')
+    return ret
+
+def build(workspace, buildType, options):
+    # Run one build (or lint) of a loaded workspace, start to finish
+    taskName = 'build'
+    pprint(head='start')
+    pool = None
+    remote = None
+    # Time every action, if asked to
+    trace = None
+    if 'trace' in options:
+        trace = BuildTrace()
+    try:
+        jobCt = getJobCount(options.get('jobs'))
+        # Whatever the pool's size, run no more than that here at once
+        setLocalJobs(jobCt)
+        if buildType != 'lint':
+            remote = connectWorkers(options, jobCt)
+        # Enough threads to keep every worker busy, as well as this machine
+        pool = JobPool(jobCt + (remote.cores if remote != None else 0),
+            trace)
+        if buildType == 'lint':
+            taskName = 'lint' # Used if things go wrong
+            lintProjects(workspace, trace)
+        else: # compiling instead
+            compileProjects(workspace, options, pool, remote)
     except Exception as ex:
         pprint('Exception in ' + taskName + ': ' + color('{0}'.format(ex),
             style='bold'))
         pprint(head='fail')
         return -1
+    finally:
+        if pool != None:
+            pool.close()
+        setLocalJobs(None)
+        if remote != None:
+            remote.close()
+        if trace != None:
+            saveTrace(trace, options['trace'])
     pprint(head='pass')
     pprint()
     return 0
 
+# Files written by the plan subcommand
+COMPILE_DB_FILE = 'compile_commands.json'
+PLAN_FILE = 'buildplan.json'
+
+def writeJson(path, data):
+    tmp = path + '.tmp'
+    f = open(tmp, 'w')
+    json.dump(data, f, indent=1)
+    f.close()
+    os.replace(tmp, path)
+
+def savePlan(jobs, commands, outDir, buildType):
+    # A compilation database for other tools, with an entry for each real
+    # source, and the whole job graph, unity units and all
+    cwd = os.getcwd()
+    ids = {}
+    for job in jobs:
+        ids[job] = len(ids)
+    graph = []
+    for job in jobs:
+        graph += [{
+            'id': ids[job],
+            'name': job.name,
+            'action': job.action,
+            'project': job.project,
+            'command': job.com,
+            'output': job.target,
+            'deps': [ids[dep] for dep in job.deps]
+        }]
+    os.makedirs(outDir, exist_ok=True)
+    writeJson(os.path.join(outDir, COMPILE_DB_FILE), commands)
+    writeJson(os.path.join(outDir, PLAN_FILE), {
+        'version': 1,
+        'buildType': buildType,
+        'directory': cwd,
+        'jobs': graph
+    })
+
+def plan(args, options):
+    # Say what a full build would run, without running any of it
+    checkArgs(args)
+    if args[2] == 'lint':
+        raise Exception('Provided build type is invalid')
+    pprint(head='prep')
+    # Nothing but the plan itself is written, not even the probe cache
+    TOOLCHAIN.readOnly = True
+    configure(args[2])
+    commands = []
+    jobs, _, _ = planJobs(loadWorkspace(args[1], False), options, False,
+        compileDb=commands, write=False)
+    outDir = options.get('output', '.')
+    savePlan(jobs, commands, outDir, args[2])
+    pprint('Planned ' + str(len(jobs)) + ' job(s) into ' +
+        os.path.join(outDir, COMPILE_DB_FILE) + ' and ' +
+        os.path.join(outDir, PLAN_FILE))
+    pprint()
+    return 0
+
+def worker(args, options):
+    # Compile units sent by other machines' builds, until interrupted
+    host, port = ('127.0.0.1', DEFAULT_PORT)
+    if len(args) > 1:
+        host, port = parseAddress(args[1])
+    cores = os.cpu_count() or 1
+    if 'jobs' in options:
+        cores = getJobCount(options['jobs'])
+    server = WorkerServer((host, port), cores)
+    pprint('Worker listening on ' + host + ':' + str(port) + ' with ' +
+        str(cores) + ' core(s)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+def watch(args, options):
+    # Build, then build again whenever something changes, until interrupted
+    checkArgs(args)
+    pprint(head='prep')
+    if args[2] != 'lint':
+        configure(args[2])
+    workspace = loadWorkspace(args[1])
+    if not watchWorkspace(workspace):
+        pprint('Polling for changes, as inotify is unavailable')
+    try:
+        while True:
+            build(workspace, args[2], options)
+            pprint('Waiting for changes...')
+            while True:
+                waitForChanges(workspace)
+                try:
+                    refreshWorkspace(workspace)
+                    break
+                except Exception as ex:
+                    # Likely an INI caught half-written; wait for the rest
+                    pprint('Exception in prep: ' + color('{0}'.format(ex),
+                        style='bold'))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        closeWorkspace(workspace)
+    return 0
+
+def serveRequest(workspace, args, options):
+    # Build on behalf of a client; everything is already loaded
+    try:
+        if len(args) < 1:
+            raise Exception('Insufficient arguments provided')
+        checkBuildType(args[0])
+        pprint(head='prep')
+        refreshWorkspace(workspace)
+        if args[0] != 'lint':
+            configure(args[0])
+    except Exception as ex:
+        pprint('Exception in prep: ' + color('{0}'.format(ex),
+            style='bold'))
+        pprint(head='fail')
+        return -1
+    return build(workspace, args[0], options)
+
+def serve(args, options):
+    # Keep the solution loaded, and build whenever a client asks
+    if len(args) < 2:
+        raise Exception('Insufficient arguments provided')
+    if not os.path.isfile(args[1]):
+        raise Exception('Provided INI file is inaccessible')
+    path = options.get('socket', getSocketPath(args[1]))
+    workspace = loadWorkspace(args[1])
+    watchWorkspace(workspace)
+    server = BuildServer(path)
+    pprint('Listening on ' + path)
+    try:
+        while True:
+            conn = server.accept()
+            try:
+                reqArgs, reqOptions = conn.readRequest()
+                if reqArgs == ['stop']:
+                    conn.finish(0)
+                    break
+                with redirect_stdout(conn):
+                    status = serveRequest(workspace, reqArgs,
+                        {**options, **reqOptions})
+                conn.finish(status)
+            except Exception as ex:
+                pprint('Exception in request: {0}'.format(ex))
+            finally:
+                conn.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        closeWorkspace(workspace)
+    return 0
+
+def request(args, options):
+    # Have a running server do the build, and pass on what it says
+    if len(args) < 3:
+        raise Exception('Insufficient arguments provided')
+    path = options.pop('socket', getSocketPath(args[1]))
+    return sendRequest(path, args[2:], options)
+
+# Subcommands, given in place of the INI file
+COMMANDS = {
+    'plan':    plan,
+    'watch':   watch,
+    'serve':   serve,
+    'worker':  worker,
+    'request': request
+}
+
+def main(args):
+    # UTF-8 is off on Windows by default
+    if not usingUTF8(): # This fixes it if it's off, though
+        print('Changed the codepage to UTF-8. Please rerun this script.')
+        return 0
+    for line in STARTUP:
+        pprint(line)
+    args, options = getOptions(args, VALUE_OPTS, FLAG_OPTS)
+    if len(args) > 1 and args[1] in COMMANDS:
+        return COMMANDS[args[1]](args[:1] + args[2:], options)
+    checkArgs(args)
+    pprint(head='prep')
+    if args[2] != 'lint':
+        configure(args[2])
+    return build(loadWorkspace(args[1]), args[2], options)
+
 if __name__ == '__main__':
     from sys import argv, exit
     def _boot():
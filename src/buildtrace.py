@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8; mode: Python; indent-tabs-mode: nil; indent-width: 4; -*-
+#
+# OCO WORKING SET TOOLCHAIN
+# Copyright (C) 2017 Arqadium. All rights reserved.
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# version 2.0.  If a copy of the MPL was not distributed with this file, then
+# you can obtain one at <http://mozilla.org/MPL/2.0/>.
+#
+
+import json, os, threading, time
+
+# How many of the slowest units to list for each project
+SLOWEST_COUNT = 10
+
+
+
+## =============================== C L A S S =============================== #
+## BuildTrace
+##
+## TITLE:       Build Trace
+## DESCRIPTION: Collects the timing of every action in a build: when it started
+##              and ended, which worker ran it, how much memory it peaked at
+##              and how it exited. The result can be saved in the Chrome trace
+##              event format, for chrome://tracing or Perfetto to show, and
+##              summed up as a table of the slowest units in each project.
+class BuildTrace:
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self.threads = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, action, start, end, status, peakRss=None,
+    project=None, upToDate=False, thread=None):
+        with self.lock:
+            if thread == None:
+                thread = threading.get_ident()
+            # Number the workers from one, in the order they turn up
+            if thread not in self.threads:
+                self.threads[thread] = len(self.threads) + 1
+            self.events += [{
+                'name': name,
+                'action': action,
+                'project': project,
+                'start': start - self.origin,
+                'end': end - self.origin,
+                'status': status,
+                'peakRss': peakRss,
+                'upToDate': upToDate,
+                'worker': self.threads[thread]
+            }]
+
+    def addJob(self, job):
+        if job.start == None:
+            return
+        self.add(job.name, job.action, job.start, job.end, job.status,
+            job.peakRss, job.project, job.upToDate, job.thread)
+
+    def save(self, path):
+        events = []
+        for event in self.events:
+            args = {'status': event['status']}
+            if event['project'] != None:
+                args['project'] = event['project']
+            if event['peakRss'] != None:
+                args['peakRss'] = event['peakRss']
+            if event['upToDate']:
+                args['upToDate'] = True
+            events += [{
+                'name': event['name'],
+                'cat': event['action'],
+                'ph': 'X',
+                'ts': round(event['start'] * 1000000),
+                'dur': round((event['end'] - event['start']) * 1000000),
+                'pid': os.getpid(),
+                'tid': event['worker'],
+                'args': args
+            }]
+        for thread, worker in self.threads.items():
+            events += [{
+                'name': 'thread_name',
+                'ph': 'M',
+                'pid': os.getpid(),
+                'tid': worker,
+                'args': {'name': 'worker ' + str(worker)}
+            }]
+        f = open(path, 'w')
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f,
+            indent=0)
+        f.close()
+
+    def summary(self, count=SLOWEST_COUNT):
+        # Lines of text, listing the slowest units of each project
+        ret = []
+        if len(self.events) == 0:
+            return ret
+        projects = {}
+        busy = 0.0
+        for event in self.events:
+            duration = event['end'] - event['start']
+            busy += duration
+            if event['upToDate']:
+                continue
+            project = event['project'] or event['action']
+            projects.setdefault(project, []).append((duration, event))
+        for project in sorted(projects):
+            events = sorted(projects[project], key=lambda pair: pair[0],
+                reverse=True)[:count]
+            ret += ['Slowest units in ' + project + ':']
+            for duration, event in events:
+                rss = '       ?'
+                if event['peakRss'] != None:
+                    rss = '{0:5.0f} MiB'.format(event['peakRss'] / 1048576)
+                ret += ['  {0:8.2f}s {1}  {2:<7} {3}{4}'.format(duration,
+                    rss, event['action'], event['name'],
+                    '' if event['status'] == 0 else ' (failed)')]
+        wall = (max([event['end'] for event in self.events]) -
+            min([event['start'] for event in self.events]))
+        ret += ['{0} action(s) took {1:.2f}s over {2:.2f}s on {3} ' \
+            'worker(s), for a parallelism of {4:.2f}'.format(
+            len(self.events), busy, wall, len(self.threads),
+            busy / wall if wall > 0 else 1.0)]
+        return ret
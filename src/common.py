@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8; mode: Python; indent-tabs-mode: nil; indent-width: 4; -*-
+#
+# OCO WORKING SET TOOLCHAIN
+# Copyright (C) 2017 Arqadium. All rights reserved.
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# version 2.0.  If a copy of the MPL was not distributed with this file, then
+# you can obtain one at <http://mozilla.org/MPL/2.0/>.
+#
+
+import os
+
+# ioctl(2) request cloning one file's extents into another, from linux/fs.h
+FICLONE = 0x40049409
+
+
+
+## ============================ F U N C T I O N ============================ #
+## tuple getOptions(string[], dict<string, string>, dict<string, string>)
+##
+## TITLE:       Get Options
+## DESCRIPTION: Splits the switches out from the positional arguments. A
+##              switch taking a value may be given it after an equals sign or
+##              as the next argument, and -j may have it attached.
+##
+## PARAMETER: list of command-line arguments.
+## PARAMETER: The switches that take a value, and the option each one sets.
+## PARAMETER: The switches that stand on their own, and the option each one
+##            sets.
+##
+## RETURNS: A tuple of the positional arguments and a dict of the options.
+def getOptions(args, valueOpts, flagOpts):
+    positional = []
+    options = {}
+    i = 0
+    argc = len(args)
+    while i < argc:
+        arg = args[i]
+        name = arg
+        value = None
+        if arg.startswith('--') and '=' in arg:
+            name, value = arg.split('=', 1)
+        elif arg.startswith('-j') and len(arg) > 2:
+            name, value = arg[:2], arg[2:]
+        if name in valueOpts:
+            if value == None:
+                if i + 1 >= argc:
+                    raise Exception('Option \u2018' + name + '\u2019 ' +
+                        'requires a value')
+                i += 1
+                value = args[i]
+            options[valueOpts[name]] = value
+        elif arg in flagOpts:
+            options[flagOpts[arg]] = True
+        else:
+            positional += [arg]
+        i += 1
+    return (positional, options)
+
+
+
+## ============================ F U N C T I O N ============================ #
+## string getUserCacheDir(string)
+##
+## TITLE:       User Cache Directory
+## DESCRIPTION: Works out where something the tools keep between runs goes in
+##              the user's cache directory: XDG_CACHE_HOME if set, or else
+##              ~/.cache.
+##
+## PARAMETER: The name of the file or directory, within the toolchain's own
+##            directory there.
+##
+## RETURNS: A path, which may not exist yet.
+def getUserCacheDir(name):
+    base = os.getenv('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'oco', name)
+
+
+
+## ============================ F U N C T I O N ============================ #
+## boolean reflinkFile(string, string)
+##
+## TITLE:       Reflink File
+## DESCRIPTION: Makes a copy-on-write clone of a file, on filesystems and
+##              platforms that support it.
+##
+## PARAMETER: The file to clone.
+## PARAMETER: Where to put the clone; must not exist yet.
+##
+## RETURNS: Whether the clone was made.
+def reflinkFile(src, dst):
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        srcFile = open(src, 'rb')
+    except OSError:
+        return False
+    try:
+        dstFile = open(dst, 'xb')
+    except OSError:
+        srcFile.close()
+        return False
+    try:
+        fcntl.ioctl(dstFile.fileno(), FICLONE, srcFile.fileno())
+        ret = True
+    except OSError:
+        ret = False
+    srcFile.close()
+    dstFile.close()
+    if not ret:
+        os.remove(dst)
+    return ret
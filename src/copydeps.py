@@ -9,7 +9,1016 @@
 # you can obtain one at <http://mozilla.org/MPL/2.0/>.
 #
 
-import ini
+from common import getOptions, getUserCacheDir, reflinkFile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from objcache import getCacheSize, trimDir
+import assetcodec, errno, hashlib, ini, json, multiprocessing, os, pack, \
+    shutil, sys, time
+
+# Command-line switches that take a value, and the option each one sets
+VALUE_OPTS = {
+    '-j':          'jobs',
+    '--jobs':      'jobs',
+    '--mode':      'mode',
+    '--pack-file': 'packFile',
+    '--cache-dir':  'cacheDir',
+    '--cache-size': 'cacheSize'
+}
+# Command-line switches that stand on their own
+FLAG_OPTS = {
+    '--mirror':        'mirror',
+    '--mirror-report': 'mirrorReport',
+    '--pack':          'pack'
+}
+# Ways of putting a file in place, each falling back to the ones after it
+COPY_MODES = ['hardlink', 'reflink', 'copyrange', 'sendfile', 'copy']
+# Errors meaning a way of copying doesn't work here, rather than failure
+FALLBACK_ERRNOS = set([errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTSUP,
+    errno.ENOSYS, errno.EINVAL, errno.ENOTTY, errno.EPERM])
+# Name of the file in the destination listing what has been deployed there
+MANIFEST_FILE = '.copydeps.json'
+# Bumped whenever the layout of the manifest changes
+MANIFEST_VERSION = 1
+# Name of the pack in the destination that assets are packed into by default
+PACK_FILE = 'assets.pack'
+# Name of the file in the compression cache remembering source hashes
+HASHES_FILE = 'hashes.json'
+# Bumped whenever the layout of the compression cache changes
+CACHE_VERSION = 1
+# Default upper bound on the size of the compression cache, in bytes
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024
+# How much of a file to hash at a time
+HASH_CHUNK = 1024 * 1024
+
+
+
+## ============================ F U N C T I O N ============================ #
+## integer getCopyJobs(string)
+##
+## TITLE:       Copy Job Count
+## DESCRIPTION: Works out how many files may be copied at once, preferring an
+##              explicit value, then the OCO_COPY_JOBS environment variable.
+##              Copying spends most of its time waiting on the disk, so by
+##              default, or given zero, there are a few more workers than
+##              there are CPUs.
+##
+## PARAMETER: The value given on the command line, or None if absent.
+##
+## RETURNS: A positive integer.
+def getCopyJobs(value=None):
+    if value == None:
+        value = os.getenv('OCO_COPY_JOBS', '0')
+    try:
+        ret = int(value)
+    except ValueError:
+        raise Exception('Copy job count \u2018' + str(value) + '\u2019 ' +
+            'is not an integer')
+    if ret < 0:
+        raise Exception('Copy job count cannot be negative')
+    if ret == 0:
+        ret = min(32, (os.cpu_count() or 1) + 4)
+    return ret
+
+
+
+## ============================ F U N C T I O N ============================ #
+## string getCopyMode(string)
+##
+## TITLE:       Get Copy Mode
+## DESCRIPTION: Checks the name of a way of copying files.
+##
+## PARAMETER: The name, in any case, or None for a plain copy.
+##
+## RETURNS: One of COPY_MODES.
+def getCopyMode(value):
+    if value == None:
+        return 'copy'
+    ret = value.strip().lower()
+    if ret not in COPY_MODES:
+        raise Exception('Copy mode \u2018' + value + '\u2019 is not one ' +
+            'of ' + ', '.join(COPY_MODES))
+    return ret
+
+
+
+## ============================ F U N C T I O N ============================ #
+## string getCompressCacheDir(string)
+##
+## TITLE:       Compression Cache Directory
+## DESCRIPTION: Works out where compressed assets are kept between runs,
+##              preferring an explicit value, then the OCO_COPY_CACHE
+##              environment variable, and finally the user's cache directory.
+##
+## PARAMETER: The value given on the command line, or None if absent.
+##
+## RETURNS: A directory, which may not exist yet.
+def getCompressCacheDir(value=None):
+    if value == None:
+        value = os.getenv('OCO_COPY_CACHE')
+    if value == None:
+        value = getUserCacheDir('assets')
+    return value
+
+
+
+## ============================ F U N C T I O N ============================ #
+## integer getCompressCacheSize(string)
+##
+## TITLE:       Compression Cache Size
+## DESCRIPTION: Works out how big the compression cache may grow, preferring
+##              an explicit value, then the OCO_COPY_CACHE_SIZE environment
+##              variable, and finally 1 GiB. Sizes are given as for the object
+##              cache, such as "500M".
+##
+## PARAMETER: The value given on the command line, or None if absent.
+##
+## RETURNS: The size limit in bytes.
+def getCompressCacheSize(value=None):
+    if value == None:
+        value = os.getenv('OCO_COPY_CACHE_SIZE')
+    if not value:
+        return DEFAULT_CACHE_SIZE
+    return getCacheSize(value)
+
+
+
+## ============================ F U N C T I O N ============================ #
+## string hashFile(string)
+##
+## TITLE:       Hash File
+## DESCRIPTION: Hashes the contents of a file with BLAKE2b. The hashing is
+##              done outside the GIL, so several threads can hash at once.
+##
+## PARAMETER: The file to hash.
+##
+## RETURNS: The hash, in hexadecimal.
+def hashFile(path):
+    ret = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(HASH_CHUNK)
+            if not data:
+                break
+            ret.update(data)
+    return ret.hexdigest()
+
+
+
+## =============================== C L A S S =============================== #
+## DeployManifest
+##
+## TITLE:       Deployment Manifest
+## DESCRIPTION: Remembers, in a file in the destination directory, what was
+##              deployed to each path there: the file it came from, that
+##              file's size, modification time, inode and content hash, and
+##              the size, modification time and inode of the copy. Paths are
+##              kept relative to the destination, with forward slashes. For
+##              files packed rather than copied, it remembers the same of the
+##              file they came from by their names in the pack.
+class DeployManifest:
+    def __init__(self, dir):
+        self.dir = dir
+        self.path = os.path.join(dir, MANIFEST_FILE)
+        self.changed = False
+        try:
+            f = open(self.path, 'r')
+            data = json.load(f)
+            f.close()
+        except (OSError, ValueError):
+            data = {}
+        if data.get('version') != MANIFEST_VERSION:
+            data = {'files': {}}
+            self.changed = True
+        self.files = data['files']
+        self.packed = data.get('packed', {})
+
+    def key(self, dst):
+        return os.path.relpath(dst, self.dir).replace(os.sep, '/')
+
+    def get(self, dst):
+        return self.files.get(self.key(dst))
+
+    def record(self, dst, entry):
+        key = self.key(dst)
+        if self.files.get(key) != entry:
+            self.files[key] = entry
+            self.changed = True
+
+    def forget(self, dst):
+        key = self.key(dst)
+        if key in self.files:
+            del self.files[key]
+            self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        tmp = self.path + '.tmp'
+        os.makedirs(self.dir, exist_ok=True)
+        f = open(tmp, 'w')
+        json.dump({'version': MANIFEST_VERSION, 'files': self.files,
+            'packed': self.packed}, f, separators=(',', ':'))
+        f.close()
+        os.replace(tmp, self.path)
+        self.changed = False
+
+
+
+## =============================== C L A S S =============================== #
+## CompressCache
+##
+## TITLE:       Compression Cache
+## DESCRIPTION: Keeps the compressed forms of assets, named by the hash of the
+##              asset, the codec used and the codec's settings, so an asset is
+##              only compressed again once its contents or the settings
+##              change. The hash of each asset is kept too, along with its
+##              size, modification time and inode, so an unchanged asset
+##              isn't even read. The access times of compressed forms are
+##              moved on when they are used, and the least recently used are
+##              evicted once the cache grows past its size limit.
+class CompressCache:
+    def __init__(self, dir, maxSize=DEFAULT_CACHE_SIZE):
+        self.dir = dir
+        self.maxSize = maxSize
+        self.path = os.path.join(dir, HASHES_FILE)
+        self.changed = False
+        try:
+            f = open(self.path, 'r')
+            data = json.load(f)
+            f.close()
+        except (OSError, ValueError):
+            data = {}
+        if data.get('version') != CACHE_VERSION:
+            data = {'hashes': {}}
+        self.hashes = data['hashes']
+
+    def output(self, digest, codec):
+        name = digest
+        params = assetcodec.getCodecParams(codec)
+        if params != '':
+            name += '-' + hashlib.blake2b(params.encode(),
+                digest_size=4).hexdigest()
+        return os.path.join(self.dir, digest[:2], name + '.' + codec)
+
+    def touch(self, path):
+        # Whether a compressed form is there, marking it as recently used.
+        # Its modification time is kept, as copies are checked against it
+        try:
+            st = os.stat(path)
+            os.utime(path, ns=(time.time_ns(), st.st_mtime_ns))
+        except OSError:
+            return False
+        return True
+
+    def getHash(self, src, st):
+        entry = self.hashes.get(src)
+        if entry == None or entry[0] != [st.st_size, st.st_mtime_ns,
+        st.st_ino]:
+            return None
+        return entry[1]
+
+    def recordHash(self, src, st, digest):
+        entry = [[st.st_size, st.st_mtime_ns, st.st_ino], digest]
+        if self.hashes.get(src) != entry:
+            self.hashes[src] = entry
+            self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        tmp = self.path + '.' + str(os.getpid())
+        os.makedirs(self.dir, exist_ok=True)
+        f = open(tmp, 'w')
+        json.dump({'version': CACHE_VERSION, 'hashes': self.hashes}, f,
+            separators=(',', ':'))
+        f.close()
+        os.replace(tmp, self.path)
+        self.changed = False
+
+    def trim(self):
+        return trimDir(self.dir, self.maxSize, True)
+
+
+
+## =============================== C L A S S =============================== #
+## StatCache
+##
+## TITLE:       Directory Stat Cache
+## DESCRIPTION: Answers questions about files by listing each directory they
+##              are in once, with os.scandir(), rather than asking about each
+##              file in turn. A file's stat() is only done when asked for, and
+##              then only once, as the directory entry keeps it. A directory
+##              that can't be looked into is treated as missing, and why is
+##              kept in errors, by directory.
+class StatCache:
+    def __init__(self):
+        self.dirs = {}
+        self.errors = {}
+
+    def listDir(self, dir):
+        # A dict of the directory's entries by name, or None if it is missing
+        if dir in self.dirs:
+            return self.dirs[dir]
+        try:
+            with os.scandir(dir) as entries:
+                ret = {entry.name: entry for entry in entries}
+        except (FileNotFoundError, NotADirectoryError):
+            ret = None
+        except OSError as ex:
+            self.errors[dir] = str(ex)
+            ret = None
+        self.dirs[dir] = ret
+        return ret
+
+    def stat(self, path):
+        # The stat() of a regular file, following links, or None
+        dir = os.path.dirname(path) or '.'
+        entries = self.listDir(dir)
+        if entries == None:
+            return None
+        entry = entries.get(os.path.basename(path))
+        try:
+            if entry == None or not entry.is_file():
+                return None
+            return entry.stat()
+        except OSError as ex:
+            self.errors.setdefault(dir, str(ex))
+            return None
+
+
+
+## ============================ F U N C T I O N ============================ #
+## void copyData(string, string, integer, string)
+##
+## TITLE:       Copy Data
+## DESCRIPTION: Copies the contents of one file into a new one, either by
+##              cloning its extents (reflink), within the kernel
+##              (copyrange, sendfile), or through user space (copy).
+##
+## PARAMETER: The file to copy.
+## PARAMETER: The new file to copy it into.
+## PARAMETER: The size of the file to copy.
+## PARAMETER: How to copy it.
+def copyData(src, dst, size, mode):
+    if mode == 'copy':
+        shutil.copyfile(src, dst)
+        return
+    if mode == 'copyrange' and not hasattr(os, 'copy_file_range'):
+        raise OSError(errno.ENOSYS, 'copy_file_range is unavailable')
+    if mode == 'sendfile' and not hasattr(os, 'sendfile'):
+        raise OSError(errno.ENOSYS, 'sendfile is unavailable')
+    if mode == 'reflink':
+        if not reflinkFile(src, dst):
+            raise OSError(errno.EOPNOTSUPP, 'Reflinks are unavailable')
+        return
+    srcFd = os.open(src, os.O_RDONLY)
+    try:
+        dstFd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            done = 0
+            while done < size:
+                if mode == 'copyrange':
+                    count = os.copy_file_range(srcFd, dstFd, size - done)
+                else:
+                    count = os.sendfile(dstFd, srcFd, done, size - done)
+                if count == 0:
+                    break
+                done += count
+        finally:
+            os.close(dstFd)
+    finally:
+        os.close(srcFd)
+
+
+
+## ============================ F U N C T I O N ============================ #
+## tuple copyFile(string, string, string, dict<string, object>, tuple)
+##
+## TITLE:       Copy File
+## DESCRIPTION: Puts a copy of one file in place along with its metadata,
+##              unless the copy already there has the same contents. When
+##              neither file has changed since the manifest entry was made,
+##              by size, modification time and inode, nothing is read at all;
+##              otherwise whichever has changed is hashed to find out. Where
+##              the given mode doesn't work for this file, such as a hard link
+##              across filesystems, the modes after it in COPY_MODES are
+##              tried in turn. A file being replaced is only swapped out once
+##              its replacement is complete, so a hard link left by an earlier
+##              run is never written through.
+##
+## PARAMETER: The file to copy.
+## PARAMETER: Where to copy it to.
+## PARAMETER: How to copy it; one of COPY_MODES.
+## PARAMETER: The manifest entry for the destination, or None.
+## PARAMETER: The stat() of the file and of its destination (None if it is
+##            missing) if already known, or None to find them out.
+##
+## RETURNS: A tuple of the bytes copied (None if it was up to date), the mode
+##          that worked, the new manifest entry, and how many files were
+##          hashed.
+def copyFile(src, dst, mode='copy', entry=None, stats=None):
+    if stats == None:
+        srcStat = os.stat(src)
+        try:
+            dstStat = os.stat(dst)
+        except FileNotFoundError:
+            dstStat = None
+    else:
+        srcStat, dstStat = stats
+    srcKey = [srcStat.st_size, srcStat.st_mtime_ns, srcStat.st_ino]
+    dstKey = None
+    if dstStat != None:
+        dstKey = [dstStat.st_size, dstStat.st_mtime_ns, dstStat.st_ino]
+    sameSource = (entry != None and entry.get('source') == src
+        and entry.get('stat') == srcKey)
+    sameDeployed = (entry != None and dstKey != None
+        and entry.get('deployed') == dstKey)
+    if sameSource and sameDeployed:
+        return (None, None, entry, 0)
+    hashed = 0
+    if sameSource:
+        digest = entry['hash']
+    else:
+        digest = hashFile(src)
+        hashed += 1
+    ret = {'source': src, 'stat': srcKey, 'hash': digest, 'deployed': None}
+    if dstKey != None:
+        if sameDeployed:
+            dstDigest = entry['hash']
+        elif dstKey[0] != srcKey[0]:
+            dstDigest = None
+        else:
+            dstDigest = hashFile(dst)
+            hashed += 1
+        if dstDigest == digest:
+            ret['deployed'] = dstKey
+            return (None, None, ret, hashed)
+    tmp = dst + '.' + str(os.getpid()) + '.' + str(os.urandom(4).hex())
+    for mode in COPY_MODES[COPY_MODES.index(mode):]:
+        try:
+            if mode == 'hardlink':
+                os.link(src, tmp)
+            else:
+                copyData(src, tmp, srcStat.st_size, mode)
+                shutil.copystat(src, tmp)
+            os.replace(tmp, dst)
+            break
+        except OSError as ex:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            if mode == 'copy' or ex.errno not in FALLBACK_ERRNOS:
+                raise
+    dstStat = os.stat(dst)
+    ret['deployed'] = [dstStat.st_size, dstStat.st_mtime_ns, dstStat.st_ino]
+    return (srcStat.st_size, mode, ret, hashed)
+
+
+
+## ============================ F U N C T I O N ============================ #
+## dict<string, object> copyFiles(tuple[], integer, DeployManifest,
+##     ThreadPoolExecutor)
+##
+## TITLE:       Copy Files
+## DESCRIPTION: Copies, and hashes, files on a pool of worker threads, having
+##              first made every directory they are to go into that is
+##              missing. What is already in the destination is found by
+##              listing each of its directories once. A file that fails to
+##              copy, or is to go into a directory that can't be looked into,
+##              doesn't stop the others; every failure is reported, and its
+##              manifest entry is kept as it was. The manifest is updated but
+##              not saved.
+##
+## PARAMETER: The files to copy, as tuples of the file, where to copy it to,
+##            which of COPY_MODES to copy it by, and the file's stat().
+## PARAMETER: How many files may be copied at once.
+## PARAMETER: The manifest of the destination, or None.
+## PARAMETER: The pool to copy on, or None for one of its own.
+##
+## RETURNS: A dict of how many files were copied, were up to date and were
+##          hashed, the bytes copied, how many files each mode copied, the
+##          seconds taken, and a list of error messages.
+def copyFiles(copies, jobs, manifest=None, executor=None):
+    if executor == None:
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            return copyFiles(copies, jobs, manifest, executor)
+    start = time.perf_counter()
+    ret = {'copied': 0, 'upToDate': 0, 'hashed': 0, 'bytes': 0,
+        'modes': {}, 'errors': []}
+    dstCache = StatCache()
+    stats = {}
+    for copy in copies:
+        stats[copy[1]] = (copy[3], dstCache.stat(copy[1]))
+    # What is in these is unknown, so nothing is copied into them
+    ret['errors'] += [dstCache.errors[dir] for dir in sorted(dstCache.errors)]
+    copies = [copy for copy in copies
+        if (os.path.dirname(copy[1]) or '.') not in dstCache.errors]
+    for dir in sorted(dstCache.dirs):
+        if dstCache.dirs[dir] != None or dir in dstCache.errors:
+            continue
+        try:
+            os.makedirs(dir, exist_ok=True)
+        except OSError as ex:
+            ret['errors'] += [str(ex)]
+    if len(ret['errors']) > len(dstCache.errors):
+        ret['seconds'] = time.perf_counter() - start
+        return ret
+    def work(copy):
+        try:
+            entry = None
+            if manifest != None:
+                entry = manifest.get(copy[1])
+            return copyFile(copy[0], copy[1], copy[2], entry,
+                stats[copy[1]])
+        except OSError as ex:
+            return ex
+    for copy, result in zip(copies, executor.map(work, copies)):
+        if isinstance(result, Exception):
+            # What the manifest says was deployed there still stands
+            ret['errors'] += [str(result)]
+            continue
+        if manifest != None:
+            manifest.record(copy[1], result[2])
+        ret['hashed'] += result[3]
+        if result[0] == None:
+            ret['upToDate'] += 1
+            continue
+        ret['copied'] += 1
+        ret['bytes'] += result[0]
+        ret['modes'][result[1]] = ret['modes'].get(result[1], 0) + 1
+    ret['seconds'] = time.perf_counter() - start
+    return ret
+
+
+
+## ============================ F U N C T I O N ============================ #
+## dict<string, object> pruneFiles(DeployManifest, string[], boolean)
+##
+## TITLE:       Prune Files
+## DESCRIPTION: Removes what an earlier run deployed that this run has not,
+##              going by the manifest alone, so nothing it doesn't list is
+##              ever touched. A file that has changed since it was deployed
+##              is left in place, and no longer listed. Directories left
+##              empty by the removals are removed as well.
+##
+## PARAMETER: The manifest of the destination.
+## PARAMETER: Every path this run deployed to.
+## PARAMETER: Whether to only report what would be removed.
+##
+## RETURNS: A dict of the stale paths, how many were removed, those that
+##          were left in place, and a list of error messages.
+def pruneFiles(manifest, dsts, report=False):
+    ret = {'stale': [], 'removed': 0, 'left': [], 'errors': []}
+    keep = set([manifest.key(dst) for dst in dsts])
+    dirs = set()
+    for key in sorted(manifest.files):
+        if key in keep:
+            continue
+        dst = os.path.join(manifest.dir, key.replace('/', os.sep))
+        ret['stale'] += [dst]
+        if report:
+            continue
+        try:
+            st = os.lstat(dst)
+        except FileNotFoundError:
+            manifest.forget(dst)
+            continue
+        except OSError as ex:
+            ret['errors'] += [str(ex)]
+            continue
+        if ([st.st_size, st.st_mtime_ns, st.st_ino] !=
+        manifest.files[key].get('deployed')):
+            ret['left'] += [dst]
+            manifest.forget(dst)
+            continue
+        try:
+            os.remove(dst)
+        except OSError as ex:
+            ret['errors'] += [str(ex)]
+            continue
+        manifest.forget(dst)
+        ret['removed'] += 1
+        dirs.add(os.path.dirname(dst))
+    # Deepest first, so a parent is only tried once its children are gone
+    for dir in sorted(dirs, key=len, reverse=True):
+        while dir.startswith(manifest.dir + os.sep):
+            try:
+                os.rmdir(dir)
+            except OSError:
+                break
+            dir = os.path.dirname(dir)
+    return ret
+
+
+
+## ============================ F U N C T I O N ============================ #
+## string copySummary(dict<string, object>)
+##
+## TITLE:       Copy Summary
+## DESCRIPTION: Describes the outcome of copyFiles() in a line of text.
+##
+## PARAMETER: What copyFiles() returned.
+##
+## RETURNS: A line of text.
+def copySummary(result):
+    seconds = result['seconds']
+    rate = result['bytes'] / seconds / 1000000 if seconds > 0 else 0.0
+    modes = ''
+    if len(result['modes']) > 0:
+        modes = ' by ' + ', '.join([str(result['modes'][mode]) + ' ' + mode
+            for mode in COPY_MODES if mode in result['modes']])
+    return ('Copied {0} file(s){1}, {2:.1f} MB in {3:.2f}s ({4:.1f} ' \
+        'MB/s); {5} up to date, {6} hashed, {7} failed'.format(
+        result['copied'], modes, result['bytes'] / 1000000, seconds, rate,
+        result['upToDate'], result['hashed'], len(result['errors'])))
+
+
+
+## ============================ F U N C T I O N ============================ #
+## tuple[] planAssets(string, string, string, StatCache, boolean)
+##
+## TITLE:       Plan Assets
+## DESCRIPTION: Reads the asset INI of a target, checking each section as it
+##              goes, and lists the assets to be deployed. An asset to be
+##              compressed but not packed has the codec's name added to its
+##              path as an extension.
+##
+## PARAMETER: The dependency source directory.
+## PARAMETER: The target, such as debug or release.
+## PARAMETER: Which of COPY_MODES to copy assets by, unless a section says.
+## PARAMETER: What is known of the source tree.
+## PARAMETER: Whether to pack assets, unless a section says.
+##
+## RETURNS: A list of tuples of an asset, its path within a destination,
+##          which of COPY_MODES to copy it by, its stat(), whether to pack it
+##          instead, and the codec to compress it with or None.
+def planAssets(srcDir, target, mode, srcCache, packing=False):
+    ret = []
+    assetDir = os.path.join(srcDir, 'assets', target)
+    # Sections are checked and planned as they are read, so a huge manifest
+    # never has to be held in memory all at once
+    iniPath = assetDir + '.ini'
+    for key, settings, lineno in ini.iter_sections(iniPath):
+        where = iniPath + ':' + str(lineno) + ': '
+        if key == '':
+            raise Exception(where + 'Asset INI properties must be within ' +
+                'a section')
+        filePath = os.path.join(assetDir, key)
+        fileStat = srcCache.stat(filePath)
+        if fileStat == None:
+            raise Exception(where + 'Asset INI section "' + key + '" does ' +
+                'not correspond to an accessible file in the assets ' +
+                'directory for target "' + target + '"')
+        copyKey = settings.get('copy')
+        if copyKey == '0':
+            continue
+        if copyKey != '1':
+            raise Exception(where + 'Asset INI property "Copy" in section ' +
+                '"' + key + '" has an invalid value of "' + str(copyKey) +
+                '"; must be either 0 or 1')
+        # Otherwise copyKey must be 1
+        outpath = key
+        if 'outputpath' in settings:
+            outpathKey = settings['outputpath']
+            if outpathKey.startswith('/') == False:
+                raise Exception(where + 'Asset INI property "OutputPath" ' +
+                    'in section "' + key + '" has an invalid value of "' +
+                    outpathKey + '"; must begin with a forward slash')
+            if outpathKey.endswith('/'):
+                raise Exception(where + 'Asset INI property "OutputPath" ' +
+                    'in section "' + key + '" has an invalid value of "' +
+                    outpathKey + '"; cannot be a directory')
+            outpath = outpathKey.lstrip('/').replace('/', os.sep)
+        try:
+            fileMode = mode
+            if 'mode' in settings:
+                fileMode = getCopyMode(settings['mode'])
+        except Exception as ex:
+            raise Exception(where + 'Asset INI property "Mode" in section ' +
+                '"' + key + '" is invalid: ' + str(ex))
+        packKey = settings.get('pack')
+        if packKey not in [None, '0', '1']:
+            raise Exception(where + 'Asset INI property "Pack" in section ' +
+                '"' + key + '" has an invalid value of "' + packKey + '"; ' +
+                'must be either 0 or 1')
+        filePack = packing if packKey == None else packKey == '1'
+        codec = None
+        if settings.get('compress', '0') != '0':
+            try:
+                codec = assetcodec.getCodec(settings['compress'])
+            except Exception as ex:
+                raise Exception(where + 'Asset INI property "Compress" in ' +
+                    'section "' + key + '" is invalid: ' + str(ex))
+            if not filePack:
+                # A loose file has nothing else to say it is compressed
+                outpath += '.' + codec
+        ret += [(filePath, outpath, fileMode, fileStat, filePack, codec)]
+    return ret
+
+
+
+## ============================ F U N C T I O N ============================ #
+## tuple[] planLibs(string, string, string, string, StatCache)
+##
+## TITLE:       Plan Libraries
+## DESCRIPTION: Lists the libraries of an architecture and target to be
+##              deployed.
+##
+## PARAMETER: The dependency source directory.
+## PARAMETER: The architecture, such as 32 or 64.
+## PARAMETER: The target, such as debug or release.
+## PARAMETER: Which of COPY_MODES to copy libraries by.
+## PARAMETER: What is known of the source tree.
+##
+## RETURNS: A list of tuples like those of planAssets().
+def planLibs(srcDir, arch, target, mode, srcCache):
+    ret = []
+    libsDir = os.path.join(srcDir, 'lib' + arch, target)
+    libs = srcCache.listDir(libsDir)
+    if libs == None:
+        raise Exception('Library directory is inaccessible or does not ' +
+            'exist: ' + libsDir)
+    for lib in sorted(libs):
+        if libs[lib].is_file() == False:
+            continue
+        ret += [(libs[lib].path, lib, mode, libs[lib].stat(), False, None)]
+    return ret
+
+
+
+## ============================ F U N C T I O N ============================ #
+## BaseContext getProcessContext()
+##
+## TITLE:       Process Context
+## DESCRIPTION: Picks how compression workers are started. Forking a process
+##              that already runs a pool of threads can leave locks held in
+##              the child, so a fresh interpreter is started instead: from a
+##              fork server where there is one, or else spawned.
+##
+## RETURNS: A multiprocessing context.
+def getProcessContext():
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+
+## ============================ F U N C T I O N ============================ #
+## tuple compressAssets(tuple[][], CompressCache, integer, ThreadPoolExecutor)
+##
+## TITLE:       Compress Assets
+## DESCRIPTION: Compresses every asset that is to be, as planned for any
+##              destination, and points the plans at the compressed forms in
+##              the cache. Assets are hashed on the thread pool, unless the
+##              cache already knows their hash, and those not compressed
+##              before are compressed on a pool of processes. An asset that
+##              fails to compress is left out of the plans.
+##
+## PARAMETER: The plans of every destination.
+## PARAMETER: The compression cache.
+## PARAMETER: How many files may be worked on at once.
+## PARAMETER: The pool to hash on.
+##
+## RETURNS: A tuple of the new plans, a dict for each codec of how many files
+##          it compressed and were cached, the bytes in and out and the
+##          seconds spent compressing, and a list of error messages.
+def compressAssets(plans, cache, jobs, executor):
+    stats = {}
+    errors = []
+    todo = {}
+    for plan in plans:
+        for src, outpath, mode, st, packed, codec in plan:
+            if codec != None:
+                todo[(src, codec)] = st
+    if len(todo) == 0:
+        return (plans, stats, errors)
+    def work(src):
+        st = todo[src]
+        digest = cache.getHash(src[0], st)
+        if digest != None:
+            return digest
+        try:
+            return hashFile(src[0])
+        except OSError as ex:
+            return ex
+    outputs = {}
+    pending = []
+    for src, digest in zip(list(todo), executor.map(work, list(todo))):
+        if isinstance(digest, Exception):
+            errors += [str(digest)]
+            continue
+        cache.recordHash(src[0], todo[src], digest)
+        codecStats = stats.setdefault(src[1], {'compressed': 0, 'cached': 0,
+            'in': 0, 'out': 0, 'seconds': 0.0})
+        outputs[src] = cache.output(digest, src[1])
+        if cache.touch(outputs[src]):
+            codecStats['cached'] += 1
+        else:
+            pending += [src]
+    if len(pending) > 0:
+        # Compression is bound by the CPU, so threads would only take turns
+        workers = max(1, min(jobs, os.cpu_count() or 1, len(pending)))
+        with ProcessPoolExecutor(max_workers=workers,
+        mp_context=getProcessContext()) as processes:
+            futures = [processes.submit(assetcodec.compressFile, src[1],
+                src[0], outputs[src]) for src in pending]
+            for src, future in zip(pending, futures):
+                try:
+                    read, written, seconds = future.result()
+                except Exception as ex:
+                    errors += ['Failed to compress \u2018' + src[0] +
+                        '\u2019 with ' + src[1] + ': ' + str(ex)]
+                    del outputs[src]
+                    continue
+                codecStats = stats[src[1]]
+                codecStats['compressed'] += 1
+                codecStats['in'] += read
+                codecStats['out'] += written
+                codecStats['seconds'] += seconds
+    try:
+        cache.save()
+    except OSError as ex:
+        errors += [str(ex)]
+    outStats = {}
+    ret = []
+    for plan in plans:
+        newPlan = []
+        for src, outpath, mode, st, packed, codec in plan:
+            if codec != None:
+                out = outputs.get((src, codec))
+                if out == None:
+                    continue
+                if out not in outStats:
+                    try:
+                        outStats[out] = os.stat(out)
+                    except OSError as ex:
+                        errors += [str(ex)]
+                        outStats[out] = None
+                if outStats[out] == None:
+                    continue
+                src, st = out, outStats[out]
+            newPlan += [(src, outpath, mode, st, packed, codec)]
+        ret += [newPlan]
+    return (ret, stats, errors)
+
+
+
+## ============================ F U N C T I O N ============================ #
+## string compressSummary(string, dict<string, object>)
+##
+## TITLE:       Compression Summary
+## DESCRIPTION: Describes what compressAssets() did with a codec in a line of
+##              text. Speeds are per worker process.
+##
+## PARAMETER: The codec.
+## PARAMETER: What compressAssets() returned for it.
+##
+## RETURNS: A line of text.
+def compressSummary(codec, stats):
+    seconds = stats['seconds']
+    rateIn = stats['in'] / seconds / 1000000 if seconds > 0 else 0.0
+    rateOut = stats['out'] / seconds / 1000000 if seconds > 0 else 0.0
+    ratio = stats['out'] / stats['in'] * 100 if stats['in'] > 0 else 100.0
+    return ('{0}: compressed {1} file(s), {2:.1f} MB to {3:.1f} MB ({4:.0f}' \
+        '%) at {5:.1f} MB/s in, {6:.1f} MB/s out; {7} cached'.format(codec,
+        stats['compressed'], stats['in'] / 1000000, stats['out'] / 1000000,
+        ratio, rateIn, rateOut, stats['cached']))
+
+
+
+## ============================ F U N C T I O N ============================ #
+## dict<string, object> packFiles(tuple[], string, DeployManifest,
+##     ThreadPoolExecutor)
+##
+## TITLE:       Pack Files
+## DESCRIPTION: Brings a pack up to date with a list of files. The files are
+##              hashed on the pool, unless the manifest shows they haven't
+##              changed, and only those whose hash differs from the pack's
+##              index are written. Entries for files no longer listed are
+##              dropped. The manifest is updated once the pack has been
+##              written in full, but not saved.
+##
+## PARAMETER: The files to pack, as tuples of the file, its name in the
+##            pack, its stat(), and the codec it was compressed with or None.
+## PARAMETER: The pack.
+## PARAMETER: The manifest of the destination the pack is in.
+## PARAMETER: The pool to hash on.
+##
+## RETURNS: A dict of how many files were packed, were up to date and were
+##          hashed, the bytes packed, and a list of error messages.
+def packFiles(entries, packPath, manifest, executor):
+    ret = {'packed': 0, 'upToDate': 0, 'hashed': 0, 'bytes': 0,
+        'errors': []}
+    def work(entry):
+        src, name, st, codec = entry
+        key = [st.st_size, st.st_mtime_ns, st.st_ino]
+        cached = manifest.packed.get(name)
+        if (cached != None and cached.get('source') == src
+        and cached.get('stat') == key):
+            return (cached, 0)
+        try:
+            return ({'source': src, 'stat': key, 'hash': hashFile(src)}, 1)
+        except OSError as ex:
+            return ex
+    hashes = list(executor.map(work, entries))
+    try:
+        writer = pack.PackWriter(packPath)
+    except OSError as ex:
+        ret['errors'] += [str(ex)]
+        return ret
+    packed = {}
+    try:
+        writer.keep([entry[1] for entry in entries])
+        for entry, result in zip(entries, hashes):
+            if isinstance(result, Exception):
+                ret['errors'] += [str(result)]
+                writer.remove(entry[1])
+                continue
+            info, hashed = result
+            ret['hashed'] += hashed
+            if writer.has(entry[1], info['hash'], entry[3]):
+                ret['upToDate'] += 1
+            else:
+                writer.add(entry[1], entry[0], info['hash'], entry[3])
+                ret['packed'] += 1
+                ret['bytes'] += entry[2].st_size
+            packed[entry[1]] = info
+        writer.close()
+    except OSError as ex:
+        # What the pack holds is unknown, so the manifest is left as it was
+        ret['errors'] += [str(ex)]
+        writer.file.close()
+        return ret
+    if manifest.packed != packed:
+        manifest.packed = packed
+        manifest.changed = True
+    try:
+        st = os.stat(packPath)
+        manifest.record(packPath, {'source': None, 'stat': None,
+            'hash': None, 'deployed': [st.st_size, st.st_mtime_ns,
+            st.st_ino]})
+    except OSError as ex:
+        ret['errors'] += [str(ex)]
+    return ret
+
+
+
+## ============================ F U N C T I O N ============================ #
+## tuple deploy(tuple[], string, integer, dict<string, object>,
+##     ThreadPoolExecutor)
+##
+## TITLE:       Deploy
+## DESCRIPTION: Copies a plan into a destination, prunes it if asked, and
+##              saves its manifest.
+##
+## PARAMETER: What to copy, as from planAssets() and planLibs().
+## PARAMETER: The destination directory.
+## PARAMETER: How many files may be copied at once.
+## PARAMETER: Options, as parsed from the command line.
+## PARAMETER: The pool to copy on.
+##
+## RETURNS: A tuple of what copyFiles() returned, with the lines of text to
+##          report added under 'report'.
+def deploy(plan, dst, jobs, options, executor):
+    copies = [(src, os.path.join(dst, outpath), mode, st)
+        for src, outpath, mode, st, packed, codec in plan if not packed]
+    packed = [(src, outpath.replace(os.sep, '/'), st, codec)
+        for src, outpath, mode, st, packed, codec in plan if packed]
+    manifest = DeployManifest(dst)
+    ret = copyFiles(copies, jobs, manifest, executor)
+    ret['report'] = []
+    deployed = [copy[1] for copy in copies]
+    if len(packed) > 0:
+        packPath = os.path.join(dst, options.get('packFile', PACK_FILE))
+        deployed += [packPath]
+        packResult = packFiles(packed, packPath, manifest, executor)
+        ret['errors'] += packResult['errors']
+    mirror = options.get('mirror') or options.get('mirrorReport')
+    if mirror:
+        report = options.get('mirrorReport', False)
+        pruned = pruneFiles(manifest, deployed, report)
+        for path in pruned['stale']:
+            if report:
+                ret['report'] += ['Stale: ' + path]
+            elif path in pruned['left']:
+                ret['report'] += ['Left in place, as it has changed since ' +
+                    'it was deployed: ' + path]
+        ret['errors'] += pruned['errors']
+    try:
+        manifest.save()
+    except OSError as ex:
+        ret['errors'] += [str(ex)]
+    ret['report'] += [copySummary(ret)]
+    if len(packed) > 0:
+        ret['report'] += ['Packed {0} file(s), {1:.1f} MB into {2}; {3} ' \
+            'up to date, {4} hashed'.format(packResult['packed'],
+            packResult['bytes'] / 1000000, packPath,
+            packResult['upToDate'], packResult['hashed'])]
+    if mirror:
+        ret['report'] += ['{0} stale file(s), {1} removed'.format(
+            len(pruned['stale']), pruned['removed'])]
+    return ret
 
 
 
@@ -19,107 +1028,116 @@ import ini
 ## TITLE:       Main
 ## DESCRIPTION: Application entry point.
 ##
-## PARAMETER: list of command-line arguments, starting with the script name.
+## PARAMETER: list of command-line arguments, starting with the script name,
+##            then the dependency source directory, and one or more groups of
+##            a destination directory, architecture and target. The INI and
+##            directory listings of the source are shared by every group, and
+##            the groups are deployed at once.
+##            -j/--jobs sets how many files are copied at once, and --mode
+##            how they are copied; an asset section's Mode key overrides it.
+##            --mirror removes files deployed by earlier runs that this run
+##            didn't deploy, and --mirror-report lists them instead. --pack
+##            packs assets unless their section says Pack=0, as those saying
+##            Pack=1 always are, into the file given by --pack-file. Assets
+##            whose section gives a codec as Compress are marked as
+##            compressed in the pack, or if not packed, deployed compressed
+##            with the codec's name added as an extension, such as .zlib.
+##            Either way they are kept compressed in the directory given by
+##            --cache-dir, which once the deployment is done is trimmed to the
+##            size given by --cache-size.
 ##
 ## RETURNS: Integer exit code; handed back to the operating system.
 def main(args):
+    args, options = getOptions(args, VALUE_OPTS, FLAG_OPTS)
     argc = len(args)
     if argc < 5:
         raise Exception('Insufficient number of arguments provided:\n%s' %
             '\n'.join(args) + '\n\nExiting...')
+    if (argc - 2) % 3 != 0:
+        raise Exception('Destinations, architectures and targets must be ' +
+            'given in groups of three')
     from os import path, sep
-    args[1] = args[1].rstrip().rstrip(sep)
-    args[2] = args[2].rstrip().rstrip(sep)
-    if path.isdir(args[1]) == False:
+    srcDir = args[1].rstrip().rstrip(sep)
+    if path.isdir(srcDir) == False:
         raise Exception('Dependency source directory is inaccessible or ' +
-            'does not exist: ' + args[1])
-    assetDir = path.join(args[1], 'assets', args[4])
-    libsDir = path.join(args[1], 'lib' + args[3], args[4])
-    dirsToMake = []
-    srcDepsToCopy = []
-    dstDepsToCopy = []
+            'does not exist: ' + srcDir)
+    groups = []
+    for i in range(2, argc, 3):
+        groups += [(args[i].rstrip().rstrip(sep), args[i + 1], args[i + 2])]
+    dsts = [path.abspath(group[0]) for group in groups]
+    if len(set(dsts)) != len(dsts):
+        raise Exception('Each destination directory may only be given once')
+    plans = []
+    srcCache = StatCache()
+    assets = {}
     try:
-        settings = ini.parse(assetDir + '.ini')
-        for key in settings:
-            filePath = path.join(args[1], 'assets', args[4], key)
-            if path.isfile(filePath) == False:
-                raise Exception('Asset INI section "' + key + '" does ' +
-                    'not correspond to an accessible file in the assets ' +
-                    'directory for target "' + args[4] + '"')
-            copyKey = settings[key]['copy']
-            if copyKey == '0':
-                continue
-            if copyKey != '1':
-                raise Exception('Asset INI property "Copy" in section "' +
-                    key + '" has an invalid value of "' + copyKey + '"; ' +
-                    'must be either 0 or 1')
-            # Otherwise copyKey must be 1
-            if 'outputpath' in settings[key]:
-                outpathKey = settings[key]['outputpath']
-                if outpathKey.startswith('/') == False:
-                    raise Exception('Asset INI property "OutputPath" in ' +
-                        'section "' + key + '" has an invalid value of "' +
-                        copyKey + '"; must begin with a forward slash')
-                if outpathKey.endswith('/'):
-                    raise Exception('Asset INI property "OutputPath" in ' +
-                        'section "' + key + '" has an invalid value of "' +
-                        copyKey + '"; cannot be a directory')
-                outpathKey = outpathKey.lstrip('/')
-                outpath = outpathKey.replace('/', sep)
-                if '/' in outpathKey:
-                    dir = path.dirname(outpath)
-                    dirsToMake += [path.join(args[2], dir)]
-                file = path.join(args[2], outpath)
-                dstDepsToCopy += [file]
-            else:
-                dstDepsToCopy += [path.join(args[2], key)]
-            srcDepsToCopy += [filePath]
-        from os import listdir
-        libs = listdir(libsDir)
-        for lib in libs:
-            if path.isfile(path.join(libsDir, lib)) == False:
-                continue
-            dstDepsToCopy += [path.join(args[2], lib)]
-            srcDepsToCopy += [path.join(libsDir, lib)]
-        # Perform the copy operation
-        from os import makedirs
-        for dir in dirsToMake:
-            if path.exists(dir):
-                continue
-            makedirs(dir)
-        i = 0
-        fileCount = len(srcDepsToCopy)
-        from shutil import copy2
-        from os import stat
-        while i < fileCount:
-            src = srcDepsToCopy[i]
-            dst = dstDepsToCopy[i]
-            if path.exists(dst):
-                srcMtime = stat(src).st_mtime_ns
-                dstMtime = stat(dst).st_mtime_ns
-                if srcMtime <= dstMtime:
-                    i += 1
-                    continue
-            copy2(src, dst)
-            i += 1
+        mode = getCopyMode(options.get('mode'))
+        jobs = getCopyJobs(options.get('jobs'))
+        for dst, arch, target in groups:
+            if target not in assets:
+                assets[target] = planAssets(srcDir, target, mode, srcCache,
+                    options.get('pack', False))
+            plans += [assets[target] + planLibs(srcDir, arch, target, mode,
+                srcCache)]
     except Exception as ex:
         from sys import stderr
         print(ex, file=stderr)
         return -3
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        cache = CompressCache(getCompressCacheDir(
+            options.get('cacheDir')), getCompressCacheSize(
+            options.get('cacheSize')))
+        plans, compressed, errors = compressAssets(plans, cache, jobs,
+            executor)
+        for error in errors:
+            print(error, file=sys.stderr)
+        for codec in sorted(compressed):
+            print(compressSummary(codec, compressed[codec]))
+        if len(groups) == 1:
+            results = [deploy(plans[0], groups[0][0], jobs, options,
+                executor)]
+        else:
+            with ThreadPoolExecutor(max_workers=len(groups)) as deployer:
+                results = list(deployer.map(lambda i: deploy(plans[i],
+                    groups[i][0], jobs, options, executor),
+                    range(len(groups))))
+    failed = len(errors) > 0
+    for group, result in zip(groups, results):
+        for error in result['errors']:
+            print(error, file=sys.stderr)
+        prefix = ''
+        if len(groups) > 1:
+            prefix = group[0] + ': '
+        for line in result['report']:
+            print(prefix + line)
+        failed = failed or len(result['errors']) > 0
+    # Everything is deployed from the cache by now, so it can be cut down
+    try:
+        evicted = cache.trim()
+    except OSError as ex:
+        print(ex, file=sys.stderr)
+        evicted = 0
+    if evicted > 0:
+        print('Evicted ' + str(evicted) + ' file(s) from the compression ' +
+            'cache')
+    if failed:
+        return -3
+    return 0
 
 
 
 ## =========================== B O O T S T R A P =========================== #
 ## Application bootstrapper, guarding against code execution upon import.
 if __name__ == '__main__':
-    try:
-        from sys import argv, exit
-        exit(main(argv))
-    except Exception as ex:
-        raise ex
-        return -2
-    except:
-        from sys import exc_info
-        print('Rogue exception:', exc_info()[0])
-        return -1
-    return 0
+    from sys import argv, exit
+    def _boot():
+        try:
+            return main(argv)
+        except Exception as ex:
+            raise ex
+            return -2
+        except:
+            from sys import exc_info
+            print('Rogue exception:', exc_info()[0])
+            return -1
+    exit(_boot())
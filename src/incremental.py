@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8; mode: Python; indent-tabs-mode: nil; indent-width: 4; -*-
+#
+# OCO WORKING SET TOOLCHAIN
+# Copyright (C) 2017 Arqadium. All rights reserved.
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# version 2.0.  If a copy of the MPL was not distributed with this file, then
+# you can obtain one at <http://mozilla.org/MPL/2.0/>.
+#
+
+import json, os, re
+
+# Name of the per-project file recording how each object was last built
+COMMANDS_FILE = '.commands'
+# Name of the per-project file recording what the output was last linked from
+LINK_FILE = '.link'
+# Matches the file paths in each line of DMD's -deps output
+RE_DMDDEP = re.compile(r'\(([^)]*)\)')
+
+
+
+## ============================ F U N C T I O N ============================ #
+## string[] parseMakeDeps(string)
+##
+## TITLE:       Make Dependency Parser
+## DESCRIPTION: Reads a Makefile-style dependency file, as written by GCC's
+##              -MMD and -MF options, and lists its prerequisites.
+##
+## PARAMETER: Path to the dependency file.
+##
+## RETURNS: A list of file paths, or None if the file could not be read.
+def parseMakeDeps(path):
+    try:
+        f = open(path, 'r')
+        text = f.read()
+        f.close()
+    except OSError:
+        return None
+    # Join continued lines, and skip past the target
+    text = text.replace('\\\n', ' ')
+    rule = text.split(': ', 1)
+    if len(rule) < 2:
+        return None
+    ret = []
+    for line in rule[1].splitlines():
+        # Spaces within file names are escaped with backslashes
+        for word in re.split(r'(?<!\\)\s+', line.strip()):
+            if word != '':
+                ret += [word.replace('\\ ', ' ')]
+        # Only the first rule matters; the rest (-MP) are empty targets
+        break
+    return ret
+
+
+
+## ============================ F U N C T I O N ============================ #
+## string[] parseDmdDeps(string)
+##
+## TITLE:       DMD Dependency Parser
+## DESCRIPTION: Reads the module dependency listing written by DMD's -deps
+##              option, and lists every file it mentions.
+##
+## PARAMETER: Path to the dependency file.
+##
+## RETURNS: A list of file paths, or None if the file could not be read.
+def parseDmdDeps(path):
+    try:
+        f = open(path, 'r')
+        lines = f.read().splitlines()
+        f.close()
+    except OSError:
+        return None
+    ret = []
+    seen = set()
+    for line in lines:
+        for dep in RE_DMDDEP.findall(line):
+            if dep != '' and dep not in seen:
+                seen.add(dep)
+                ret += [dep]
+    return ret
+
+
+
+## =============================== C L A S S =============================== #
+## MtimeCache
+##
+## TITLE:       Modification Time Cache
+## DESCRIPTION: Remembers file modification times for the length of a run, so
+##              headers shared between many units are only looked at once.
+class MtimeCache:
+    def __init__(self):
+        self.mtimes = {}
+
+    def get(self, path):
+        if path in self.mtimes:
+            return self.mtimes[path]
+        try:
+            ret = os.stat(path).st_mtime_ns
+        except OSError:
+            ret = None
+        self.mtimes[path] = ret
+        return ret
+
+    def seed(self, mtimes):
+        # Take times already known from elsewhere, such as a watched index
+        self.mtimes.update(mtimes)
+
+    def forget(self, path):
+        self.mtimes.pop(path, None)
+
+
+
+## =============================== C L A S S =============================== #
+## BuildState
+##
+## TITLE:       Build State
+## DESCRIPTION: Tracks which objects in a project's object directory are up
+##              to date. An object is current when it is newer than its source
+##              and every dependency recorded on its last build, and was built
+##              with the same command line as the one about to be run. Inputs
+##              the dependency file can't know about, such as a precompiled
+##              header, may be given as well. When forced, every object is
+##              treated as out of date, but what gets built is still recorded
+##              for next time.
+class BuildState:
+    def __init__(self, objDir, mtimes, force=False):
+        self.objDir = objDir
+        self.mtimes = mtimes
+        self.force = force
+        self.path = os.path.join(objDir, COMMANDS_FILE)
+        try:
+            f = open(self.path, 'r')
+            self.commands = json.load(f)
+            f.close()
+        except (OSError, ValueError):
+            self.commands = {}
+
+    def upToDate(self, obj, source, depFile, com, dmd=False, extra=None):
+        if self.force:
+            return False
+        if self.commands.get(obj) != com:
+            return False
+        objMtime = self.mtimes.get(obj)
+        if objMtime == None:
+            return False
+        if dmd:
+            deps = parseDmdDeps(depFile)
+        else:
+            deps = parseMakeDeps(depFile)
+        if deps == None:
+            return False
+        if extra != None:
+            deps = deps + extra
+        for dep in [source] + deps:
+            depMtime = self.mtimes.get(dep)
+            if depMtime == None or depMtime > objMtime:
+                return False
+        return True
+
+    def record(self, obj, com):
+        self.commands[obj] = com
+
+    def invalidate(self, obj):
+        # Forget an object before rebuilding it, in case the build fails
+        self.commands.pop(obj, None)
+        self.mtimes.forget(obj)
+
+    def save(self):
+        f = open(self.path, 'w')
+        json.dump(self.commands, f, indent=0, sort_keys=True)
+        f.close()
+
+
+
+## ============================ F U N C T I O N ============================ #
+## dict<string, integer[]> getFileStats(string[])
+##
+## TITLE:       File Statistics
+## DESCRIPTION: Notes the size and modification time of each of a list of
+##              files, as a cheap fingerprint of their contents.
+##
+## PARAMETER: The files to look at.
+##
+## RETURNS: A dict mapping each path to a [size, mtime] pair, or to None for
+##          files that don't exist.
+def getFileStats(paths):
+    ret = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+            ret[path] = [st.st_size, st.st_mtime_ns]
+        except OSError:
+            ret[path] = None
+    return ret
+
+
+
+## =============================== C L A S S =============================== #
+## LinkManifest
+##
+## TITLE:       Link Manifest
+## DESCRIPTION: Records what a project's output was last linked from: the full
+##              link command, which covers the objects, libraries and flags,
+##              and the size and modification time of every object and sibling
+##              library that went into it. A link whose manifest still matches
+##              has nothing to do, provided the output is still there.
+class LinkManifest:
+    def __init__(self, objDir):
+        self.path = os.path.join(objDir, LINK_FILE)
+        try:
+            f = open(self.path, 'r')
+            self.data = json.load(f)
+            f.close()
+        except (OSError, ValueError):
+            self.data = {}
+
+    def matches(self, com, inputs, outPath):
+        if not os.path.exists(outPath):
+            return False
+        return (self.data.get('command') == com
+            and self.data.get('inputs') == inputs)
+
+    def save(self, com, inputs):
+        self.data = {'command': com, 'inputs': inputs}
+        f = open(self.path, 'w')
+        json.dump(self.data, f, indent=0, sort_keys=True)
+        f.close()
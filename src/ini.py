@@ -9,47 +9,240 @@
 # you can obtain one at <http://mozilla.org/MPL/2.0/>.
 #
 
-import re
+import hashlib, marshal, os, threading
+
+# Bumped whenever the layout of cached parses changes
+CACHE_VERSION = 1
+# Parses already done by this process, by path, size and modification time
+MEMO = {}
+MEMO_LOCK = threading.Lock()
 
 
 
 ## ============================ F U N C T I O N ============================ #
-## integer parseINI(string)
+## dict<string, dict<string, string>> parseText(string[])
 ##
-## TITLE:       INI Parser
-## DESCRIPTION: A basic read-only INI parser function that creates a jagged
-##              dictionary of sections and their key/value pairs.
+## TITLE:       INI Text Parser
+## DESCRIPTION: Does the actual parsing for parse(), on the lines of an INI.
+##              Blank lines, and lines whose first non-blank character is # or
+##              ;, are ignored. Section and key names are lowercased; values
+##              are kept exactly as written.
 ##
-## PARAMETER: The INI file to open and parse. This function does not check for
-##            its existence!
+## PARAMETER: The lines of the INI.
 ##
 ## RETURNS: A dict<string, dict<string, string>> containing the INI's data.
-def parse(fileName):
-    f = open(fileName, 'r')
-    iniLines = f.read().splitlines()
-    f.close
+def parseText(iniLines):
     badLines = []
-    curSect = '' # Must be blank, for sectionless key/value pairs at the top
-    ret = {'': {}}
-    expIgnore = re.compile(r'\s*([#;].*)?')
+    curSect = {} # Must be blank, for sectionless key/value pairs at the top
+    ret = {'': curSect}
     for line in iniLines:
-        if expIgnore.fullmatch(line) != None:
+        stripped = line.lstrip()
+        if stripped == '' or stripped[0] == '#' or stripped[0] == ';':
             continue
-        if len(line) > 0 and line[0] == '[':
-            name = line.lstrip('[').rstrip(']').lower()
-            ret[name] = {}
-            curSect = name
-        elif '=' in line:
-            pair = line.split('=', 1)
-            key = pair[0].lower()
-            if key in ret[curSect]:
-                badLines[len(badLines)] = line
-                continue
-            ret[curSect][key] = pair[1]
-        else:
+        if line[0] == '[':
+            curSect = {}
+            ret[line.lstrip('[').rstrip(']').lower()] = curSect
+            continue
+        key, sep, value = line.partition('=')
+        if sep == '':
             badLines += [line]
+            continue
+        key = key.lower()
+        if key in curSect:
+            badLines += [line]
+            continue
+        curSect[key] = value
     if len(badLines) > 0:
         raise Exception('Parsing failed due to malformed syntax; the ' +
             'following lines were found to be invalid:\n' + '\n'.join(badLines)
             + '\n')
     return ret
+
+
+
+## ============================ F U N C T I O N ============================ #
+## dict<string, dict<string, string>> parse(string, string)
+##
+## TITLE:       INI Parser
+## DESCRIPTION: A basic read-only INI parser function that creates a jagged
+##              dictionary of sections and their key/value pairs. Files already
+##              parsed by this process are not parsed again unless they have
+##              changed. Given a cache directory (or the OCO_INI_CACHE
+##              environment variable), parses are also kept there in marshal
+##              form, for later processes to load instead.
+##
+## PARAMETER: The INI file to open and parse. This function does not check for
+##            its existence!
+## PARAMETER: Where to keep parses between runs, or None.
+##
+## RETURNS: A dict<string, dict<string, string>> containing the INI's data.
+##          Each call returns a fresh copy, which may be changed freely.
+def parse(fileName, cacheDir=None):
+    st = os.stat(fileName)
+    memoKey = (os.path.abspath(fileName), st.st_size, st.st_mtime_ns)
+    with MEMO_LOCK:
+        ret = MEMO.get(memoKey)
+    if ret == None:
+        if cacheDir == None:
+            cacheDir = os.getenv('OCO_INI_CACHE')
+        cachePath = None
+        if cacheDir:
+            cachePath = os.path.join(cacheDir, hashlib.blake2b(
+                memoKey[0].encode(), digest_size=16).hexdigest() + '.marshal')
+            ret = loadCached(cachePath, memoKey)
+        if ret == None:
+            f = open(fileName, 'r')
+            ret = parseText(f.read().splitlines())
+            f.close()
+            if cachePath != None:
+                saveCached(cachePath, memoKey, ret)
+        with MEMO_LOCK:
+            MEMO[memoKey] = ret
+    return {name: dict(section) for name, section in ret.items()}
+
+
+
+## ============================ F U N C T I O N ============================ #
+## dict<string, dict<string, string>> loadCached(string, tuple)
+##
+## TITLE:       Load Cached Parse
+## DESCRIPTION: Loads a parse kept on disk by saveCached(), if it is there and
+##              still belongs to the same version of the same file.
+##
+## PARAMETER: Where the parse is kept.
+## PARAMETER: The file's path, size and modification time.
+##
+## RETURNS: The parsed INI, or None.
+def loadCached(path, memoKey):
+    try:
+        f = open(path, 'rb')
+        data = marshal.loads(f.read())
+        f.close()
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if (not isinstance(data, tuple) or len(data) != 3
+    or data[0] != CACHE_VERSION or data[1] != memoKey):
+        return None
+    return data[2]
+
+
+
+## ============================ F U N C T I O N ============================ #
+## void saveCached(string, tuple, dict<string, dict<string, string>>)
+##
+## TITLE:       Save Cached Parse
+## DESCRIPTION: Keeps a parse on disk for loadCached() to find later.
+##
+## PARAMETER: Where to keep the parse.
+## PARAMETER: The file's path, size and modification time.
+## PARAMETER: The parsed INI.
+def saveCached(path, memoKey, result):
+    tmp = path + '.' + str(os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        f = open(tmp, 'wb')
+        marshal.dump((CACHE_VERSION, memoKey, result), f)
+        f.close()
+        os.replace(tmp, path)
+    except OSError:
+        # The cache is only an optimisation
+        pass
+
+
+
+## ============================ F U N C T I O N ============================ #
+## iterator iterTokens(string)
+##
+## TITLE:       INI Tokeniser
+## DESCRIPTION: Reads an INI a line at a time, by the same rules as parse(),
+##              and yields a (section, None, None, line number) tuple at each
+##              section header and a (section, key, value, line number) tuple
+##              for each key/value pair. Only the keys of the current section,
+##              and the names of those before it, are held in memory, so files
+##              of any size can be read. The first malformed line or repeated
+##              key is raised as an error giving its line number, as is a
+##              section given twice, as a ValueError; unlike parse(), which
+##              holds every section and so keeps only the last, a stream has
+##              already handed the first one on.
+##
+## PARAMETER: The INI file to open and read.
+##
+## RETURNS: A generator of tuples, as above.
+def iterTokens(fileName):
+    with open(fileName, 'r') as f:
+        section = ''
+        keys = set()
+        sections = set()
+        for lineno, line in enumerate(f, 1):
+            line = line.rstrip('\r\n')
+            stripped = line.lstrip()
+            if stripped == '' or stripped[0] == '#' or stripped[0] == ';':
+                continue
+            if line[0] == '[':
+                section = line.lstrip('[').rstrip(']').lower()
+                if section in sections:
+                    raise ValueError(fileName + ':' + str(lineno) + ': ' +
+                        'Repeated section \u2018' + section + '\u2019')
+                sections.add(section)
+                keys = set()
+                yield (section, None, None, lineno)
+                continue
+            key, sep, value = line.partition('=')
+            if sep == '':
+                raise Exception(fileName + ':' + str(lineno) + ': ' +
+                    'Malformed line \u2018' + line + '\u2019')
+            key = key.lower()
+            if key in keys:
+                raise Exception(fileName + ':' + str(lineno) + ': ' +
+                    'Repeated key \u2018' + key + '\u2019 in section ' +
+                    '\u2018' + section + '\u2019')
+            keys.add(key)
+            yield (section, key, value, lineno)
+
+
+
+## ============================ F U N C T I O N ============================ #
+## iterator iter_entries(string)
+##
+## TITLE:       INI Entry Iterator
+## DESCRIPTION: Streams the key/value pairs of an INI without reading all of it
+##              first. Pairs before the first section header belong to the
+##              section named ''.
+##
+## PARAMETER: The INI file to open and read.
+##
+## RETURNS: A generator of (section, key, value, line number) tuples.
+def iter_entries(fileName):
+    for token in iterTokens(fileName):
+        if token[1] != None:
+            yield token
+
+
+
+## ============================ F U N C T I O N ============================ #
+## iterator iter_sections(string)
+##
+## TITLE:       INI Section Iterator
+## DESCRIPTION: Streams the sections of an INI without reading all of it first;
+##              only one section is held in memory at a time. The section
+##              named '' is only yielded if there are pairs before the first
+##              header. A section given twice is an error, as iterTokens()
+##              says.
+##
+## PARAMETER: The INI file to open and read.
+##
+## RETURNS: A generator of (section, dict<string, string>, line number)
+##          tuples, the line number being that of the section header.
+def iter_sections(fileName):
+    current = None
+    for section, key, value, lineno in iterTokens(fileName):
+        if key == None:
+            if current != None:
+                yield current
+            current = (section, {}, lineno)
+            continue
+        if current == None:
+            current = ('', {}, lineno)
+        current[1][key] = value
+    if current != None:
+        yield current
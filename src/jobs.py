@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8; mode: Python; indent-tabs-mode: nil; indent-width: 4; -*-
+#
+# OCO WORKING SET TOOLCHAIN
+# Copyright (C) 2017 Arqadium. All rights reserved.
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# version 2.0.  If a copy of the MPL was not distributed with this file, then
+# you can obtain one at <http://mozilla.org/MPL/2.0/>.
+#
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from subprocess import run, DEVNULL, PIPE, STDOUT
+import os, sys, threading, time
+
+# Per-thread record of the most memory any command it ran has used
+USAGE = threading.local()
+# How many commands may run on this machine at once, if limited
+LOCAL_SLOTS = None
+
+
+## ============================ F U N C T I O N ============================ #
+## integer getJobCount(string)
+##
+## TITLE:       Job Count
+## DESCRIPTION: Works out how many jobs may run at once, preferring an
+##              explicit value, then the OCO_JOBS environment variable, and
+##              finally falling back to one job (serial operation). A value
+##              of zero means one job per CPU.
+##
+## PARAMETER: The value given on the command line, or None if absent.
+##
+## RETURNS: A positive integer.
+def getJobCount(value=None):
+    if value == None:
+        value = os.getenv('OCO_JOBS', '1')
+    try:
+        ret = int(value)
+    except ValueError:
+        raise Exception('Job count \u2018' + str(value) + '\u2019 is not ' +
+            'an integer')
+    if ret < 0:
+        raise Exception('Job count cannot be negative')
+    if ret == 0:
+        ret = os.cpu_count() or 1
+    return ret
+
+
+
+## ============================ F U N C T I O N ============================ #
+## void setLocalJobs(integer)
+##
+## TITLE:       Set Local Jobs
+## DESCRIPTION: Limits how many commands spawnCommand() runs at once, across
+##              every thread. A job pool with remote workers has more threads
+##              than there are local cores, and only some of its jobs go to
+##              the workers; this keeps the rest to the local job count.
+##
+## PARAMETER: The most commands to run at once, or None for no limit.
+def setLocalJobs(count):
+    global LOCAL_SLOTS
+    LOCAL_SLOTS = threading.Semaphore(count) if count != None else None
+
+
+
+## ============================ F U N C T I O N ============================ #
+## void resetPeakRss()
+##
+## TITLE:       Reset Peak RSS
+## DESCRIPTION: Starts a fresh measurement of the peak memory use of commands
+##              run by the calling thread.
+def resetPeakRss():
+    USAGE.peak = None
+
+
+
+## ============================ F U N C T I O N ============================ #
+## integer getPeakRss()
+##
+## TITLE:       Peak RSS
+## DESCRIPTION: Tells how much memory the hungriest command run by the calling
+##              thread used since the measurement was last reset.
+##
+## RETURNS: The peak resident set size in bytes, or None if unknown.
+def getPeakRss():
+    return getattr(USAGE, 'peak', None)
+
+
+
+## ============================ F U N C T I O N ============================ #
+## void notePeakRss(resource.struct_rusage)
+##
+## TITLE:       Note Peak RSS
+## DESCRIPTION: Folds the resource usage of a finished command into the calling
+##              thread's peak memory measurement.
+##
+## PARAMETER: The resource usage of the command, as given by os.wait4().
+def notePeakRss(rusage):
+    # Linux reports kilobytes, macOS reports bytes
+    peak = rusage.ru_maxrss
+    if not sys.platform.startswith('darwin'):
+        peak *= 1024
+    if getattr(USAGE, 'peak', None) == None or peak > USAGE.peak:
+        USAGE.peak = peak
+
+
+
+## ============================ F U N C T I O N ============================ #
+## (integer, bytes) spawnCommand(string[], boolean)
+##
+## TITLE:       Spawn Command
+## DESCRIPTION: Runs a program directly, without a shell in between, and
+##              collects its standard output. Where the platform offers
+##              posix_spawn (which uses vfork underneath on Linux) that is used
+##              to start it, being much cheaper than a fork of the whole build
+##              tool; anywhere else this goes through the subprocess module.
+##              The peak memory use of the command is noted for getPeakRss().
+##              Waits for a slot first, if setLocalJobs() has set a limit.
+##
+## PARAMETER: The command, as a list of arguments. The program is looked up on
+##            PATH if need be.
+## PARAMETER: Whether diagnostics should be collected with the output, rather
+##            than thrown away.
+##
+## RETURNS: The exit status and the raw output of the command.
+def spawnCommand(com, stderr=True):
+    with LOCAL_SLOTS or nullcontext():
+        if not hasattr(os, 'posix_spawnp'):
+            compl = run(com, stdout=PIPE, stderr=STDOUT if stderr else DEVNULL)
+            return (compl.returncode, compl.stdout)
+        r, w = os.pipe()
+        actions = [(os.POSIX_SPAWN_DUP2, w, 1)]
+        if stderr:
+            actions += [(os.POSIX_SPAWN_DUP2, w, 2)]
+        else:
+            actions += [(os.POSIX_SPAWN_OPEN, 2, os.devnull, os.O_WRONLY, 0)]
+        try:
+            pid = os.posix_spawnp(com[0], com, os.environ,
+                file_actions=actions)
+        except OSError:
+            os.close(r)
+            os.close(w)
+            raise
+        os.close(w)
+        chunks = []
+        while True:
+            chunk = os.read(r, 65536)
+            if not chunk:
+                break
+            chunks += [chunk]
+        os.close(r)
+        _, status, rusage = os.wait4(pid, 0)
+        notePeakRss(rusage)
+        return (os.waitstatus_to_exitcode(status), b''.join(chunks))
+
+
+
+## ============================ F U N C T I O N ============================ #
+## (integer, string) runCommand(string[])
+##
+## TITLE:       Run Command
+## DESCRIPTION: Runs a single tool invocation to completion, capturing both of
+##              its output streams together so they can be shown in one piece.
+##
+## PARAMETER: The command, as a list of arguments.
+##
+## RETURNS: The exit status and the decoded console output of the command.
+def runCommand(com):
+    status, output = spawnCommand(com)
+    return (status, output.decode(errors='replace'))
+
+
+
+## ============================ F U N C T I O N ============================ #
+## (integer, bytes) captureCommand(string[])
+##
+## TITLE:       Capture Command
+## DESCRIPTION: Runs a tool whose standard output is wanted as data, such as
+##              the preprocessor. Its diagnostics are thrown away.
+##
+## PARAMETER: The command, as a list of arguments.
+##
+## RETURNS: The exit status and the raw standard output of the command.
+def captureCommand(com):
+    return spawnCommand(com, stderr=False)
+
+
+
+## =============================== C L A S S =============================== #
+## Job
+##
+## TITLE:       Job
+## DESCRIPTION: One unit of work for a JobPool, such as compiling a single
+##              translation unit. The function is called with no arguments and
+##              returns an (exit status, console output) pair, or None if it
+##              found there was nothing to do. A job is only started once
+##              every job it depends on has succeeded. When and where it ran,
+##              and how much memory its commands took, are kept for tracing.
+class Job:
+    def __init__(self, name, action, func, com=None, deps=None):
+        self.name = name
+        self.action = action
+        self.func = func
+        self.com = com
+        self.deps = deps if deps != None else []
+        self.project = None
+        self.target = None
+        self.status = None
+        self.output = ''
+        self.skipped = False
+        self.upToDate = False
+        self.start = None
+        self.end = None
+        self.thread = None
+        self.peakRss = None
+
+    def execute(self, pool):
+        if pool.failed.is_set():
+            # Don't start anything new once something has gone wrong
+            self.skipped = True
+            return self
+        self.thread = threading.get_ident()
+        resetPeakRss()
+        self.start = time.perf_counter()
+        try:
+            ret = self.func()
+            if ret == None:
+                self.upToDate = True
+                ret = (0, '')
+            self.status, self.output = ret
+        except Exception as ex:
+            self.status = -1
+            self.output = '{0}'.format(ex)
+        self.end = time.perf_counter()
+        self.peakRss = getPeakRss()
+        if self.status != 0:
+            pool.failed.set()
+        return self
+
+    def ready(self):
+        for dep in self.deps:
+            if dep.status != 0:
+                return False
+        return True
+
+
+
+## =============================== C L A S S =============================== #
+## JobPool
+##
+## TITLE:       Job Pool
+## DESCRIPTION: Runs a graph of jobs concurrently on a fixed number of worker
+##              threads. Every job whose dependencies have succeeded is queued
+##              straight away, so independent work is never held up behind
+##              unrelated jobs. Results are reported in the order the jobs
+##              were given, so each job's output stays in one piece and the
+##              console reads the same no matter how the jobs were
+##              interleaved. After the first failure no further jobs are
+##              launched, but those already running are allowed to finish.
+##              Every job that ran is handed to the trace, if there is one.
+class JobPool:
+    def __init__(self, jobs=1, trace=None):
+        self.jobs = jobs
+        self.trace = trace
+        self.failed = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=jobs)
+
+    def run(self, jobs, report=None):
+        waiting = jobs[:]
+        running = {}
+        finished = set()
+        failures = []
+        reported = 0
+        jobCt = len(jobs)
+        while True:
+            # Queue up everything that has become runnable
+            if not self.failed.is_set():
+                blocked = []
+                for job in waiting:
+                    if job.ready():
+                        running[self.executor.submit(job.execute, self)] = job
+                    else:
+                        blocked += [job]
+                waiting = blocked
+            # Report finished jobs, in order, for as far as we can; once
+            # nothing is left running, jobs that never started are passed
+            draining = len(running) == 0
+            while reported < jobCt and (draining
+            or jobs[reported] in finished):
+                job = jobs[reported]
+                reported += 1
+                if job.skipped or job.upToDate or job not in finished:
+                    continue
+                if report != None:
+                    report(job)
+                if job.status != 0:
+                    failures += [job]
+            if draining:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = future.result()
+                finished.add(job)
+                del running[future]
+                if self.trace != None and not job.skipped:
+                    self.trace.addJob(job)
+        if len(failures) == 0 and len(waiting) > 0:
+            raise Exception('Circular dependency between ' +
+                ', '.join([job.name for job in waiting]))
+        return failures
+
+    def close(self):
+        self.executor.shutdown(wait=True)
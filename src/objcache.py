@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8; mode: Python; indent-tabs-mode: nil; indent-width: 4; -*-
+#
+# OCO WORKING SET TOOLCHAIN
+# Copyright (C) 2017 Arqadium. All rights reserved.
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# version 2.0.  If a copy of the MPL was not distributed with this file, then
+# you can obtain one at <http://mozilla.org/MPL/2.0/>.
+#
+
+from common import getUserCacheDir, reflinkFile
+import errno, hashlib, os, shutil, threading
+
+# Default upper bound on the size of the cache, in bytes
+DEFAULT_SIZE = 5 * 1024 * 1024 * 1024
+SIZE_SUFFIXES = {
+    'k': 1024,
+    'm': 1024 * 1024,
+    'g': 1024 * 1024 * 1024
+}
+
+
+
+## ============================ F U N C T I O N ============================ #
+## string getCacheDir()
+##
+## TITLE:       Cache Directory
+## DESCRIPTION: Works out where the object cache lives, from the OCO_CACHE_DIR
+##              environment variable, or else in the user's cache directory.
+##
+## RETURNS: A directory path, which may not exist yet.
+def getCacheDir():
+    ret = os.getenv('OCO_CACHE_DIR')
+    if ret:
+        return ret
+    return getUserCacheDir('objects')
+
+
+
+## ============================ F U N C T I O N ============================ #
+## integer getCacheSize(string)
+##
+## TITLE:       Cache Size
+## DESCRIPTION: Parses a cache size limit such as "500M" or "5G". Falls back to
+##              the OCO_CACHE_SIZE environment variable, then to 5 GiB.
+##
+## PARAMETER: The size limit, or None if not given.
+##
+## RETURNS: The size limit in bytes.
+def getCacheSize(value=None):
+    if value == None:
+        value = os.getenv('OCO_CACHE_SIZE')
+    if not value:
+        return DEFAULT_SIZE
+    value = value.strip().lower()
+    mult = 1
+    if value[-1:] in SIZE_SUFFIXES:
+        mult = SIZE_SUFFIXES[value[-1]]
+        value = value[:-1]
+    try:
+        return int(float(value) * mult)
+    except ValueError:
+        raise Exception('Cache size \u2018' + value + '\u2019 is invalid')
+
+
+
+## ============================ F U N C T I O N ============================ #
+## integer trimDir(string, integer, boolean)
+##
+## TITLE:       Trim Directory
+## DESCRIPTION: Evicts the least recently used files from a cache laid out as
+##              a directory of subdirectories, until what is left fits in the
+##              size limit. Files directly in the directory are left alone.
+##
+## PARAMETER: The cache directory.
+## PARAMETER: The size limit, in bytes.
+## PARAMETER: Whether the access time tells when a file was last used, rather
+##            than the modification time.
+##
+## RETURNS: How many files were evicted.
+def trimDir(path, maxSize, byAccess=False):
+    entries = []
+    total = 0
+    if not os.path.isdir(path):
+        return 0
+    for sub in os.scandir(path):
+        if not sub.is_dir():
+            continue
+        for entry in os.scandir(sub.path):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            used = st.st_atime_ns if byAccess else st.st_mtime_ns
+            entries += [(used, st.st_size, entry.path)]
+            total += st.st_size
+    if total <= maxSize:
+        return 0
+    entries.sort()
+    ret = 0
+    for used, size, entryPath in entries:
+        if total <= maxSize:
+            break
+        try:
+            os.remove(entryPath)
+        except OSError as ex:
+            if ex.errno != errno.ENOENT:
+                continue
+        total -= size
+        ret += 1
+    return ret
+
+
+
+## ============================ F U N C T I O N ============================ #
+## void cloneFile(string, string)
+##
+## TITLE:       Clone File
+## DESCRIPTION: Puts a copy of a file at a new path as cheaply as possible: by
+##              hardlinking it, reflinking it, or failing those, copying it.
+##              Anything already at the destination is replaced.
+##
+## PARAMETER: The file to clone.
+## PARAMETER: Where to put the clone.
+def cloneFile(src, dst):
+    tmp = dst + '.tmp' + str(threading.get_ident())
+    try:
+        os.link(src, tmp)
+    except OSError:
+        if not reflinkFile(src, tmp):
+            shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+
+## =============================== C L A S S =============================== #
+## ObjectCache
+##
+## TITLE:       Object Cache
+## DESCRIPTION: A content-addressed store of compiled objects. Each entry is
+##              keyed by a hash of everything that determines the object: the
+##              compiler and its version, the exact command line less its
+##              output paths, and the source (preprocessed, or along with
+##              every file it depends on). Dependency files are kept alongside
+##              so incremental builds still work on a hit; they can also be
+##              kept by a key of their own, for finding what a unit depends on
+##              before it has been built here. Entries are touched when used,
+##              and the least recently used are evicted once the cache grows
+##              past its size limit.
+class ObjectCache:
+    def __init__(self, path, maxSize=DEFAULT_SIZE):
+        self.path = path
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.lock = threading.Lock()
+
+    def key(self, parts, files=None, text=None):
+        h = hashlib.blake2b(digest_size=20)
+        for part in parts:
+            h.update(part.encode())
+            h.update(b'\0')
+        if text != None:
+            h.update(text)
+        if files != None:
+            for path in files:
+                try:
+                    f = open(path, 'rb')
+                    data = f.read()
+                    f.close()
+                except OSError:
+                    # Something we depend on is gone; can't be cached
+                    return None
+                h.update(path.encode())
+                h.update(b'\0')
+                h.update(hashlib.blake2b(data, digest_size=20).digest())
+        return h.hexdigest()
+
+    def entryPath(self, key):
+        return os.path.join(self.path, key[:2], key[2:])
+
+    def fetch(self, key, obj, depFile=None):
+        entry = self.entryPath(key)
+        try:
+            if depFile != None:
+                shutil.copyfile(entry + '.d', depFile)
+                os.utime(entry + '.d')
+            cloneFile(entry + '.o', obj)
+            # Mark the entry as recently used, which a copy or reflink of it
+            # wouldn't, and make the restored object newer than its sources
+            os.utime(entry + '.o')
+            os.utime(obj)
+        except OSError:
+            with self.lock:
+                self.misses += 1
+            return False
+        with self.lock:
+            self.hits += 1
+        return True
+
+    def store(self, key, obj, depFile=None):
+        entry = self.entryPath(key)
+        try:
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            if depFile != None and os.path.exists(depFile):
+                tmp = entry + '.d.tmp' + str(threading.get_ident())
+                shutil.copyfile(depFile, tmp)
+                os.replace(tmp, entry + '.d')
+            cloneFile(obj, entry + '.o')
+        except OSError:
+            # Caching is best effort; the build itself still succeeded
+            return
+        with self.lock:
+            self.stored += 1
+
+    def fetchDeps(self, key):
+        # Where a dependency file kept by storeDeps() is, or None
+        path = self.entryPath(key) + '.deps'
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def storeDeps(self, key, depFile):
+        path = self.entryPath(key) + '.deps'
+        tmp = path + '.tmp' + str(threading.get_ident())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copyfile(depFile, tmp)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def miss(self):
+        with self.lock:
+            self.misses += 1
+
+    def trim(self):
+        # Evict the least recently used entries until we fit again
+        return trimDir(self.path, self.maxSize)
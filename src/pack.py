@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8; mode: Python; indent-tabs-mode: nil; indent-width: 4; -*-
+#
+# OCO WORKING SET TOOLCHAIN
+# Copyright (C) 2017 Arqadium. All rights reserved.
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# version 2.0.  If a copy of the MPL was not distributed with this file, then
+# you can obtain one at <http://mozilla.org/MPL/2.0/>.
+#
+
+import assetcodec, json, mmap, os, shutil, struct
+
+# First bytes of every pack
+PACK_MAGIC = b'OCOPACK\0'
+# Bumped whenever the layout of packs changes
+PACK_VERSION = 1
+# Magic, version, reserved, and the offset and size of the index
+HEADER = struct.Struct('<8sIIQQ')
+# Entries at least this big start on a boundary they can be mapped from
+PAGE_SIZE = mmap.ALLOCATIONGRANULARITY
+# Smaller entries are only aligned to a cache line
+SMALL_ALIGN = 64
+# Space lost to replaced entries that is put up with before compacting
+COMPACT_SLACK = 1024 * 1024
+
+
+
+## ============================ F U N C T I O N ============================ #
+## integer alignEntry(integer, integer)
+##
+## TITLE:       Align Entry
+## DESCRIPTION: Works out where an entry of a given size may start, at or
+##              after a given offset.
+##
+## PARAMETER: The first free offset.
+## PARAMETER: The size of the entry.
+##
+## RETURNS: The offset to put the entry at.
+def alignEntry(offset, size):
+    align = PAGE_SIZE if size >= PAGE_SIZE else SMALL_ALIGN
+    return (offset + align - 1) // align * align
+
+
+
+## ============================ F U N C T I O N ============================ #
+## tuple readIndex(file)
+##
+## TITLE:       Read Index
+## DESCRIPTION: Reads and checks the header and index of a pack.
+##
+## PARAMETER: The pack, opened for binary reading.
+##
+## RETURNS: A tuple of the index, as a dict of entry names to lists of their
+##          offset, size and hash, and the codec they were compressed with
+##          if any, and the offset the index starts at.
+def readIndex(f):
+    f.seek(0)
+    header = f.read(HEADER.size)
+    if len(header) != HEADER.size:
+        raise ValueError('Pack is truncated')
+    magic, version, _, offset, size = HEADER.unpack(header)
+    if magic != PACK_MAGIC:
+        raise ValueError('Not a pack')
+    if version != PACK_VERSION:
+        raise ValueError('Pack version ' + str(version) + ' is unsupported')
+    f.seek(offset)
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError('Pack index is truncated')
+    return (json.loads(data.decode('utf-8'))['entries'], offset)
+
+
+
+## =============================== C L A S S =============================== #
+## PackWriter
+##
+## TITLE:       Pack Writer
+## DESCRIPTION: Creates or updates a pack: a single file holding many others,
+##              each found through an index of names to offset, size, hash and,
+##              for entries stored compressed, codec. Updates are made
+##              incrementally. New and changed entries are appended after
+##              everything already there, then a new index, and only then is
+##              the header pointed at it, so a reader never sees a pack that
+##              is half written. Once the space left behind by replaced
+##              entries outweighs the entries still in use, the pack is
+##              rewritten without it. A pack that can't be read is started
+##              afresh.
+class PackWriter:
+    def __init__(self, path):
+        self.path = path
+        self.changed = False
+        self.entries = {}
+        try:
+            self.file = open(path, 'r+b')
+        except FileNotFoundError:
+            self.file = None
+        if self.file != None:
+            try:
+                self.entries, _ = readIndex(self.file)
+                self.end = os.fstat(self.file.fileno()).st_size
+            except (ValueError, KeyError, UnicodeDecodeError):
+                self.file.close()
+                self.file = None
+        if self.file == None:
+            self.file = open(path, 'w+b')
+            self.end = HEADER.size
+            self.changed = True
+
+    def has(self, name, digest, codec=None):
+        entry = self.entries.get(name)
+        return (entry != None and entry[2] == digest
+            and entry[3:] == ([] if codec == None else [codec]))
+
+    def add(self, name, src, digest, codec=None):
+        # Append a file's contents under a name, replacing any entry there
+        size = os.path.getsize(src)
+        offset = alignEntry(self.end, size)
+        self.file.seek(offset)
+        with open(src, 'rb') as f:
+            shutil.copyfileobj(f, self.file, PAGE_SIZE * 256)
+        self.end = self.file.tell()
+        if self.end - offset != size:
+            raise OSError('\u2018' + src + '\u2019 changed while being ' +
+                'packed')
+        self.entries[name] = [offset, size, digest]
+        if codec != None:
+            self.entries[name] += [codec]
+        self.changed = True
+
+    def remove(self, name):
+        if name in self.entries:
+            del self.entries[name]
+            self.changed = True
+
+    def keep(self, names):
+        # Drop every entry whose name isn't given
+        names = set(names)
+        for name in list(self.entries):
+            if name not in names:
+                del self.entries[name]
+                self.changed = True
+
+    def close(self):
+        if self.changed:
+            live = sum([entry[1] for entry in self.entries.values()])
+            if self.end - HEADER.size - live > max(live, COMPACT_SLACK):
+                self.compact()
+            else:
+                self.writeIndex()
+        self.file.close()
+
+    def writeIndex(self):
+        index = json.dumps({'entries': self.entries}, sort_keys=True,
+            separators=(',', ':')).encode('utf-8')
+        offset = alignEntry(self.end, 0)
+        self.file.seek(offset)
+        self.file.write(index)
+        self.file.truncate()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.seek(0)
+        self.file.write(HEADER.pack(PACK_MAGIC, PACK_VERSION, 0, offset,
+            len(index)))
+        self.file.flush()
+        self.end = offset + len(index)
+        self.changed = False
+
+    def compact(self):
+        # Copy the entries still in use into a new pack, then swap it in
+        tmp = self.path + '.tmp'
+        out = open(tmp, 'w+b')
+        end = HEADER.size
+        entries = {}
+        for name in sorted(self.entries, key=lambda n: self.entries[n][0]):
+            offset, size = self.entries[name][:2]
+            newOffset = alignEntry(end, size)
+            self.file.seek(offset)
+            out.seek(newOffset)
+            left = size
+            while left > 0:
+                data = self.file.read(min(left, PAGE_SIZE * 256))
+                if not data:
+                    raise OSError('Pack \u2018' + self.path + '\u2019 is ' +
+                        'truncated')
+                out.write(data)
+                left -= len(data)
+            entries[name] = [newOffset, size] + self.entries[name][2:]
+            end = newOffset + size
+        self.file.close()
+        self.file = out
+        self.entries = entries
+        self.end = end
+        self.writeIndex()
+        os.replace(tmp, self.path)
+
+
+
+## =============================== C L A S S =============================== #
+## PackReader
+##
+## TITLE:       Pack Reader
+## DESCRIPTION: Maps a pack into memory and looks its entries up by name. The
+##              contents of an entry are handed back by get() as a memoryview
+##              of the mapping, so nothing is copied; such views must be
+##              released before the reader is closed. An entry stored
+##              compressed is handed back that way by get(), and decompressed
+##              by read(). Can be used in a with statement.
+class PackReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.entries, _ = readIndex(f)
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def names(self):
+        return sorted(self.entries)
+
+    def get(self, name):
+        entry = self.entries.get(name)
+        if entry == None:
+            raise KeyError(name)
+        return self.view[entry[0]:entry[0] + entry[1]]
+
+    def read(self, name):
+        view = self.get(name)
+        try:
+            codec = self.codec(name)
+            if codec == None:
+                return bytes(view)
+            return assetcodec.decompress(codec, view)
+        finally:
+            view.release()
+
+    def codec(self, name):
+        entry = self.entries.get(name)
+        if entry == None:
+            raise KeyError(name)
+        return entry[3] if len(entry) > 3 else None
+
+    def hash(self, name):
+        entry = self.entries.get(name)
+        if entry == None:
+            raise KeyError(name)
+        return entry[2]
+
+    def close(self):
+        self.view.release()
+        self.map.close()
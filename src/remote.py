@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8; mode: Python; indent-tabs-mode: nil; indent-width: 4; -*-
+#
+# OCO WORKING SET TOOLCHAIN
+# Copyright (C) 2017 Arqadium. All rights reserved.
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# version 2.0.  If a copy of the MPL was not distributed with this file, then
+# you can obtain one at <http://mozilla.org/MPL/2.0/>.
+#
+
+from jobs import captureCommand, runCommand
+import json, os, shutil, socket, socketserver, struct, tempfile, threading
+
+# Bumped whenever the wire protocol changes
+PROTOCOL_VERSION = 2
+# Where a worker listens if not told otherwise
+DEFAULT_PORT = 7373
+# How long to wait on a worker before giving up on it, in seconds
+CONNECT_TIMEOUT = 5.0
+COMPILE_TIMEOUT = 600.0
+# Compilers a worker will run; anything else in a request is refused
+COMPILERS = ['cc', 'c++', 'gcc', 'g++', 'clang', 'clang++']
+# Prefixes of the only flags a worker will pass on to its compiler
+SAFE_FLAGS = ['-D', '-U', '-I', '-O', '-f', '-m', '-std=', '-W', '-g']
+# Flags with those prefixes that are refused all the same, as they would
+# have a worker read, write, load or run files of the client's choosing
+UNSAFE_FLAGS = ['-Wl,', '-Wa,', '-Wp,', '-fplugin', '-fuse-ld', '-fprofile',
+    '-fauto-profile', '-fopt-info', '-fsanitize-blacklist',
+    '-fsanitize-ignorelist', '-fsanitize-coverage-allowlist',
+    '-fsanitize-coverage-ignorelist', '-fcallgraph-info', '-fmodule-mapper',
+    '-fdeps-']
+# The language of a preprocessed unit, by the language of its source
+PREPROCESSED_LANGS = {
+    'c':   'cpp-output',
+    'c++': 'c++-cpp-output'
+}
+# Flags only the preprocessor cares about, which take a separate value
+PREPROCESSOR_OPTS = ['-I', '-iquote', '-isystem', '-idirafter', '-include',
+    '-imacros', '-MF', '-MT', '-MQ']
+
+
+
+## ============================ F U N C T I O N ============================ #
+## (string, integer) parseAddress(string)
+##
+## TITLE:       Parse Address
+## DESCRIPTION: Splits a worker address of the form "host:port" or "host".
+##
+## PARAMETER: The address.
+##
+## RETURNS: The host and the port.
+def parseAddress(address):
+    host, sep, port = address.strip().rpartition(':')
+    if sep == '':
+        return (port, DEFAULT_PORT)
+    try:
+        return (host or '127.0.0.1', int(port))
+    except ValueError:
+        raise Exception('Worker address \u2018' + address + '\u2019 is ' +
+            'invalid')
+
+
+
+## ============================ F U N C T I O N ============================ #
+## void sendMessage(socket, dict<string, object>, bytes)
+##
+## TITLE:       Send Message
+## DESCRIPTION: Sends one message: a JSON header, preceded by its length, and
+##              then a payload whose size the header gives.
+##
+## PARAMETER: The connected socket.
+## PARAMETER: The header.
+## PARAMETER: The payload, if any.
+def sendMessage(sock, header, payload=b''):
+    header = json.dumps({**header, 'size': len(payload)}).encode()
+    sock.sendall(struct.pack('>I', len(header)) + header + payload)
+
+
+
+## ============================ F U N C T I O N ============================ #
+## bytes recvExactly(socket, integer)
+##
+## TITLE:       Receive Exactly
+## DESCRIPTION: Reads a given number of bytes from a socket, however many reads
+##              that takes.
+##
+## PARAMETER: The connected socket.
+## PARAMETER: How many bytes to read.
+##
+## RETURNS: The bytes read.
+def recvExactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1048576))
+        if not chunk:
+            raise ConnectionError('Connection closed mid-message')
+        chunks += [chunk]
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+
+## ============================ F U N C T I O N ============================ #
+## (dict<string, object>, bytes) recvMessage(socket)
+##
+## TITLE:       Receive Message
+## DESCRIPTION: Receives one message, as sent by sendMessage().
+##
+## PARAMETER: The connected socket.
+##
+## RETURNS: The header and the payload.
+def recvMessage(sock):
+    size = struct.unpack('>I', recvExactly(sock, 4))[0]
+    header = json.loads(recvExactly(sock, size).decode())
+    return (header, recvExactly(sock, header.get('size', 0)))
+
+
+
+## ============================ F U N C T I O N ============================ #
+## boolean isSafeFlag(string)
+##
+## TITLE:       Safe Flag
+## DESCRIPTION: Tells whether a worker may pass a flag on to its compiler: one
+##              that only changes how a unit is compiled, such as a define,
+##              an optimisation or a warning. Response files (@file) and
+##              anything naming a path are refused, as the compiler would
+##              read or write that path on the worker's behalf.
+##
+## PARAMETER: The flag.
+##
+## RETURNS: Whether the flag is allowed.
+def isSafeFlag(flag):
+    if (not isinstance(flag, str) or flag.startswith('@') or '/' in flag
+    or '\\' in flag):
+        return False
+    for prefix in UNSAFE_FLAGS:
+        if flag.startswith(prefix):
+            return False
+    for prefix in SAFE_FLAGS:
+        if flag.startswith(prefix):
+            return True
+    return False
+
+
+
+## ============================ F U N C T I O N ============================ #
+## string[] getRemoteFlags(string[], string, string, string)
+##
+## TITLE:       Remote Flags
+## DESCRIPTION: Strips a compile command down to what a worker needs to compile
+##              the already preprocessed unit: no compiler, source, output,
+##              language, dependency file or preprocessor options, and none of
+##              the flags the worker adds itself.
+##
+## PARAMETER: The full compile command.
+## PARAMETER: The source it compiles.
+## PARAMETER: The object it writes.
+## PARAMETER: The dependency file it writes.
+##
+## RETURNS: The remaining flags.
+def getRemoteFlags(com, source, obj, depFile):
+    ret = []
+    skip = False
+    for arg in com[1:]:
+        if skip:
+            skip = False
+        elif arg in PREPROCESSOR_OPTS or arg in ['-o', '-x']:
+            skip = True
+        elif arg in [source, obj, depFile, '-MMD', '-MD', '-MP',
+        '-Winvalid-pch', '-c', '-pipe']:
+            pass
+        elif arg.startswith('-I') or arg.startswith('-D') \
+        or arg.startswith('-U'):
+            pass
+        else:
+            ret += [arg]
+    return ret
+
+
+
+## ============================ F U N C T I O N ============================ #
+## string[] getPreprocessCommand(string[], string)
+##
+## TITLE:       Preprocess Command
+## DESCRIPTION: Turns a compile command into one that preprocesses the unit to
+##              standard output instead, still writing its dependency file.
+##
+## PARAMETER: The full compile command.
+## PARAMETER: The object it writes.
+##
+## RETURNS: The preprocessing command.
+def getPreprocessCommand(com, obj):
+    ret = []
+    skip = False
+    for arg in com:
+        if skip:
+            skip = False
+        elif arg == '-o':
+            skip = True
+        else:
+            ret += [arg]
+    # Name the target as the compile would have
+    return ret + ['-MT', obj, '-E']
+
+
+
+## =============================== C L A S S =============================== #
+## WorkerHandler
+##
+## TITLE:       Worker Request Handler
+## DESCRIPTION: Serves one client connection to a worker. Each request on it
+##              either asks what the worker has to offer, or hands it a
+##              preprocessed unit to compile into an object, which is sent
+##              back along with the compiler's output.
+class WorkerHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                header, payload = recvMessage(self.request)
+            except (ConnectionError, OSError, ValueError, struct.error):
+                return
+            if header.get('type') == 'hello':
+                sendMessage(self.request, {
+                    'version': PROTOCOL_VERSION,
+                    'cores': self.server.cores
+                })
+            elif header.get('type') == 'compile':
+                with self.server.slots:
+                    reply, obj = self.server.compile(header, payload)
+                sendMessage(self.request, reply, obj)
+            else:
+                return
+
+
+
+## =============================== C L A S S =============================== #
+## WorkerServer
+##
+## TITLE:       Worker Server
+## DESCRIPTION: A compile worker: listens on a TCP port and compiles what it is
+##              sent, running as many compilers at once as it has cores to
+##              offer. It only runs well-known compilers from its own PATH,
+##              only passes on flags isSafeFlag() allows, and always compiles
+##              to an object of its own choosing rather than linking, but it
+##              is no sandbox; only listen where the clients are trusted.
+class WorkerServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, cores):
+        socketserver.ThreadingTCPServer.__init__(self, address,
+            WorkerHandler)
+        self.cores = cores
+        self.slots = threading.Semaphore(cores)
+
+    def compile(self, header, payload):
+        compiler = header.get('compiler')
+        lang = PREPROCESSED_LANGS.get(header.get('lang'))
+        flags = header.get('flags')
+        if (compiler not in COMPILERS or lang == None
+        or not isinstance(flags, list)):
+            return ({'error': 'Malformed compile request'}, b'')
+        for flag in flags:
+            if not isSafeFlag(flag):
+                return ({'error': 'Refused flag \u2018' + str(flag) +
+                    '\u2019'}, b'')
+        tmpDir = tempfile.mkdtemp(prefix='oco-worker-')
+        try:
+            source = os.path.join(tmpDir, 'unit.i')
+            obj = os.path.join(tmpDir, 'unit.o')
+            f = open(source, 'wb')
+            f.write(payload)
+            f.close()
+            status, output = runCommand([compiler] + flags + ['-c', '-x',
+                lang, source, '-o', obj])
+            data = b''
+            if status == 0:
+                f = open(obj, 'rb')
+                data = f.read()
+                f.close()
+            return ({'status': status, 'output': output}, data)
+        except OSError as ex:
+            return ({'error': '{0}'.format(ex)}, b'')
+        finally:
+            shutil.rmtree(tmpDir, ignore_errors=True)
+
+
+
+## =============================== C L A S S =============================== #
+## Worker
+##
+## TITLE:       Remote Worker
+## DESCRIPTION: The coordinator's side of one worker: where it is, how many
+##              units it may be sent at once, and a few spare connections to
+##              it. A worker that fails in any way is dropped for the rest of
+##              the build.
+class Worker:
+    def __init__(self, address):
+        self.address = address
+        self.cores = 0
+        self.busy = 0
+        self.alive = False
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def connect(self):
+        sock = socket.create_connection(self.address, CONNECT_TIMEOUT)
+        sock.settimeout(COMPILE_TIMEOUT)
+        return sock
+
+    def hello(self):
+        try:
+            sock = self.connect()
+            sendMessage(sock, {'type': 'hello'})
+            header, _ = recvMessage(sock)
+        except (ConnectionError, OSError, ValueError, struct.error):
+            return False
+        if header.get('version') != PROTOCOL_VERSION:
+            sock.close()
+            return False
+        self.cores = max(1, int(header.get('cores', 1)))
+        self.alive = True
+        with self.lock:
+            self.idle += [sock]
+        return True
+
+    def compile(self, header, payload):
+        sock = None
+        with self.lock:
+            if len(self.idle) > 0:
+                sock = self.idle.pop()
+        if sock == None:
+            sock = self.connect()
+        try:
+            sendMessage(sock, header, payload)
+            ret = recvMessage(sock)
+        except:
+            sock.close()
+            raise
+        with self.lock:
+            self.idle += [sock]
+        return ret
+
+    def close(self):
+        with self.lock:
+            for sock in self.idle:
+                sock.close()
+            self.idle = []
+
+
+
+## =============================== C L A S S =============================== #
+## RemoteWorkers
+##
+## TITLE:       Remote Workers
+## DESCRIPTION: Hands C and C++ units out to a set of workers, in proportion to
+##              the cores each one offers, while keeping to the local job
+##              limit for whatever runs here. Units are preprocessed locally,
+##              so workers needn't have our headers, and so the dependency
+##              files incremental builds rely on are still written. Anything
+##              that goes wrong with a worker is put right by compiling the
+##              unit locally instead.
+class RemoteWorkers:
+    def __init__(self, addresses, localJobs):
+        self.workers = []
+        for address in addresses:
+            worker = Worker(parseAddress(address))
+            if worker.hello():
+                self.workers += [worker]
+        self.cores = sum([worker.cores for worker in self.workers])
+        self.localJobs = localJobs
+        self.localBusy = 0
+        self.remoteUnits = 0
+        self.localUnits = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        # Prefer the worker with the most room, then a local slot
+        with self.cond:
+            while True:
+                best = None
+                for worker in self.workers:
+                    if worker.alive and worker.busy < worker.cores and (
+                    best == None or worker.cores - worker.busy >
+                    best.cores - best.busy):
+                        best = worker
+                if best != None:
+                    best.busy += 1
+                    return best
+                if self.localBusy < self.localJobs:
+                    self.localBusy += 1
+                    return None
+                self.cond.wait()
+
+    def release(self, worker):
+        with self.cond:
+            if worker == None:
+                self.localBusy -= 1
+                self.localUnits += 1
+            else:
+                worker.busy -= 1
+            self.cond.notify_all()
+
+    def drop(self, worker):
+        with self.cond:
+            worker.alive = False
+            self.cond.notify_all()
+
+    def run(self, com, action, source, obj, depFile):
+        # Once every worker has failed, this ends up running locally, as
+        # does a unit with flags no worker would accept
+        flags = getRemoteFlags(com, source, obj, depFile)
+        if not all([isSafeFlag(flag) for flag in flags]):
+            with self.cond:
+                self.localUnits += 1
+            return runCommand(com)
+        while True:
+            worker = self.acquire()
+            try:
+                if worker == None:
+                    return runCommand(com)
+                ret = self.runRemote(worker, com, action, obj, flags)
+                if ret != None:
+                    return ret
+            finally:
+                self.release(worker)
+
+    def runRemote(self, worker, com, action, obj, flags):
+        # Returns None if the worker failed, having dropped it
+        status, text = captureCommand(getPreprocessCommand(com, obj))
+        if status != 0:
+            # Let the local compiler report the problem
+            return runCommand(com)
+        header = {
+            'type': 'compile',
+            'compiler': os.path.basename(com[0]),
+            'lang': action,
+            'flags': flags
+        }
+        try:
+            reply, data = worker.compile(header, text)
+        except (ConnectionError, OSError, ValueError, struct.error):
+            self.drop(worker)
+            return None
+        if 'error' in reply:
+            self.drop(worker)
+            return None
+        if reply['status'] == 0:
+            tmp = obj + '.tmp'
+            f = open(tmp, 'wb')
+            f.write(data)
+            f.close()
+            os.replace(tmp, obj)
+        with self.cond:
+            self.remoteUnits += 1
+        return (reply['status'], reply['output'])
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+
+
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8; mode: Python; indent-tabs-mode: nil; indent-width: 4; -*-
+#
+# OCO WORKING SET TOOLCHAIN
+# Copyright (C) 2017 Arqadium. All rights reserved.
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# version 2.0.  If a copy of the MPL was not distributed with this file, then
+# you can obtain one at <http://mozilla.org/MPL/2.0/>.
+#
+
+import json, os, struct, sys, time
+
+# Name of the per-project file holding the index
+INDEX_FILE = '.index'
+# Bumped whenever the layout of the index file changes
+INDEX_VERSION = 1
+# Directory timestamps this close to the present can't be trusted yet, as
+# more changes could land within the same tick of the filesystem clock
+RACY_NS = 2 * 1000 * 1000 * 1000
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+    IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF |
+    IN_ONLYDIR)
+
+
+
+## =============================== C L A S S =============================== #
+## Inotify
+##
+## TITLE:       Inotify Watcher
+## DESCRIPTION: A thin wrapper around the Linux inotify API, reached through
+##              ctypes so nothing outside the standard library is needed. It
+##              reports which watched directories have seen any change.
+##              Construction raises OSError where inotify isn't available.
+class Inotify:
+    def __init__(self):
+        import ctypes, ctypes.util
+        if not sys.platform.startswith('linux'):
+            raise OSError('inotify is only available on Linux')
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'),
+            use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.paths = {}
+        self.wds = {}
+        self.overflowed = False
+
+    def watch(self, path):
+        if path in self.wds:
+            return
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path),
+            WATCH_MASK)
+        if wd >= 0:
+            self.paths[wd] = path
+            self.wds[path] = wd
+
+    def watching(self, path):
+        return path in self.wds
+
+    def changes(self):
+        # Drain every pending event, and list the directories they touched
+        ret = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            i = 0
+            while i + 16 <= len(data):
+                wd, mask, cookie, length = struct.unpack_from('iIII', data, i)
+                i += 16 + length
+                if mask & IN_Q_OVERFLOW:
+                    # Events were lost, so nothing can be trusted
+                    self.overflowed = True
+                    continue
+                path = self.paths.get(wd)
+                if path == None:
+                    continue
+                ret.add(path)
+                if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                    del self.paths[wd]
+                    del self.wds[path]
+        return ret
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        os.close(self.fd)
+
+
+
+## =============================== C L A S S =============================== #
+## SourceIndex
+##
+## TITLE:       Source Tree Index
+## DESCRIPTION: Remembers every source and header in a project's tree along
+##              with its size, modification time and inode, and keeps that on
+##              disk between runs. Adding, removing or renaming a file always
+##              changes the modification time of its directory, so a run only
+##              has to look at directories: the listing of any directory whose
+##              time hasn't changed is taken from the index as it is. Edits
+##              made in place are left to the compile and lint stages to find,
+##              as those look at the files they care about anyway; that is
+##              unless an inotify watcher is attached, in which case the index
+##              hears about every change and needn't look at anything at all.
+class SourceIndex:
+    def __init__(self, root, path, classify):
+        self.root = root
+        self.path = path
+        self.classify = classify
+        self.watcher = None
+        self.dirty = set()
+        self.changed = False
+        try:
+            f = open(path, 'r')
+            data = json.load(f)
+            f.close()
+        except (OSError, TypeError, ValueError):
+            # Missing, unreadable, or deliberately kept in memory only
+            data = {}
+        if (data.get('version') != INDEX_VERSION
+        or data.get('root') != root):
+            data = {'dirs': {}, 'linted': {}}
+            self.changed = True
+        self.dirs = data['dirs']
+        self.linted = data['linted']
+
+    def attach(self, watcher):
+        # Let an inotify watcher tell us what changed from now on; anything
+        # before then is only caught by listing everything once more
+        self.watcher = watcher
+        self.dirty = set(self.dirs)
+        for path in self.dirs:
+            watcher.watch(path)
+
+    def detach(self):
+        if self.watcher != None:
+            self.watcher.close()
+            self.watcher = None
+
+    def live(self):
+        return self.watcher != None and not self.watcher.overflowed
+
+    def listDir(self, path, mtime):
+        entry = {'mtime': mtime, 'dirs': [], 'files': {}}
+        if mtime != None and time.time_ns() - mtime < RACY_NS:
+            # Too recent; check it again next time
+            entry['mtime'] = None
+        try:
+            entries = os.scandir(path)
+        except OSError:
+            return entry
+        with entries:
+            for item in entries:
+                if item.name.startswith('.'):
+                    continue
+                if item.is_dir():
+                    entry['dirs'] += [item.name]
+                    continue
+                kind = self.classify(item.name)
+                if kind == None or not item.is_file():
+                    continue
+                st = item.stat()
+                entry['files'][item.name] = [kind, st.st_size,
+                    st.st_mtime_ns, st.st_ino]
+        entry['dirs'].sort()
+        return entry
+
+    def scan(self):
+        # Bring the index up to date, and sort its files by language
+        if self.watcher != None:
+            self.dirty |= self.watcher.changes()
+            if self.watcher.overflowed:
+                self.dirty = set(self.dirs)
+                self.watcher.overflowed = False
+        dirs = {}
+        stack = [self.root]
+        while len(stack) > 0:
+            path = stack.pop()
+            entry = self.dirs.get(path)
+            if (entry == None or self.watcher == None or path in self.dirty
+            or not self.watcher.watching(path)):
+                try:
+                    mtime = os.stat(path).st_mtime_ns
+                except OSError:
+                    continue
+                if (entry == None or entry['mtime'] != mtime
+                or path in self.dirty):
+                    entry = self.listDir(path, mtime)
+                    self.changed = True
+                if self.watcher != None:
+                    self.watcher.watch(path)
+            dirs[path] = entry
+            for name in entry['dirs']:
+                stack += [os.path.join(path, name)]
+        if len(dirs) != len(self.dirs):
+            self.changed = True
+        self.dirs = dirs
+        self.dirty = set()
+        ret = {'c': [], 'h': [], 'c++': [], 'h++': [], 'd': [], 'di': []}
+        for path, entry in dirs.items():
+            for name, info in entry['files'].items():
+                ret[info[0]] += [os.path.join(path, name)]
+        for files in ret.values():
+            files.sort()
+        return ret
+
+    def mtimes(self):
+        # Modification time of every indexed file, as last seen
+        ret = {}
+        for path, entry in self.dirs.items():
+            for name, info in entry['files'].items():
+                ret[os.path.join(path, name)] = info[2]
+        return ret
+
+    def isLinted(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        return self.linted.get(path) == [st.st_size, st.st_mtime_ns,
+            st.st_ino]
+
+    def markLinted(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        self.linted[path] = [st.st_size, st.st_mtime_ns, st.st_ino]
+        self.changed = True
+
+    def save(self):
+        if not self.changed or self.path == None:
+            return
+        data = {
+            'version': INDEX_VERSION,
+            'root': self.root,
+            'dirs': self.dirs,
+            'linted': self.linted
+        }
+        tmp = self.path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            f = open(tmp, 'w')
+            json.dump(data, f, separators=(',', ':'))
+            f.close()
+            os.replace(tmp, self.path)
+            self.changed = False
+        except OSError:
+            # The index is only an optimisation
+            pass
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8; mode: Python; indent-tabs-mode: nil; indent-width: 4; -*-
+#
+# OCO WORKING SET TOOLCHAIN
+# Copyright (C) 2017 Arqadium. All rights reserved.
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# version 2.0.  If a copy of the MPL was not distributed with this file, then
+# you can obtain one at <http://mozilla.org/MPL/2.0/>.
+#
+
+from common import getUserCacheDir
+from subprocess import run, PIPE
+import json, os, threading
+
+D_INSTALL_DIRS = [
+    'C:\\Program Files\\DMD\\dmd2',
+    'C:\\Program Files (x86)\\DMD\\dmd2',
+    'C:\\DMD\\dmd2'
+]
+# Bumped whenever the layout of the probe cache changes
+PROBE_VERSION = 1
+
+
+
+def getMSVCPath():
+    if os.name != 'nt':
+        return ''
+    ret = os.path.join(os.getenv('PROGRAMFILES(X86)',
+        os.environ['PROGRAMFILES']), 'Microsoft Visual Studio', '2017')
+    for version in ['Enterprise', 'Professional', 'Community']:
+        tmp = os.path.join(ret, version)
+        if os.path.exists(tmp):
+            ret = tmp
+            break
+    ret = os.path.join(ret, 'VC\\Tools\\MSVC')
+    if os.path.isdir(ret):
+        ret = os.path.join(ret, os.listdir(ret)[0])
+    return ret
+
+def getDPath():
+    if os.name == 'nt':
+        for dir in D_INSTALL_DIRS:
+            if os.path.isdir(dir):
+                return dir
+        # No common installation directories exist
+        return None
+    # else: not Windows
+    return '/usr/bin'
+
+def getGCCVersion():
+    if os.name == 'nt':
+        return '0.0.0'
+    compl = run(['gcc', '-dumpversion'], check=True, stdout=PIPE)
+    return compl.stdout.decode().replace('\n', '')
+
+def is_exe(fpath):
+    return os.path.isfile(fpath) and os.access(fpath, os.X_OK)
+
+def which(program):
+    fpath, fname = os.path.split(program)
+    if fpath:
+        if is_exe(program):
+            return program
+    else:
+        for path in os.environ["PATH"].split(os.pathsep):
+            path = path.strip('"')
+            exe_file = os.path.join(path, program)
+            if is_exe(exe_file):
+                return exe_file
+    return None
+
+def getProbeCachePath():
+    return getUserCacheDir('toolchain.json')
+
+
+
+## =============================== C L A S S =============================== #
+## Toolchain
+##
+## TITLE:       Toolchain Description
+## DESCRIPTION: Finds out about the tools installed on this machine, but only
+##              once something actually asks. Each answer is remembered for
+##              the life of the object, and kept in a small on-disk cache so
+##              later runs needn't spawn any processes at all. The cache is
+##              thrown out when PATH or any directory on it changes, and an
+##              answer that came from running a program is thrown out when
+##              that program's binary is replaced. A read-only toolchain still
+##              reads the cache but never writes it.
+class Toolchain:
+    def __init__(self, cachePath=None):
+        self.cachePath = cachePath if cachePath != None else \
+            getProbeCachePath()
+        self.probes = None
+        self.readOnly = False
+        self.lock = threading.RLock()
+
+    def load(self):
+        # Installing or removing a program touches its directory, so this
+        # also catches tools appearing on an unchanged PATH
+        path = [os.environ.get('PATH', '')]
+        for dir in path[0].split(os.pathsep):
+            try:
+                path += [os.stat(dir.strip('"')).st_mtime_ns]
+            except OSError:
+                path += [None]
+        try:
+            f = open(self.cachePath, 'r')
+            data = json.load(f)
+            f.close()
+        except (OSError, ValueError):
+            data = {}
+        if (data.get('version') != PROBE_VERSION
+        or data.get('path') != path):
+            data = {'version': PROBE_VERSION, 'path': path, 'probes': {}}
+        self.probes = data
+
+    def save(self):
+        if self.readOnly:
+            return
+        tmp = self.cachePath + '.' + str(os.getpid())
+        try:
+            os.makedirs(os.path.dirname(self.cachePath), exist_ok=True)
+            f = open(tmp, 'w')
+            json.dump(self.probes, f, indent=0, sort_keys=True)
+            f.close()
+            os.replace(tmp, self.cachePath)
+        except OSError:
+            # The cache is only an optimisation
+            pass
+
+    def stamp(self, binary):
+        if binary == None:
+            return None
+        path = self.which(binary)
+        if path == None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return [path, st.st_size, st.st_mtime_ns]
+
+    def probe(self, name, func, binary=None, check=None):
+        with self.lock:
+            if self.probes == None:
+                self.load()
+            entries = self.probes['probes']
+            stamp = self.stamp(binary)
+            if name in entries:
+                entry = entries[name]
+                if entry['stamp'] == stamp and (check == None
+                or check(entry['value'])):
+                    return entry['value']
+            value = func()
+            entries[name] = {'stamp': stamp, 'value': value}
+            self.save()
+            return value
+
+    def which(self, program):
+        # Answers hold for as long as PATH does, if they still exist
+        return self.probe('which:' + program, lambda: which(program),
+            check=lambda path: path == None or is_exe(path))
+
+    @property
+    def gccVersion(self):
+        return self.probe('gcc-version', getGCCVersion, binary='gcc')
+
+    @property
+    def msvcPath(self):
+        return self.probe('msvc-path', getMSVCPath,
+            check=lambda path: path == '' or os.path.isdir(path))
+
+    @property
+    def dPath(self):
+        return self.probe('d-path', getDPath,
+            check=lambda path: path == None or os.path.isdir(path))
@@ -149,13 +149,15 @@ def main(args):
 ## =========================== B O O T S T R A P =========================== #
 ## Application bootstrapper, guarding against code execution upon import.
 if __name__ == '__main__':
-    try:
-        from sys import argv, exit
-        exit(main(argv))
-    except Exception as ex:
-        raise ex
-        return -2
-    except:
-        print('Rogue exception:', sys.exc_info()[0])
-        return -1
-    return 0
+    from sys import argv, exit
+    def _boot():
+        try:
+            return main(argv)
+        except Exception as ex:
+            raise ex
+            return -2
+        except:
+            from sys import exc_info
+            print('Rogue exception:', exc_info()[0])
+            return -1
+    exit(_boot())